@@ -0,0 +1,290 @@
+"""CPI 计算基准测试
+
+使用合成的分类、商品和按 change_date 记录的稀疏价格变动数据，通过数据源离线驱动 CPICalculator，
+每种计算方式（稠密、定基、稀疏、流水线、数据质量检查、缓存、多公式、分类指数存储）各运行一次，
+记录计算器自身的阶段指标（calculator.last_metrics：加载、构建矩阵、汇总、写出等），
+结果保存为 JSON，便于不同版本之间对比。
+
+稠密 float64 价格矩阵超过 --max-dense-mib 时自动设置 memory_budget（矩阵以 float32 存储，
+超出预算时存放在 --spill-dir 下的内存映射文件中），100 万商品 × 3000 天这样的规模也能运行。
+
+用法：
+    python benchmarks/bench_cpi.py --products 10000 100000 --days 30 365 --label v0.1
+    python benchmarks/bench_cpi.py --products 1000000 --days 3000 --modes sparse prefetch --spill-dir /data/tmp
+    python benchmarks/bench_cpi.py --source local --modes dense cache index_store
+    python benchmarks/bench_cpi.py --compare benchmarks/results/v0.1.json benchmarks/results/v0.2.json
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SRC = Path(__file__).resolve().parent.parent / 'src' / 'cpi_calculator'
+sys.path.insert(0, str(SRC))
+
+from quality import QualityRules  # noqa: E402
+from sinks import CsvSink  # noqa: E402
+from sources import LocalSource, MemorySource  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+START_DATE = date(2025, 5, 17)
+
+
+def load_calculator(file_name):
+    """按文件路径加载计算器模块（文件名含括号，不能直接 import）"""
+    spec = importlib.util.spec_from_file_location(Path(file_name).stem, SRC / file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.CPICalculator
+
+
+CHAINED = load_calculator('calculator(change_date).py')
+FIXED = load_calculator('calculator(fix_date).py')
+
+# 计算方式：(计算器, 方法, 构造参数, 是否使用价格矩阵, 是否先运行一次预热)
+# 预热的计算方式（缓存、分类指数存储）记录第二次运行，即命中时的耗时
+MODES = {
+    'dense': (CHAINED, 'compute_daily_cpi', {}, True, False),
+    'fixed': (FIXED, 'compute_daily_cpi', {}, True, False),
+    'sparse': (CHAINED, 'compute_daily_cpi', {'sparse': True}, False, False),
+    'prefetch': (CHAINED, 'compute_daily_cpi', {'prefetch': 1}, True, False),
+    'quality': (CHAINED, 'compute_daily_cpi', {'quality': QualityRules(max_jump=5, min_products=3)}, True, False),
+    'cache': (CHAINED, 'compute_daily_cpi', {'cache_dir': 'cache'}, True, True),
+    'indices': (CHAINED, 'compute_indices', {}, True, False),
+    'index_store': (CHAINED, 'compute_daily_cpi', {'index_store': 'index_store'}, True, True),
+}
+DEFAULT_MODES = ['dense', 'fixed', 'sparse', 'prefetch']
+
+
+def synthetic_categories(n_top=8, n_mid=5, n_leaf=6):
+    """生成三级分类树，每一层的权重之和为 1"""
+    rows = []
+    for i in range(1, n_top + 1):
+        top_id = i * 10000
+        rows.append((top_id, -1, 1 / n_top, 1))
+        for j in range(1, n_mid + 1):
+            mid_id = top_id + j * 100
+            rows.append((mid_id, top_id, 1 / (n_top * n_mid), 2))
+            for k in range(1, n_leaf + 1):
+                rows.append((mid_id + k, mid_id, 1 / (n_top * n_mid * n_leaf), 3))
+    return pd.DataFrame(rows, columns=['category_id', 'parent', 'weight', 'is_leaf'])
+
+
+def synthetic_panel(n_products, n_days, change_rate=0.05, seed=0):
+    """生成合成数据，返回 (categories, products, (product_ids, prices, dates))
+
+    每个商品在随机的首日给出价格，之后每天以 change_rate 的概率发生一次价格变动，
+    价格变动为对数正态跳跃，价格保留两位小数。
+    """
+    rng = np.random.default_rng(seed)
+    categories = synthetic_categories()
+    leaf_ids = categories.loc[categories['is_leaf'] == 3, 'category_id'].to_numpy()
+    products = pd.DataFrame({
+        'product_id': np.arange(n_products, dtype=np.int64),
+        'category_id': rng.choice(leaf_ids, n_products),
+    })
+
+    first_day = rng.integers(0, max(n_days // 3, 1), n_products)
+    n_changes = rng.binomial(n_days - first_day - 1, change_rate)
+    owner = np.repeat(np.arange(n_products), n_changes)
+    change_day = first_day[owner] + 1 + (rng.random(len(owner)) * (n_days - first_day[owner] - 1)).astype(np.int64)
+
+    product_ids = np.concatenate([np.arange(n_products), owner])
+    days = np.concatenate([first_day, change_day])
+    order = np.lexsort((days, product_ids))
+    product_ids, days = product_ids[order], days[order]
+
+    # 首条记录为初始价格，之后逐条累加对数跳跃
+    is_first = np.r_[True, product_ids[1:] != product_ids[:-1]]
+    log_steps = np.where(is_first, np.log(rng.uniform(5, 500, len(days))), rng.normal(0, 0.05, len(days)))
+    log_prices = np.cumsum(log_steps)
+    group_start = np.maximum.accumulate(np.where(is_first, np.arange(len(days)), 0))
+    offset = np.where(group_start > 0, log_prices[group_start - 1], 0.0)
+    prices = np.round(np.exp(log_prices - offset), 2).astype(np.float32)
+
+    dates = np.datetime64(START_DATE, 'D') + days
+    return categories, products, (product_ids, prices, dates)
+
+
+def write_local(root, categories, products, arrays):
+    """按 LocalSource 的目录结构写出合成数据，价格按月分区为 Parquet"""
+    root = Path(root)
+    (root / 'price').mkdir(parents=True, exist_ok=True)
+    categories.rename(columns={'is_leaf': 'hierarchy'}).to_parquet(root / 'categories.parquet', index=False)
+    products.to_parquet(root / 'products.parquet', index=False)
+    product_ids, prices, dates = arrays
+    months = dates.astype('datetime64[M]')
+    for month in np.unique(months):
+        mask = months == month
+        pd.DataFrame({
+            'product_id': product_ids[mask], 'price': prices[mask], 'date': dates[mask],
+        }).to_parquet(root / 'price' / f'{month}.parquet', index=False)
+    return LocalSource(root)
+
+
+def memory_budget_for(n_products, n_days, args):
+    """显式指定 --memory-budget-mib 时使用该值，否则稠密 float64 矩阵超过 --max-dense-mib 时以其为预算"""
+    if args.memory_budget_mib is not None:
+        return args.memory_budget_mib * 2 ** 20
+    if n_products * n_days * 8 > args.max_dense_mib * 2 ** 20:
+        return args.max_dense_mib * 2 ** 20
+    return None
+
+
+def run_mode(mode, source, workdir, start_date, end_date, memory_budget, spill_dir, trace_memory):
+    """运行一种计算方式，返回计算器记录的指标（calculator.last_metrics）"""
+    calculator_class, method, options, uses_matrix, warm_up = MODES[mode]
+    workdir = Path(workdir) / mode
+    options = {
+        key: workdir / value if key in ('cache_dir', 'index_store') else value for key, value in options.items()
+    }
+    if uses_matrix and memory_budget is not None:
+        options.update(memory_budget=memory_budget, spill_dir=spill_dir)
+
+    def run():
+        calculator = calculator_class(source=source, sink=CsvSink(workdir), trace_memory=trace_memory, **options)
+        getattr(calculator, method)(start_date, end_date)
+        return calculator.last_metrics.as_dict()
+
+    if warm_up:
+        run()
+    return run()
+
+
+def run_case(n_products, n_days, change_rate, seed, modes, args):
+    """对一组规模依次运行各计算方式，返回各计算方式的阶段指标"""
+    started = time.perf_counter()
+    categories, products, arrays = synthetic_panel(n_products, n_days, change_rate, seed)
+    generate_seconds = time.perf_counter() - started
+    price_rows = len(arrays[0])
+    start_date, end_date = START_DATE, START_DATE + timedelta(days=n_days - 1)
+    memory_budget = memory_budget_for(n_products, n_days, args)
+
+    with tempfile.TemporaryDirectory(dir=args.spill_dir) as workdir:
+        if args.source == 'local':
+            source = write_local(Path(workdir) / 'data', categories, products, arrays)
+        else:
+            source = MemorySource(categories, products, arrays)
+        del arrays
+        results = {
+            mode: run_mode(
+                mode, source, workdir, start_date, end_date, memory_budget,
+                args.spill_dir or workdir, args.trace_memory
+            )
+            for mode in modes
+        }
+
+    return {
+        'products': n_products,
+        'days': n_days,
+        'change_rate': change_rate,
+        'source': args.source,
+        'memory_budget': memory_budget,
+        'price_rows': int(price_rows),
+        'generate_seconds': generate_seconds,
+        'modes': results,
+    }
+
+
+def environment():
+    """记录运行环境，便于解释不同结果之间的差异"""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+
+def compare(baseline_path, candidate_path):
+    """对比两次基准测试结果，打印各计算方式各阶段墙钟时间的变化倍数"""
+    baseline = json.loads(Path(baseline_path).read_text(encoding='utf-8'))
+    candidate = json.loads(Path(candidate_path).read_text(encoding='utf-8'))
+    baseline_cases = {(case['products'], case['days']): case for case in baseline['cases']}
+
+    for case in candidate['cases']:
+        key = (case['products'], case['days'])
+        if key not in baseline_cases:
+            continue
+        print(f"商品数 {key[0]}，天数 {key[1]}：")
+        for mode, metrics in case['modes'].items():
+            before_mode = baseline_cases[key]['modes'].get(mode)
+            if before_mode is None:
+                continue
+            print(f"  {mode}")
+            for stage, stats in metrics['stages'].items():
+                before = before_mode['stages'].get(stage)
+                if before is None:
+                    continue
+                seconds, before_seconds = stats['wall_seconds'], before['wall_seconds']
+                ratio = seconds / before_seconds if before_seconds else float('nan')
+                print(f"    {stage:<26} {before_seconds:>9.4f}s -> {seconds:>9.4f}s  x{ratio:.2f}")
+
+
+def print_case(case):
+    budget = case['memory_budget']
+    print(
+        f"商品数 {case['products']}，天数 {case['days']}，价格记录 {case['price_rows']}，数据源 {case['source']}，"
+        f"内存预算 {'无' if budget is None else f'{budget / 2 ** 20:.0f} MiB'}"
+    )
+    for mode, metrics in case['modes'].items():
+        print(f"  {mode:<12} 总耗时 {metrics['wall_seconds']:>9.3f}s")
+        for stage, stats in metrics['stages'].items():
+            peak = stats.get('peak_bytes')
+            peak = '' if peak is None else f"  峰值内存 {peak / 2 ** 20:>9.1f} MiB"
+            print(f"    {stage:<26} {stats['wall_seconds']:>9.4f}s{peak}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPI 计算基准测试')
+    parser.add_argument('--products', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365])
+    parser.add_argument('--change-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=DEFAULT_MODES)
+    parser.add_argument('--source', choices=['memory', 'local'], default='memory',
+                        help='memory：MemorySource；local：写出为 Parquet 分区后由 LocalSource 读取')
+    parser.add_argument('--memory-budget-mib', type=int, help='价格矩阵的内存预算，默认按 --max-dense-mib 自动设置')
+    parser.add_argument('--max-dense-mib', type=int, default=2048,
+                        help='稠密 float64 矩阵超过该大小时自动启用内存预算')
+    parser.add_argument('--spill-dir', help='内存映射文件及临时数据所在目录，默认为系统临时目录')
+    parser.add_argument('--trace-memory', action=argparse.BooleanOptionalAction, default=True,
+                        help='用 tracemalloc 记录各阶段的内存峰值')
+    parser.add_argument('--label', default=datetime.now().strftime('%Y%m%d-%H%M%S'))
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'))
+    parser.add_argument('--results-dir', type=Path, default=RESULTS_DIR, help='结果 JSON 的保存目录')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    cases = []
+    for n_products in args.products:
+        for n_days in args.days:
+            case = run_case(n_products, n_days, args.change_rate, args.seed, args.modes, args)
+            cases.append(case)
+            print_case(case)
+
+    args.results_dir.mkdir(parents=True, exist_ok=True)
+    output = args.results_dir / f'{args.label}.json'
+    output.write_text(json.dumps({
+        'label': args.label,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'cases': cases,
+    }, indent=2, default=str), encoding='utf-8')
+    print(f"结果已保存到 {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from datetime import date, timedelta
+from pathlib import Path
+
+PRICE_COLUMNS = ('product_id', 'price', 'date')
+
+
+def month_key(day: date):
+    """返回日期所在月份的缓存键，如 2025-05"""
+    return day.strftime('%Y-%m')
+
+
+def month_bounds(day: date):
+    """返回日期所在月份的第一天和最后一天"""
+    first = day.replace(day=1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first, last
+
+
+class PriceCache:
+    """本地列式数据缓存
+
+    价格按月分区，每个分区是一个目录，每列一个 .npy 文件，读取时以内存映射方式打开。
+    只缓存已经结束的月份，当月数据仍可能变化，不写入缓存。
+    分类和商品表按整表缓存，数据更新后需调用 invalidate_tables 使其失效。
+    设置 max_bytes 时，写入后按最近访问时间淘汰最久未使用的价格分区，直至总大小不超过上限。
+    identity 为数据源标识（见 sources.DataSource.identity），不同数据源的缓存存放在 cache_dir 下各自的子目录中，
+    max_bytes 对每个数据源分别计算。
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, identity=None):
+        self.cache_dir = Path(cache_dir)
+        if identity is not None:
+            self.cache_dir = self.cache_dir / hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            (self.cache_dir / 'identity.txt').write_text(identity, encoding='utf-8')
+        self.identity = identity
+        self.max_bytes = max_bytes
+        self.price_dir = self.cache_dir / 'prices'
+        self.table_dir = self.cache_dir / 'tables'
+        self.price_dir.mkdir(parents=True, exist_ok=True)
+        self.table_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def is_cacheable(day: date, today=None):
+        """判断日期所在月份是否已经结束，只有已结束的月份才写入缓存"""
+        return month_bounds(day)[1] < (today or date.today())
+
+    def get_month(self, day: date):
+        """读取日期所在月份的价格分区，返回 (product_ids, prices, dates) 数组，未缓存时返回 None"""
+        path = self.price_dir / month_key(day)
+        if not path.is_dir():
+            return None
+        # 更新访问时间，作为淘汰依据
+        os.utime(path)
+        return tuple(np.load(path / f'{column}.npy', mmap_mode='r') for column in PRICE_COLUMNS)
+
+    def put_month(self, day: date, arrays):
+        """写入日期所在月份的价格分区"""
+        self._write_columns(self.price_dir / month_key(day), dict(zip(PRICE_COLUMNS, arrays)))
+        self.evict()
+
+    def get_table(self, name):
+        """读取缓存的整表，未缓存时返回 None"""
+        import pandas as pd
+        path = self.table_dir / name
+        if not (path / 'columns.json').is_file():
+            return None
+        columns = json.loads((path / 'columns.json').read_text(encoding='utf-8'))
+        data = {}
+        for i, (column, is_text) in enumerate(columns):
+            values = np.load(path / f'{i}.npy')
+            if is_text:
+                values = values.astype(object)
+                values[np.load(path / f'{i}.null.npy')] = None
+            data[column] = values
+        return pd.DataFrame(data)
+
+    def put_table(self, name, df):
+        """缓存整表，object 列中的文本按定长字符串保存（另存空值掩码），其余按数值保存，读取时不需要 pickle"""
+        import pandas as pd
+        columns, arrays = [], {}
+        for i, column in enumerate(df.columns):
+            values = df[column].to_numpy()
+            is_text = False
+            if values.dtype == object:
+                missing = pd.isna(values)
+                is_text = all(isinstance(value, str) for value in values[~missing])
+                if is_text:
+                    arrays[f'{i}.null'] = missing
+                    values = np.where(missing, '', values).astype(str)
+                else:
+                    # 如 ClickHouse 的 Decimal 列，按 float64 保存
+                    values = pd.to_numeric(values)
+            arrays[str(i)] = values
+            columns.append((str(column), bool(is_text)))
+        self._write_columns(self.table_dir / name, arrays, columns)
+
+    def invalidate(self, months=None):
+        """删除指定月份（日期列表）的价格分区，months 为 None 时清空全部价格分区"""
+        if months is None:
+            shutil.rmtree(self.price_dir, ignore_errors=True)
+            self.price_dir.mkdir(parents=True, exist_ok=True)
+            return
+        for day in months:
+            shutil.rmtree(self.price_dir / month_key(day), ignore_errors=True)
+
+    def invalidate_tables(self):
+        """删除缓存的分类和商品表"""
+        shutil.rmtree(self.table_dir, ignore_errors=True)
+        self.table_dir.mkdir(parents=True, exist_ok=True)
+
+    def size(self):
+        """缓存占用的总字节数"""
+        return sum(path.stat().st_size for path in self.cache_dir.rglob('*') if path.is_file())
+
+    def evict(self):
+        """按最近访问时间淘汰价格分区，直至总大小不超过 max_bytes"""
+        if self.max_bytes is None:
+            return
+        total = self.size()
+        partitions = sorted(self.price_dir.iterdir(), key=lambda path: path.stat().st_mtime)
+        for path in partitions:
+            if total <= self.max_bytes:
+                break
+            total -= sum(file.stat().st_size for file in path.iterdir())
+            shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def _write_columns(path, columns, column_names=None):
+        """先写入临时目录再整体替换，避免中断时留下不完整的分区；column_names 写入 columns.json"""
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        for name, values in columns.items():
+            np.save(tmp_path / f'{name}.npy', np.asarray(values))
+        if column_names is not None:
+            (tmp_path / 'columns.json').write_text(json.dumps(column_names, ensure_ascii=False), encoding='utf-8')
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
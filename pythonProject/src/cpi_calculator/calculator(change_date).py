@@ -1,182 +1,475 @@
-import clickhouse_driver
+import logging
 import numpy as np
-import pandas as pd
-from datetime import date
-from config import settings
-from pathlib import Path
-import matplotlib.pyplot as plt
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-
-class CPICalculator:
-    def __init__(self, db_config):
-        self.db_config = db_config
-        self.clickhouse_client = self._connect_clickhouse()
-        self.sqlalchemy_engine = self._connect_sqlalchemy()
-        self.Session = sessionmaker(bind=self.sqlalchemy_engine)
-        self.categories = self._load_categories()
-        self.products = self._load_products()
-
-    def _connect_clickhouse(self):
-        """连接到 ClickHouse 数据库"""
-        return clickhouse_driver.Client(
-            host=self.db_config['HOST'],
-            port=self.db_config['PORT'],
-            user=self.db_config['USER'],
-            password=self.db_config['PASSWORD']
+from typing import TYPE_CHECKING
+from datetime import date, timedelta
+from calculator_base import BaseCPICalculator
+from loader import concat_prices, filter_dates, month_ranges, prefetch_chunks, price_digest
+from cache import PriceCache, month_bounds
+from checkpoint import save_checkpoint, load_checkpoint
+from metrics import log_event, array_bytes
+from quality import deduplicate, chained_ratio_mask, apply_min_products
+from index_store import CategoryIndex, IndexStore, input_fingerprint
+from engine import (
+    build_price_matrix, carry_price_matrix, advance_prices, leaf_weights, encode_categories, chained_category_sums, parallel_chained_category_sums,
+    blocked_category_sums, block_days, as_price64, event_category_sums, price_events, last_event_prices,
+    sparse_category_events, weighted_cpi, cumulative_index, INDEX_FORMULAS,
+    blocked_price_relative_sums, formula_category_index, weighted_index, geks_category_index
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class CPICalculator(BaseCPICalculator):
+    """链式计算器：基准价格为前一天的价格"""
+
+    def __init__(self, db_config=None, source=None, server_side=False, workers=1, cache_dir=None,
+                 cache_max_bytes=None, sparse=False, memory_budget=None, spill_dir=None, trace_memory=False,
+                 sink=None, prefetch=0, quality=None, index_store=None):
+        if prefetch and (server_side or sparse):
+            raise ValueError("流水线模式只支持价格矩阵计算，不能与 server_side 或 sparse 同时使用")
+        if workers > 1 and (server_side or sparse):
+            raise ValueError("多进程计算只支持价格矩阵计算，不能与 server_side 或 sparse 同时使用")
+        if quality is not None and (server_side or sparse or prefetch):
+            raise ValueError("数据质量检查只支持一次加载整个区间的价格矩阵计算，不能与 server_side、sparse 或 prefetch 同时使用")
+        super().__init__(db_config, source, memory_budget, spill_dir, trace_memory, sink)
+        # 指定 cache_dir 时，已结束月份的价格及分类、商品表缓存到本地，之后只查询缺失的月份；
+        # 缓存按数据源标识分开存放，切换数据源不会读到其他数据源的缓存
+        if cache_dir is not None:
+            identity = self.source.identity()
+            if identity is None:
+                raise ValueError(f"{type(self.source).__name__} 没有数据源标识，不能启用本地缓存")
+            self.cache = PriceCache(cache_dir, cache_max_bytes, identity)
+        # 为 True 时分类层面的几何平均在 ClickHouse 端完成，只返回 分类×日期 的汇总结果
+        self.server_side = server_side
+        # 大于 1 时按日期分片在多个进程中计算每日价格比，价格矩阵经 spill_dir 下的内存映射文件共享给子进程
+        self.workers = workers
+        # 为 True 时直接按价格变动事件汇总，不构建 商品×日期 矩阵，耗时与价格变动次数成正比
+        self.sparse = sparse
+        # 大于 0 时启用流水线模式：按月分块，后台线程最多提前加载 prefetch 个月的价格，
+        # 当前月份的计算与后续月份的加载同时进行，内存中只保留有限个月份的价格
+        self.prefetch = prefetch
+        # quality.QualityRules：在整个区间上一次性去重、标记异常跳变、填补商品数不足的分类，
+        # 检查结果以掩码形式交给汇总计算
+        self.quality = quality
+        # 指定 index_store（目录或 index_store.IndexStore）时，叶子分类×日期 的基本指数按输入数据指纹保存，
+        # 输入不变时直接读取，不再构建价格矩阵；最近一次的基本指数保存在 last_index 中，可用于重新汇总
+        if index_store is not None and not isinstance(index_store, IndexStore):
+            index_store = IndexStore(index_store)
+        self.index_store = index_store
+        self.last_index = None
+
+    def _fetch_prices(self, start_date: date, end_date: date):
+        """读取价格数组，启用缓存时按月读取，已结束的月份优先读取本地缓存"""
+        if self.cache is None:
+            return self.source.load_prices(start_date, end_date)
+        return concat_prices(
+            self._load_month_prices(chunk_start, chunk_end)
+            for chunk_start, chunk_end in month_ranges(start_date, end_date)
         )
 
-    def _connect_sqlalchemy(self):
-        """连接 SQLAlchemy 引擎"""
-        return create_engine(self.db_config['SQLALCHEMY_DATABASE_URI'])
-
-    def _execute_clickhouse_query(self, query):
-        """执行 ClickHouse 查询"""
-        return self.clickhouse_client.execute(query)
-
-    def _load_categories(self):
-        """加载分类信息并标记叶子节点"""
-        query = """
-        SELECT 
-            category_id,
-            parent,
-            weight,
-            hierarchy AS is_leaf
-        FROM categories
+    def _load_month_prices(self, chunk_start: date, chunk_end: date):
+        """加载同一月份内一段日期的价格，已结束的月份整月查询并写入缓存"""
+        if not self.cache.is_cacheable(chunk_start):
+            return self.source.load_prices(chunk_start, chunk_end)
+
+        arrays = self.cache.get_month(chunk_start)
+        if arrays is None:
+            arrays = self.source.load_prices(*month_bounds(chunk_start))
+            self.cache.put_month(chunk_start, arrays)
+        return filter_dates(arrays, chunk_start, chunk_end)
+
+    def _category_index(self, start_date: date, end_date: date, all_dates) -> CategoryIndex:
+        """计算（或从 index_store 读取）叶子分类×日期 的基本指数，结果同时保存在 last_index 中"""
+        if self.index_store is None:
+            data = CategoryIndex(all_dates, *self._leaf_sums(start_date, end_date, all_dates))
+        else:
+            # 分类表、商品表在各自的阶段中加载，不计入 index_store 阶段
+            products = self.products
+            leaf_ids = np.unique(self.leaf_categories['category_id'].to_numpy())
+            arrays = None
+            with self.last_metrics.stage('price_summary') as counters:
+                price_summary = self.source.price_summary(start_date, end_date)
+                counters['supported'] = int(price_summary is not None)
+            if price_summary is None:
+                # 数据源不支持摘要时由价格明细计算指纹，命中时只省去计算，不省去读取
+                arrays = self._load_prices(start_date, end_date)
+                price_summary = price_digest(arrays)
+            with self.last_metrics.stage('index_store') as counters:
+                # 服务端和稀疏计算的浮点累加顺序不同，计算方式也参与指纹；其余模式的结果逐位一致
+                fingerprint = input_fingerprint(
+                    start_date, end_date, price_summary, products, leaf_ids,
+                    {
+                        'engine': 'server_side' if self.server_side else 'sparse' if self.sparse else 'dense',
+                        'quality': None if self.quality is None else vars(self.quality),
+                    }
+                )
+                data = self.index_store.get(fingerprint)
+                counters['hit'] = int(data is not None)
+            if data is None:
+                data = CategoryIndex(all_dates, *self._leaf_sums(start_date, end_date, all_dates, arrays),
+                                     fingerprint=fingerprint)
+                with self.last_metrics.stage('index_store'):
+                    self.index_store.put(data)
+            else:
+                log_event('index_store_hit', fingerprint=fingerprint, created=data.created)
+                # 权重不参与指纹，使用当前分类表中的权重
+                data.weights = leaf_weights(self.leaf_categories)[1]
+        self.last_index = data
+        return data
+
+    def _leaf_sums(self, start_date: date, end_date: date, all_dates, arrays=None):
+        """_category_sums 的结果整理为 CategoryIndex 的构造参数 (leaf_ids, sums, counts, present, weights, panel)"""
+        sums, counts, present, weights, panel = self._category_sums(start_date, end_date, all_dates, arrays)
+        leaf_ids, _ = leaf_weights(self.leaf_categories)
+        return leaf_ids, sums, counts, present, weights, panel
+
+    def _category_sums(self, start_date: date, end_date: date, all_dates, arrays=None):
+        """计算每个叶子分类每日对数价格比之和及有效商品数
+
+        返回 (sums, counts, present, weights, panel)；panel 为 (product_ids, last_prices)，
+        即每个商品在区间最后一天向前填充后的价格，服务端计算模式下不加载商品价格，panel 为 None。
+        arrays 为已加载的价格数组，为 None 时从数据源加载。
         """
-        result = self._execute_clickhouse_query(query)
-
-        # 显式指定列名，避免隐式转换问题
-        df = pd.DataFrame(result, columns=["category_id", "parent", "weight", "is_leaf"])
-
-        # 调试：检查列名和数据类型
-        print("DataFrame列名:", df.columns.tolist())
-        print("is_列数据类型:", df['is_leaf'].dtype)
-        print("前5行数据:\n", df.head())
-
-        # 筛选叶子节点（is_leaf=1）
-
-        print("叶子节点数：", df[df['is_leaf'] == 3].shape[0])
-        print("所有节点数：", df.shape[0])
-
-        self.leaf_categories = df[df['is_leaf'] == 3][['category_id', 'weight']]
-
-        # 验证权重和是否为1（可选）
+        # 先加载分类表（及商品表），使其耗时单独记录在各自的阶段中
+        leaf_categories = self.leaf_categories
+        if self.server_side:
+            # 由 ClickHouse 按 分类×日期 汇总对数价格比，Python 端只做加权和链接
+            with self.last_metrics.stage('load_category_ratios') as counters:
+                ratios = self.source.load_category_ratios(start_date, end_date)
+                counters['rows'] = len(ratios[0])
+                counters['bytes'] = array_bytes(*ratios)
+            with self.last_metrics.stage('category_sums'):
+                sums, counts, present, weights = event_category_sums(*ratios, leaf_categories, all_dates)
+            return sums, counts, present, weights, None
+
+        products = self.products
+        if self.prefetch:
+            return self._pipelined_category_sums(start_date, end_date, products, leaf_categories)
+
+        product_ids, prices, dates = self._load_prices(start_date, end_date) if arrays is None else arrays
+        if self.quality is not None:
+            with self.last_metrics.stage('quality_dedup') as counters:
+                keep, report = deduplicate(product_ids, prices, dates)
+                product_ids, prices, dates = product_ids[keep], prices[keep], dates[keep]
+                counters.update(report)
+        if self.sparse:
+            # 未变动的商品对数比为 0，只需按分类累加每条价格变动事件的贡献及有效商品数的变化
+            with self.last_metrics.stage('price_events') as counters:
+                events = price_events(product_ids, prices, dates, all_dates)
+                counters['events'] = len(events[0])
+            with self.last_metrics.stage('category_sums'):
+                sums, counts, present, weights = event_category_sums(
+                    *sparse_category_events(*events, products, leaf_categories),
+                    leaf_categories,
+                    all_dates
+                )
+            return sums, counts, present, weights, last_event_prices(events[0], events[2])
+
+        # 构建 商品×日期 的价格矩阵（已向前填充）
+        product_ids, price_matrix, present = self._build_price_matrix(product_ids, prices, dates, all_dates)
+
+        # 将商品映射为叶子分类的整数编码，只保留叶子分类下的商品
+        with self.last_metrics.stage('category_sums') as counters:
+            rows, codes, weights = encode_categories(product_ids, products, leaf_categories)
+            counters['rows'] = len(rows)
+            days_per_block = block_days(len(rows), self.memory_budget)
+            mask = None
+            if self.quality is not None:
+                # 异常跳变的掩码在整个区间上一次算出，汇总时直接使用
+                mask, report = chained_ratio_mask(price_matrix, rows, self.quality, days_per_block)
+                counters.update(report)
+            sums, counts = self._chained_sums(price_matrix, rows, codes, len(weights), mask)
+            if self.quality is not None:
+                sums, counts, counters['thin_category_days'] = apply_min_products(
+                    sums, counts, weights, self.quality.min_products
+                )
+        return sums, counts, present, weights, (product_ids, as_price64(price_matrix[:, -1]))
+
+    def _build_price_matrix(self, product_ids, prices, dates, all_dates):
+        """构建价格矩阵，指定 memory_budget 时以 float32 存储，超出预算时存放在 spill_dir 下的内存映射文件中"""
+        with self.last_metrics.stage('build_price_matrix') as counters:
+            product_ids, price_matrix, present = build_price_matrix(
+                product_ids, prices, dates, all_dates, self._matrix_dtype, self.memory_budget, self.spill_dir
+            )
+            counters['bytes'] = array_bytes(price_matrix)
+            counters['spilled'] = int(isinstance(price_matrix, np.memmap))
+        return product_ids, price_matrix, present
+
+    @property
+    def _matrix_dtype(self):
+        """价格矩阵的类型，指定内存预算时为 float32"""
+        return np.float64 if self.memory_budget is None else np.float32
+
+    def _chained_sums(self, price_matrix, rows, codes, n_categories, mask=None):
+        """按 workers 和 memory_budget 选择计算方式汇总链式对数价格比，各方式的结果逐位一致"""
+        if self.workers > 1:
+            # 内存预算由各进程平分
+            budget = None if self.memory_budget is None else self.memory_budget // self.workers
+            return parallel_chained_category_sums(
+                price_matrix, rows, codes, n_categories, self.workers, block_days(len(rows), budget),
+                mask=mask, spill_dir=self.spill_dir
+            )
+        if self.memory_budget is None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                log_prices = np.log(price_matrix[rows])
+            return chained_category_sums(log_prices, codes, n_categories, mask)
+        return blocked_category_sums(
+            price_matrix, rows, codes, n_categories, block_days(len(rows), self.memory_budget), mask=mask
+        )
 
-        total_weight = self.leaf_categories['weight'].sum()
-        if not np.isclose(total_weight, 1.0, atol=1e-3):
-            print(f"警告：叶子节点权重和为 {total_weight:.4f}")
+    def _pipelined_category_sums(self, start_date: date, end_date: date, products, leaf_categories):
+        """流水线方式计算 _category_sums，返回值相同
 
-        return df
+        后台线程按月预取价格（见 loader.prefetch_chunks），主线程逐月构建价格矩阵并汇总。
+        每月的矩阵前拼接上月最后一日向前填充后的价格向量，跨月的链式价格比由此衔接，
+        结果与一次加载整个区间的计算逐位一致。
+        """
+        import pandas as pd
+        metrics = self.last_metrics
+        _, weights = leaf_weights(leaf_categories)
+        sums, counts, present = [], [], []
+        product_ids, last_prices = np.empty(0, dtype=np.int64), np.empty(0)
+        chunks = prefetch_chunks(self._load_prices, month_ranges(start_date, end_date), self.prefetch)
+        while True:
+            # 等待预取的耗时，加载与计算完全重叠时接近 0
+            with metrics.stage('wait_prices'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            chunk_start, chunk_end, arrays = chunk
+            chunk_dates = pd.date_range(chunk_start, chunk_end, freq='D').date
+            chunk_ids, chunk_matrix, chunk_present = self._build_price_matrix(*arrays, chunk_dates)
+            with metrics.stage('carry_price_matrix') as counters:
+                product_ids, price_matrix = carry_price_matrix(
+                    product_ids, last_prices, chunk_ids, chunk_matrix, self._matrix_dtype, self.memory_budget,
+                    self.spill_dir
+                )
+                del chunk_matrix
+                counters['bytes'] = array_bytes(price_matrix)
+            with metrics.stage('category_sums') as counters:
+                rows, codes, _ = encode_categories(product_ids, products, leaf_categories)
+                counters['rows'] = len(rows)
+                chunk_sums, chunk_counts = self._chained_sums(price_matrix, rows, codes, len(weights))
+                if not present:
+                    # 第一个月没有上月的价格，第 0 列全为空，与第 1 列的价格比不参与计算
+                    chunk_sums, chunk_counts = chunk_sums[:, 1:], chunk_counts[:, 1:]
+            sums.append(chunk_sums)
+            counts.append(chunk_counts)
+            present.append(chunk_present)
+            last_prices = np.array(price_matrix[:, -1])
+            del price_matrix
+
+        if not present:
+            empty = np.zeros((len(weights), 0))
+            return empty, empty.astype(np.int64), np.zeros(0, dtype=bool), weights, (product_ids, last_prices)
+        return (
+            np.concatenate(sums, axis=1), np.concatenate(counts, axis=1), np.concatenate(present),
+            weights, (product_ids, last_prices)
+        )
 
-    def _load_products(self):
-        """加载产品信息"""
-        query = "SELECT product_id, category_id FROM products"
-        result = self._execute_clickhouse_query(query)
-        return pd.DataFrame(result, columns=["product_id", "category_id"])
+    def compute_daily_cpi(self, start_date: date, end_date: date, checkpoint_path=None) -> 'pd.Series':
+        """计算每日CPI指数，基准价格为当前日期的前一天价格，第一天不计算
 
-    def _load_prices_for_dates(self, date_tuple):
-        """加载指定日期的价格数据"""
-        date_list = "', '".join(str(d) for d in date_tuple)
-        query = f"""
-            SELECT product_id, price, toDate(date) AS date
-            FROM prices
-            WHERE date IN ('{date_list}')
+        指定 checkpoint_path 时保存检查点，之后可用 compute_incremental_cpi 逐日续算。
         """
-        result = self._execute_clickhouse_query(query)
-        return pd.DataFrame(result, columns=["product_id", "price", "date"])
+        import pandas as pd
+        if self.server_side and checkpoint_path is not None:
+            raise ValueError("服务端计算模式不加载商品价格，无法保存检查点")
+        metrics = self._start_metrics('compute_daily_cpi')
 
-    def compute_daily_cpi(self, start_date: date, end_date: date) -> pd.Series:
-        """计算每日CPI指数，基准价格为当前日期的前一天价格，第一天不计算"""
         # 生成日期序列
         all_dates = pd.date_range(start_date, end_date, freq='D').date
-
-        # 加载价格数据并进行透视，日期为列，产品ID为行，向前填充缺失值
-        price_data = self._load_prices_for_dates(all_dates)
-        price_pivot = price_data.pivot_table(
-            index='product_id',
-            columns='date',
-            values='price',
-            aggfunc='first'
-        ).ffill(axis=1)
-
-        # 预先合并产品和叶子分类数据，减少循环内重复操作
-        product_info = self.products.merge(
-            self.leaf_categories,
-            on='category_id',
-            how='inner'
-        )
-
-        cpi_series = pd.Series(index=all_dates, dtype='float64')
-        previous_date = None
-
-        for current_date in all_dates:
-            if previous_date is None:
-                # 第一日没有前一天，不计算CPI，设为NaN
-                cpi_series[current_date] = np.nan
-                previous_date = current_date
-                continue
-
-            # 获取前一天和当天的价格数据，如果缺失则跳过
-            try:
-                base_price = price_pivot[previous_date].rename('base_price')
-                current_price = price_pivot[current_date].rename('current_price')
-            except KeyError:
-                cpi_series[current_date] = np.nan
-                previous_date = current_date
-                continue
-
-            # 合并产品信息与价格
-            daily_data = product_info.merge(
-                base_price,
-                left_on='product_id',
-                right_index=True,
-                how='inner'
-            ).merge(
-                current_price,
-                left_on='product_id',
-                right_index=True,
-                how='inner'
+        data = self._category_index(start_date, end_date, all_dates)
+
+        # 所有日期的分类几何平均与加权CPI一次完成；前一天或当天无价格数据时为NaN
+        with metrics.stage('weighted_cpi'):
+            cpi_series = data.daily_cpi()
+            cumulative_cpi = cpi_series.dropna().cumprod()
+
+        with metrics.stage('write_results') as counters:
+            self.sink.write('c_daily_cpi', cpi_series)
+            self.sink.write('cpi_cumulative', cumulative_cpi)
+            counters['rows'] = len(cpi_series)
+
+        if checkpoint_path is not None:
+            product_ids, last_prices = data.panel
+            leaf_ids = np.unique(self.leaf_categories['category_id'].to_numpy())
+            # 保存全部叶子分类商品的映射，之后才出现价格的商品也能参与续算
+            product_info = self.products[self.products['category_id'].isin(leaf_ids)]
+            with metrics.stage('save_checkpoint'):
+                save_checkpoint(checkpoint_path, {
+                    'last_date': all_dates[-1],
+                    'last_present': data.present[-1],
+                    'cumulative': cumulative_cpi.iloc[-1] if len(cumulative_cpi) else np.nan,
+                    'product_ids': product_ids,
+                    'last_prices': last_prices,
+                    'map_product_ids': product_info['product_id'].to_numpy(),
+                    'map_category_ids': product_info['category_id'].to_numpy(),
+                    'category_ids': leaf_ids,
+                    'weights': data.weights,
+                })
+        return self._attach_metrics(cumulative_cpi)
+
+    def compute_incremental_cpi(self, end_date: date, checkpoint_path='cpi_checkpoint.npz') -> 'pd.Series':
+        """从检查点继续逐日计算CPI至 end_date，每日只加载当日的价格数据
+
+        新的日指数和累计指数追加到已有的 c_daily_cpi 和 cpi_cumulative 结果（已存在的日期不重复写入），
+        返回新增日期的累计指数。
+        """
+        import pandas as pd
+        metrics = self._start_metrics('compute_incremental_cpi')
+        with metrics.stage('load_checkpoint'):
+            state = load_checkpoint(checkpoint_path)
+
+        # 分类映射取自检查点，保证与生成检查点时的计算口径一致
+        products = pd.DataFrame({'product_id': state['map_product_ids'], 'category_id': state['map_category_ids']})
+        leaf_categories = pd.DataFrame({'category_id': state['category_ids'], 'weight': state['weights']})
+
+        new_dates = pd.date_range(state['last_date'] + timedelta(days=1), end_date, freq='D').date
+        cpi_series = pd.Series(index=new_dates, dtype='float64')
+        cumulative_cpi = pd.Series(dtype='float64')
+
+        for current_date in new_dates:
+            day_product_ids, day_prices, _ = self._load_prices(current_date, current_date)
+            with metrics.stage('daily_update'):
+                product_ids, base_prices, current_prices, present = advance_prices(
+                    state['product_ids'], state['last_prices'], day_product_ids, day_prices
+                )
+
+                rows, codes, weights = encode_categories(product_ids, products, leaf_categories)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    log_prices = np.log(np.column_stack([base_prices, current_prices])[rows])
+                sums, counts = chained_category_sums(log_prices, codes, len(weights))
+                daily_cpi = weighted_cpi(sums, counts, weights, np.array([state['last_present'] and present]))[0]
+
+            cpi_series[current_date] = daily_cpi
+            if not np.isnan(daily_cpi):
+                state['cumulative'] = daily_cpi if np.isnan(state['cumulative']) else state['cumulative'] * daily_cpi
+                cumulative_cpi[current_date] = state['cumulative']
+
+            state.update(
+                last_date=current_date,
+                last_present=present,
+                product_ids=product_ids,
+                last_prices=current_prices
             )
 
-            # 过滤有效数据，避免除零和缺失
-            valid_data = daily_data[
-                (daily_data['base_price'] > 0) &
-                (daily_data['current_price'].notnull())
-                ].copy()
-
-            if valid_data.empty:
-                cpi_series[current_date] = np.nan
-                previous_date = current_date
-                continue
+        with metrics.stage('write_results') as counters:
+            self.sink.write('c_daily_cpi', cpi_series, append=True)
+            self.sink.write('cpi_cumulative', cumulative_cpi, append=True)
+            counters['rows'] = len(cpi_series)
+        with metrics.stage('save_checkpoint'):
+            save_checkpoint(checkpoint_path, state)
+        return self._attach_metrics(cumulative_cpi)
 
-            # 计算对数价格比
-            valid_data['log_ratio'] = np.log(valid_data['current_price'] / valid_data['base_price'])
+    def compute_category_cpi(self, start_date: date, end_date: date) -> 'pd.DataFrame':
+        """一次计算分类树全部节点的每日链式指数
 
-            # 按类别计算指数（对数均值的指数）
-            category_index = valid_data.groupby('category_id')['log_ratio'].mean().apply(np.exp)
-
-            # 合并权重，计算加权CPI
-            final_data = category_index.reset_index(name='price_index').merge(
-                self.leaf_categories,
-                on='category_id',
-                how='inner'
-            )
+        叶子分类指数为对数价格比均值的指数，上层分类由下一层按权重逐层汇总。
+        日指数保存为 c_category_cpi 结果，返回各节点的累计指数（行为日期，列为分类ID）。
+        """
+        import pandas as pd
+        metrics = self._start_metrics('compute_category_cpi')
+        all_dates = pd.date_range(start_date, end_date, freq='D').date
+        data = self._category_index(start_date, end_date, all_dates)
 
-            cpi_series[current_date] = (final_data['price_index'] * final_data['weight']).sum().round(4)
-            previous_date = current_date
+        with metrics.stage('rollup'):
+            daily = data.rollup(self.category_tree)
+        with metrics.stage('write_results') as counters:
+            self.sink.write('c_category_cpi', daily)
+            counters['rows'] = len(daily)
+        return self._attach_metrics(CategoryIndex.cumulative(daily))
 
-        cpi_series.to_csv('c_daily_cpi.csv', header=True)
-        cumulative_cpi = cpi_series.copy()
-        cumulative_cpi = cumulative_cpi.dropna().cumprod()
+    def compute_weight_scenarios(self, start_date: date, end_date: date, scenarios) -> 'pd.DataFrame':
+        """用多组叶子分类权重计算CPI，分类指数只计算一次，所有方案由一次矩阵乘法得到
 
-        cumulative_cpi.to_csv('cpi_cumulative.csv')
-        return cumulative_cpi
+        scenarios 为 DataFrame（行索引为叶子分类ID，每列为一组权重）或 {方案名: {分类ID: 权重}}，
+        未列出的叶子分类权重为 0。每日环比CPI保存为 c_scenario_cpi 结果（行为日期，列为方案），
+        返回各方案的累计指数。
+        """
+        import pandas as pd
+        metrics = self._start_metrics('compute_weight_scenarios')
+        all_dates = pd.date_range(start_date, end_date, freq='D').date
+        data = self._category_index(start_date, end_date, all_dates)
+
+        with metrics.stage('scenario_cpi') as counters:
+            daily = data.scenario_cpi(scenarios)
+            counters['scenarios'] = daily.shape[1]
+
+        with metrics.stage('write_results') as counters:
+            self.sink.write('c_scenario_cpi', daily)
+            counters['rows'] = len(daily)
+        return self._attach_metrics(CategoryIndex.cumulative(daily))
+
+    def compute_indices(self, start_date: date, end_date: date, formulas=INDEX_FORMULAS[:-1]) -> 'pd.DataFrame':
+        """加载一次价格数据，计算多种指数公式，结果为相对首日的指数水平
+
+        formulas 可选 engine.INDEX_FORMULAS 中的公式：
+        - jevons / dutot / carli 的定基（_fixed）与链式（_chained）版本，链式指数为每日环比的累乘
+        - geks：GEKS-Jevons 多边指数，计算量随天数平方增长，默认不计算
+        叶子分类按公式求指数后再按权重加权。结果保存为 c_index_formulas，行为日期，列为公式。
+        指定 memory_budget 时价格矩阵以 float32 存储（超出预算时存放在 spill_dir 下的内存映射文件中），
+        统计量按日期分块计算。
+        """
+        import pandas as pd
+        unknown = set(formulas) - set(INDEX_FORMULAS)
+        if unknown:
+            raise ValueError(f"未知的指数公式：{sorted(unknown)}")
+        if self.server_side or self.sparse or self.prefetch or self.workers > 1 \
+                or self.quality is not None or self.index_store is not None:
+            raise ValueError(
+                "多公式指数需要商品层面的价格矩阵，不能与 server_side、sparse、prefetch、workers、quality 或 index_store 同时使用"
+            )
 
+        metrics = self._start_metrics('compute_indices')
+        all_dates = pd.date_range(start_date, end_date, freq='D').date
+        products, leaf_categories = self.products, self.leaf_categories
+        product_ids, prices, dates = self._load_prices(start_date, end_date)
+        with metrics.stage('build_price_matrix') as counters:
+            product_ids, price_matrix, present = build_price_matrix(
+                product_ids, prices, dates, all_dates, self._matrix_dtype, self.memory_budget, self.spill_dir
+            )
+            rows, codes, weights = encode_categories(product_ids, products, leaf_categories)
+            counters['bytes'] = array_bytes(price_matrix)
+
+        # 定基和链式各汇总一次，同一基期的公式共用同一组分类统计量，只计算所需的统计量
+        with metrics.stage('category_sums'):
+            days_per_block = block_days(len(rows), self.memory_budget) or max(len(all_dates), 1)
+            stats = {}
+            for base in ('fixed', 'chained'):
+                names = [formula.split('_')[0] for formula in formulas if formula.endswith(f'_{base}')]
+                if names:
+                    stats[base] = blocked_price_relative_sums(
+                        price_matrix, rows, codes, len(weights), days_per_block, base == 'fixed', names
+                    )
+
+        result = {}
+        for formula in formulas:
+            with metrics.stage(formula):
+                if formula == 'geks':
+                    index = geks_category_index(price_matrix, rows, codes, len(weights))
+                    result[formula] = weighted_index(index, weights, present[0] & present)
+                    continue
+                name, base = formula.split('_')
+                index = formula_category_index(stats[base], name)
+                if base == 'fixed':
+                    result[formula] = weighted_index(index, weights, present[0] & present)
+                else:
+                    daily = weighted_index(index, weights, present[:-1] & present[1:])
+                    result[formula] = cumulative_index(np.r_[1.0, daily])
+
+        indices = pd.DataFrame(result, index=all_dates, columns=list(formulas))
+        with metrics.stage('write_results') as counters:
+            self.sink.write('c_index_formulas', indices)
+            counters['rows'] = len(indices)
+        return self._attach_metrics(indices)
+
+
+def plot_cpi_trend(cpi_series: 'pd.Series', show=True):
+    """绘制CPI趋势图，show 为 False 时只保存图片、不弹出窗口（批处理任务可用 visualize.save_static_chart）"""
+    import matplotlib.pyplot as plt
 
-def plot_cpi_trend(cpi_series: pd.Series):
-    """绘制CPI趋势图"""
     plt.figure(figsize=(15, 6))
     cpi_series.plot(
         kind='line',
@@ -192,10 +485,16 @@ def plot_cpi_trend(cpi_series: pd.Series):
     plt.tight_layout()
     plt.savefig('2.png', dpi=300)
     print(f"图表已保存")
-    plt.show()
+    if show:
+        plt.show()
+    else:
+        plt.close()
 
 
 if __name__ == '__main__':
+    from config import settings
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
     settings.from_env('prod')
     calculator = CPICalculator(db_config=settings.CLICKHOUSE)
 
@@ -1,151 +1,64 @@
-import clickhouse_driver
+import logging
 import numpy as np
-import pandas as pd
+from typing import TYPE_CHECKING
 from datetime import date
-from config import settings
-from pathlib import Path
-import matplotlib.pyplot as plt
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-
-class CPICalculator:
-    def __init__(self, db_config):
-        self.db_config = db_config
-        self.clickhouse_client = self._connect_clickhouse()
-        self.sqlalchemy_engine = self._connect_sqlalchemy()
-        self.Session = sessionmaker(bind=self.sqlalchemy_engine)
-        self.categories = self._load_categories()
-        self.products = self._load_products()
-
-    def _connect_clickhouse(self):
-        """连接到 ClickHouse 数据库"""
-        return clickhouse_driver.Client(
-            host=self.db_config['HOST'],
-            port=self.db_config['PORT'],
-            user=self.db_config['USER'],
-            password=self.db_config['PASSWORD']
-        )
-
-    def _connect_sqlalchemy(self):
-        """连接 SQLAlchemy 引擎"""
-        return create_engine(self.db_config['SQLALCHEMY_DATABASE_URI'])
-
-    def _execute_clickhouse_query(self, query):
-        """执行 ClickHouse 查询"""
-        return self.clickhouse_client.execute(query)
-
-    def _load_categories(self):
-        """加载分类信息并标记叶子节点"""
-        query = """
-        SELECT 
-            category_id,
-            parent,
-            weight,
-            hierarchy AS is_leaf
-        FROM categories
-        """
-        result = self._execute_clickhouse_query(query)
-
-        # 显式指定列名，避免隐式转换问题
-        df = pd.DataFrame(result, columns=["category_id", "parent", "weight", "is_leaf"])
-
-        # 调试：检查列名和数据类型
-        print("DataFrame列名:", df.columns.tolist())
-        print("is_列数据类型:", df['is_leaf'].dtype)
-        print("前5行数据:\n", df.head())
-
-        # 筛选叶子节点（is_leaf=1）
-
-        print("叶子节点数：", df[df['is_leaf'] == 3].shape[0])
-        print("所有节点数：", df.shape[0])
-
-        self.leaf_categories = df[df['is_leaf'] == 3][['category_id', 'weight']]
-
-        # 验证权重和是否为1（可选）
-
-        total_weight = self.leaf_categories['weight'].sum()
-        if not np.isclose(total_weight, 1.0, atol=1e-3):
-            print(f"警告：叶子节点权重和为 {total_weight:.4f}")
-
-        return df
-
-    def _load_products(self):
-        """加载产品信息"""
-        query = "SELECT product_id, category_id FROM products"
-        result = self._execute_clickhouse_query(query)
-        return pd.DataFrame(result, columns=["product_id", "category_id"])
-
-    def _load_prices_for_dates(self, date_tuple):
-        """加载指定日期的价格数据"""
-        date_list = "', '".join(str(d) for d in date_tuple)
-        query = f"""
-            SELECT product_id, price, toDate(date) AS date
-            FROM prices
-            WHERE date IN ('{date_list}')
-        """
-        result = self._execute_clickhouse_query(query)
-        return pd.DataFrame(result, columns=["product_id", "price", "date"])
-
-    def compute_daily_cpi(self, start_date: date, end_date: date) -> pd.Series:
-        """计算每日CPI指数"""
-        # 加载价格数据并预处理
-        all_dates = pd.date_range(start_date, end_date, freq='D').date
-        price_data = self._load_prices_for_dates(all_dates)
-        price_pivot = price_data.pivot_table(
-            index='product_id',
-            columns='date',
-            values='price',
-            aggfunc='first'
-        ).ffill(axis=1)
-
-        # 合并产品、分类和基期价格
-        merged_data = self.products.merge(
-            self.leaf_categories,
-            on='category_id',
-            how='inner'
-        ).merge(
-            price_pivot[start_date].rename('base_price'),
-            left_on='product_id',
-            right_index=True
-        )
-
-        # 逐日计算CPI
-        cpi_series = pd.Series(index=all_dates, dtype='float64')
-        for current_date in all_dates:
-            current_prices = price_pivot[current_date].rename('current_price')
-            daily_data = merged_data.merge(
-                current_prices,
-                left_on='product_id',
-                right_index=True,
-                how='inner'
-            )
+from calculator_base import BaseCPICalculator
+from metrics import array_bytes
+from engine import (
+    build_price_matrix, encode_categories, fixed_base_category_sums, blocked_category_sums, block_days, weighted_cpi
+)
 
-            valid_data = daily_data[
-                (daily_data['base_price'] > 0) &
-                (daily_data['current_price'].notnull())
-                ].copy()
+if TYPE_CHECKING:
+    import pandas as pd
 
-            if valid_data.empty:
-                cpi_series[current_date] = np.nan
-                continue
 
-            valid_data['log_ratio'] = np.log(valid_data['current_price'] / valid_data['base_price'])
-            category_index = valid_data.groupby('category_id')['log_ratio'].mean().apply(np.exp)
-
-            final_data = category_index.reset_index(name='price_index').merge(
-                self.leaf_categories,
-                on='category_id'
-            )
-            cpi_series[current_date] = (final_data['price_index'] * final_data['weight']).sum().round(4)
+class CPICalculator(BaseCPICalculator):
+    """固定基期计算器：基准价格为区间第一天的价格"""
 
-        cpi_series.to_csv('f_daily_cpi.csv', header=True)
-        return cpi_series
+    def compute_daily_cpi(self, start_date: date, end_date: date) -> 'pd.Series':
+        """计算每日CPI指数"""
+        import pandas as pd
+        metrics = self._start_metrics('compute_daily_cpi')
+        products, leaf_categories = self.products, self.leaf_categories
 
+        # 加载价格数据并构建 商品×日期 的价格矩阵（已向前填充）
+        all_dates = pd.date_range(start_date, end_date, freq='D').date
+        product_ids, prices, dates = self._load_prices(start_date, end_date)
+        with metrics.stage('build_price_matrix') as counters:
+            dtype = np.float64 if self.memory_budget is None else np.float32
+            product_ids, price_matrix, present = build_price_matrix(
+                product_ids, prices, dates, all_dates, dtype, self.memory_budget, self.spill_dir
+            )
+            counters['bytes'] = array_bytes(price_matrix)
+
+        # 商品映射为叶子分类编码，所有日期相对基期的分类几何平均一次完成
+        with metrics.stage('category_sums') as counters:
+            rows, codes, weights = encode_categories(product_ids, products, leaf_categories)
+            counters['rows'] = len(rows)
+            if self.memory_budget is None:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    log_prices = np.log(price_matrix[rows])
+                sums, counts = fixed_base_category_sums(log_prices, codes, len(weights))
+            else:
+                sums, counts = blocked_category_sums(
+                    price_matrix, rows, codes, len(weights), block_days(len(rows), self.memory_budget), fixed_base=True
+                )
+
+        # 基期或当天无价格数据时为NaN
+        with metrics.stage('weighted_cpi'):
+            daily_cpi = weighted_cpi(sums, counts, weights, present[0] & present)
+            cpi_series = pd.Series(daily_cpi, index=all_dates, dtype='float64')
+
+        with metrics.stage('write_results') as counters:
+            self.sink.write('f_daily_cpi', cpi_series)
+            counters['rows'] = len(cpi_series)
+        return self._attach_metrics(cpi_series)
+
+
+def plot_cpi_trend(cpi_series: 'pd.Series', show=True):
+    """绘制CPI趋势图，show 为 False 时只保存图片、不弹出窗口（批处理任务可用 visualize.save_static_chart）"""
+    import matplotlib.pyplot as plt
 
-def plot_cpi_trend(cpi_series: pd.Series):
-    """绘制CPI趋势图"""
-    cpi_series.to_csv('f_daily_cpi.csv', header=True)
     plt.figure(figsize=(15, 6))
     cpi_series.plot(
         kind='line',
@@ -161,10 +74,16 @@ def plot_cpi_trend(cpi_series: pd.Series):
     plt.tight_layout()
     plt.savefig('1.png', dpi=300)
     print(f"图表已保存")
-    plt.show()
+    if show:
+        plt.show()
+    else:
+        plt.close()
 
 
 if __name__ == '__main__':
+    from config import settings
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
     settings.from_env('prod')
     calculator = CPICalculator(db_config=settings.CLICKHOUSE)
 
@@ -0,0 +1,133 @@
+import logging
+import numpy as np
+from datetime import date
+from functools import cached_property
+from sources import ClickHouseSource
+from sinks import CsvSink, MultiSink
+from metrics import Metrics, log_event, array_bytes
+from tree import CategoryTree
+
+
+class BaseCPICalculator:
+    """链式和固定基期计算器共用的部分：数据源、结果输出、阶段指标，以及分类表、商品表、价格的加载"""
+
+    def __init__(self, db_config=None, source=None, memory_budget=None, spill_dir=None, trace_memory=False, sink=None):
+        self.db_config = db_config
+        # 数据源默认为 ClickHouse，也可传入 sources.LocalSource 等读取本地分区
+        self.source = source if source is not None else ClickHouseSource(db_config)
+        # 本地缓存（cache.PriceCache），由支持缓存的计算器设置
+        self.cache = None
+        # 指定内存预算（字节）时价格矩阵以 float32 存储，超出预算时存放在 spill_dir 下的内存映射文件中，
+        # 对数价格按日期分块计算
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        # 最近一次计算的阶段指标，结果的 attrs['metrics'] 中也保存一份汇总；
+        # trace_memory 为 True 时用 tracemalloc 统计各阶段的内存峰值
+        self.trace_memory = trace_memory
+        self.last_metrics = Metrics('init', trace_memory)
+        # 结果输出，默认写出到当前目录下的 CSV；可传入 sinks 中的其他输出，多个输出时传入列表
+        if sink is None:
+            sink = CsvSink('.')
+        self.sink = MultiSink(*sink) if isinstance(sink, (list, tuple)) else sink
+
+    # 数据库连接、分类表和商品表均在首次使用时才创建或加载，构造计算器本身不访问数据库
+    @cached_property
+    def sqlalchemy_engine(self):
+        """SQLAlchemy 引擎，首次使用时创建"""
+        return self._connect_sqlalchemy()
+
+    @cached_property
+    def Session(self):
+        """SQLAlchemy 会话工厂"""
+        from sqlalchemy.orm import sessionmaker
+        return sessionmaker(bind=self.sqlalchemy_engine)
+
+    @cached_property
+    def categories(self):
+        """分类表，首次使用时加载"""
+        return self._load_categories()
+
+    @cached_property
+    def leaf_categories(self):
+        """叶子分类及权重，由 _load_categories 在加载分类表时设置"""
+        self.categories
+        return self.__dict__['leaf_categories']
+
+    @cached_property
+    def category_tree(self):
+        """分类树（tree.CategoryTree），由 _load_categories 在加载分类表时设置"""
+        self.categories
+        return self.__dict__['category_tree']
+
+    @cached_property
+    def products(self):
+        """商品表，首次使用时加载"""
+        return self._load_products()
+
+    def _connect_sqlalchemy(self):
+        """连接 SQLAlchemy 引擎"""
+        from sqlalchemy import create_engine
+        return create_engine(self.db_config['SQLALCHEMY_DATABASE_URI'])
+
+    def _start_metrics(self, name):
+        """开始记录一次计算的阶段指标"""
+        self.last_metrics = Metrics(name, self.trace_memory)
+        return self.last_metrics
+
+    def _attach_metrics(self, result):
+        """输出汇总日志，并将指标汇总附加到结果的 attrs['metrics']"""
+        result.attrs['metrics'] = self.last_metrics.log_summary()
+        return result
+
+    def _load_table(self, name, load):
+        """加载整表，启用缓存时优先读取本地缓存"""
+        if self.cache is not None:
+            df = self.cache.get_table(name)
+            if df is not None:
+                return df
+        df = load()
+        if self.cache is not None:
+            self.cache.put_table(name, df)
+        return df
+
+    def _load_categories(self):
+        """加载分类信息并标记叶子节点"""
+        with self.last_metrics.stage('load_categories') as counters:
+            df = self._load_table('categories', self.source.load_categories)
+            counters['rows'] = len(df)
+
+        log_event(
+            'categories_schema', logging.DEBUG,
+            columns=df.columns.tolist(), dtypes={column: str(dtype) for column, dtype in df.dtypes.items()}
+        )
+
+        # 叶子节点为分类树中没有子分类的节点，不依赖 hierarchy 层级
+        self.category_tree = CategoryTree.from_frame(df)
+        self.leaf_categories = df[df['category_id'].isin(self.category_tree.leaf_ids)][['category_id', 'weight']]
+        log_event('categories_loaded', nodes=len(df), leaves=len(self.leaf_categories))
+
+        # 验证权重和是否为1（可选）
+        total_weight = self.leaf_categories['weight'].sum()
+        if not np.isclose(total_weight, 1.0, atol=1e-3):
+            log_event('leaf_weight_sum', logging.WARNING, total_weight=round(float(total_weight), 4))
+
+        return df
+
+    def _load_products(self):
+        """加载产品信息"""
+        with self.last_metrics.stage('load_products') as counters:
+            df = self._load_table('products', self.source.load_products)
+            counters['rows'] = len(df)
+        return df
+
+    def _load_prices(self, start_date: date, end_date: date):
+        """从数据源加载日期区间内的价格数据，返回 (product_ids, prices, dates) 数组"""
+        with self.last_metrics.stage('load_prices') as counters:
+            arrays = self._fetch_prices(start_date, end_date)
+            counters['rows'] = len(arrays[0])
+            counters['bytes'] = array_bytes(*arrays)
+        return arrays
+
+    def _fetch_prices(self, start_date: date, end_date: date):
+        """读取价格数组，子类可改为经本地缓存读取"""
+        return self.source.load_prices(start_date, end_date)
@@ -0,0 +1,41 @@
+import os
+import numpy as np
+
+
+def save_checkpoint(path, state):
+    """保存增量计算的检查点
+
+    state 字段：
+    - last_date: 最后计算的日期
+    - last_present: 最后一日是否存在价格记录
+    - cumulative: 最后的累计指数，尚无有效指数时为 NaN
+    - product_ids / last_prices: 每个商品最近一次的已知价格（向前填充后）
+    - map_product_ids / map_category_ids: 叶子分类下的商品与分类映射
+    - category_ids / weights: 叶子分类及其权重
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            last_date=np.datetime64(state['last_date'], 'D'),
+            last_present=np.bool_(state['last_present']),
+            cumulative=np.float64(state['cumulative']),
+            product_ids=np.asarray(state['product_ids'], dtype=np.int64),
+            last_prices=np.asarray(state['last_prices'], dtype=np.float64),
+            map_product_ids=np.asarray(state['map_product_ids'], dtype=np.int64),
+            map_category_ids=np.asarray(state['map_category_ids'], dtype=np.int64),
+            category_ids=np.asarray(state['category_ids'], dtype=np.int64),
+            weights=np.asarray(state['weights'], dtype=np.float64),
+        )
+    # 先写临时文件再替换，避免中断时留下损坏的检查点
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """读取检查点，返回与 save_checkpoint 相同结构的字典"""
+    with np.load(path) as data:
+        state = {key: data[key] for key in data.files}
+    state['last_date'] = state['last_date'].item()
+    state['last_present'] = bool(state['last_present'])
+    state['cumulative'] = float(state['cumulative'])
+    return state
@@ -1,56 +1,139 @@
 from pathlib import Path
 import pandas as pd
 import os
-from datetime import datetime
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from to_utf import open_utf8
 
 # 设置路径
 base_path = Path(__file__).resolve().parent.parent / 'data' / 'data_test'
 daily_price_path = os.path.join(base_path, 'daily_price')
-products_path = os.path.join(base_path, 'products.csv')
 categories_path = os.path.join(base_path, 'categories.csv')
+# 清洗结果按源文件分区保存，新增文件只追加新的分区
+output_path = os.path.join(base_path, 'price')
+manifest_path = os.path.join(base_path, 'clean_manifest.json')
 
-# 读取产品和类别数据
-df_products = pd.read_csv(products_path, dtype={'product_id': str, 'category_id': str}, encoding='gbk')
-df_categories = pd.read_csv(categories_path, dtype={'category_id': str}, encoding='gbk')
 
-# 初始化清洗结果列表
-all_price_data = []
+def clean_price_file(filepath):
+    """清洗单个每日价格文件"""
+    # GBK 源文件按块转码为 UTF-8 字节流后直接解析，不写出中间文件
+    with open_utf8(filepath) as f:
+        df_daily = pd.read_csv(f, dtype={'product_id': str, 'category_id': str}, encoding='utf-8')
 
-# 遍历 daily_price 目录下所有 CSV 文件
-for filename in os.listdir(daily_price_path):
-    if filename.endswith('.csv'):
-        filepath = os.path.join(daily_price_path, filename)
-        print("正在清洗文件:", filepath)
-        df_daily = pd.read_csv(filepath, dtype={'product_id': str, 'category_id': str}, encoding='gbk')
+    # 统一日期格式
+    df_daily['change_date'] = pd.to_datetime(df_daily['change_date'], errors='coerce')
+    df_daily = df_daily.dropna(subset=['change_date'])
 
-        # 统一日期格式
-        df_daily['change_date'] = pd.to_datetime(df_daily['change_date'], errors='coerce')
-        df_daily = df_daily.dropna(subset=['change_date'])
+    # 保留所需字段并重命名
+    df_clean = df_daily[['product_id', 'category_id', 'name', 'price', 'change_date']].copy()
+    df_clean.rename(columns={'change_date': 'date'}, inplace=True)
 
-        # 保留所需字段并重命名
-        df_clean = df_daily[['product_id', 'category_id', 'name', 'price', 'change_date']].copy()
-        df_clean.rename(columns={'change_date': 'date'}, inplace=True)
+    # 删除价格为负或缺失的数据
+    df_clean = df_clean[df_clean['price'] > 0]
+    df_clean = df_clean.dropna(subset=['product_id', 'category_id', 'price'])
 
-        # 删除价格为负或缺失的数据
-        df_clean = df_clean[df_clean['price'] > 0]
-        df_clean = df_clean.dropna(subset=['product_id', 'category_id', 'price'])
+    # 日期统一为字符串格式 yyyy-MM-dd
+    df_clean['date'] = df_clean['date'].dt.strftime('%Y-%m-%d')
+    return df_clean
 
-        # 加入列表
-        all_price_data.append(df_clean)
 
-# 合并所有天的价格数据
-df_all = pd.concat(all_price_data, ignore_index=True)
+def clean_to_partition(filepath, partition_dir):
+    """清洗单个文件并写入对应的分区文件，返回 (分区路径, 记录数)"""
+    df_clean = clean_price_file(filepath)
+    partition_path = os.path.join(partition_dir, os.path.basename(filepath))
+    tmp_path = f'{partition_path}.tmp'
+    df_clean.to_csv(tmp_path, index=False, encoding='UTF-8-sig')
+    os.replace(tmp_path, partition_path)
+    return partition_path, len(df_clean)
 
-# 日期统一为字符串格式 yyyy-MM-dd
-df_all['date'] = df_all['date'].dt.strftime('%Y-%m-%d')
 
-# 保存为统一格式 CSV
-output_path = os.path.join(base_path, 'price.csv')
-df_all.to_csv(output_path, index=False, encoding = 'UTF-8-sig')
+def file_signature(filepath, use_hash=False):
+    """文件签名：默认使用大小和修改时间，use_hash 为 True 时使用内容的 SHA-256"""
+    stat = os.stat(filepath)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if use_hash:
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        signature = {'sha256': digest.hexdigest()}
+    return signature
 
-df_categories.fillna(-1, inplace=True)
-df_categories.to_csv(categories_path,encoding = 'UTF-8-sig',index = False)
 
-print(f"清洗完成，已保存为 {output_path}，共 {len(df_all)} 条记录")
+def load_manifest(path):
+    """读取已处理文件清单"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
 
 
+def save_manifest(path, manifest):
+    """保存已处理文件清单"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def clean_daily_prices(source_dir, partition_dir, manifest_file, workers=None, use_hash=False):
+    """增量清洗 source_dir 下的每日价格文件
+
+    只处理清单中没有记录或签名已变化的文件，各文件在独立进程中并行清洗，
+    结果写入 partition_dir 下与源文件同名的分区；源文件删除后对应分区也一并删除。
+    返回本次处理的文件名列表。
+    """
+    os.makedirs(partition_dir, exist_ok=True)
+    manifest = load_manifest(manifest_file)
+    files = manifest.setdefault('daily_price', {})
+
+    filenames = sorted(name for name in os.listdir(source_dir) if name.endswith('.csv'))
+    signatures = {name: file_signature(os.path.join(source_dir, name), use_hash) for name in filenames}
+    pending = [name for name in filenames if files.get(name, {}).get('signature') != signatures[name]]
+
+    for name in set(files) - set(filenames):
+        partition_path = os.path.join(partition_dir, name)
+        if os.path.exists(partition_path):
+            os.remove(partition_path)
+        del files[name]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            name: executor.submit(clean_to_partition, os.path.join(source_dir, name), partition_dir)
+            for name in pending
+        }
+        for name, future in futures.items():
+            _, rows = future.result()
+            print("已清洗文件:", name, "记录数:", rows)
+            files[name] = {'signature': signatures[name], 'rows': rows}
+            # 每完成一个文件即更新清单，中断后可从断点继续
+            save_manifest(manifest_file, manifest)
+
+    save_manifest(manifest_file, manifest)
+    return pending
+
+
+def clean_categories(path, manifest_file):
+    """将分类表缺失的父分类填充为 -1 并转存为 UTF-8
+
+    转存后的签名记入清单，重复运行时不会把已转换的文件再次按 GBK 读取。
+    """
+    manifest = load_manifest(manifest_file)
+    if manifest.get('categories') == file_signature(path):
+        return False
+
+    with open_utf8(path) as f:
+        df_categories = pd.read_csv(f, dtype={'category_id': str}, encoding='utf-8')
+    df_categories.fillna(-1, inplace=True)
+    df_categories.to_csv(path, encoding='UTF-8-sig', index=False)
+
+    manifest['categories'] = file_signature(path)
+    save_manifest(manifest_file, manifest)
+    return True
+
+
+if __name__ == '__main__':
+    processed = clean_daily_prices(daily_price_path, output_path, manifest_path)
+    clean_categories(categories_path, manifest_path)
+    print(f"清洗完成，本次处理 {len(processed)} 个文件，结果保存在 {output_path}")
@@ -0,0 +1,618 @@
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+
+def build_price_matrix(product_ids, prices, dates, all_dates, dtype=np.float64, max_bytes=None, spill_dir=None):
+    """将价格明细数组整理为 商品×日期 的价格矩阵，并沿日期方向向前填充
+
+    返回 (product_ids, matrix, present)：
+    - product_ids: 升序排列的商品ID，对应矩阵的行
+    - matrix: dtype 类型的连续价格矩阵，形状为 (商品数, 日期数)
+    - present: 布尔数组，标记当日是否存在任何价格记录
+
+    dtype 可为 float32，价格低于 FLOAT32_EXACT_PRICE 时经 as_price64 还原后计算结果不变。
+    指定 max_bytes 时，矩阵超过该大小则存放在 spill_dir 下的临时内存映射文件中，
+    向前填充按行分块进行，每块的临时数组不超过 max_bytes。
+    """
+    import pandas as pd
+    day_index = pd.DatetimeIndex(pd.to_datetime(all_dates)).values.astype('datetime64[D]')
+    prices = as_price64(prices)
+    dates = np.asarray(dates, dtype='datetime64[D]')
+
+    cols = np.searchsorted(day_index, dates)
+    keep = (cols < len(day_index)) & ~np.isnan(prices)
+    keep[keep] = day_index[cols[keep]] == dates[keep]
+
+    product_ids, rows = np.unique(np.asarray(product_ids)[keep], return_inverse=True)
+    cols = cols[keep]
+    prices = prices[keep]
+
+    # 同一商品同一日期有多条记录时取第一条，与 pivot_table(aggfunc='first') 保持一致
+    _, first = np.unique(rows.astype(np.int64) * len(day_index) + cols, return_index=True)
+
+    matrix = allocate_matrix((len(product_ids), len(day_index)), dtype, max_bytes, spill_dir)
+    matrix[:] = np.nan
+    matrix[rows[first], cols[first]] = prices[first]
+
+    forward_fill_blocks(matrix, max_bytes)
+
+    present = np.zeros(len(day_index), dtype=bool)
+    present[cols] = True
+
+    return product_ids, matrix, present
+
+
+def allocate_matrix(shape, dtype=np.float64, max_bytes=None, spill_dir=None):
+    """分配矩阵，超过 max_bytes 时改用 spill_dir 下的临时内存映射文件（矩阵释放后自动删除）"""
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if max_bytes is None or nbytes <= max_bytes or nbytes == 0:
+        return np.empty(shape, dtype=dtype)
+    file = tempfile.NamedTemporaryFile(dir=spill_dir)
+    matrix = np.memmap(file, dtype=dtype, mode='w+', shape=shape)
+    # 矩阵持有文件对象，存在期间文件不会被删除，子进程可按 matrix.filename 打开（见 shared_matrix）
+    matrix.spill_file = file
+    return matrix
+
+
+@contextmanager
+def shared_matrix(matrix, spill_dir=None):
+    """矩阵的只读共享句柄 (文件路径, dtype, 形状, 偏移)，子进程以内存映射方式打开
+
+    allocate_matrix 溢出到文件的矩阵直接共享其文件，其余矩阵先复制到 spill_dir 下的临时文件，退出时删除。
+    """
+    if getattr(matrix, 'spill_file', None) is not None:
+        matrix.flush()
+        yield matrix.filename, matrix.dtype.str, matrix.shape, matrix.offset
+        return
+    with tempfile.NamedTemporaryFile(dir=spill_dir) as file:
+        copy = np.memmap(file, dtype=matrix.dtype, mode='w+', shape=matrix.shape)
+        copy[:] = matrix
+        copy.flush()
+        del copy
+        yield file.name, matrix.dtype.str, matrix.shape, 0
+
+
+FLOAT32_EXACT_PRICE = 2 ** 17
+
+
+def as_price64(prices):
+    """将价格转换为 float64
+
+    价格以 DECIMAL(12,2) 存储，float32 价格在转换时按分取整。
+    float32 的精度在 FLOAT32_EXACT_PRICE（131072）以下小于半分，按分取整可还原原价格，
+    与直接读取 float64 价格的计算结果一致；达到该值的价格会偏离若干分。
+    """
+    prices = np.asarray(prices)
+    if prices.dtype == np.float32:
+        return np.round(prices.astype(np.float64), 2)
+    return prices.astype(np.float64)
+
+
+def advance_prices(product_ids, last_prices, day_product_ids, day_prices):
+    """用单日的价格记录更新每个商品最近的已知价格
+
+    返回 (product_ids, base_prices, current_prices, present)：商品ID为原有商品与当日商品的并集，
+    base_prices 为前一日向前填充后的价格，current_prices 为当日向前填充后的价格，
+    present 表示当日是否存在任何价格记录。
+    """
+    day_prices = as_price64(day_prices)
+    keep = ~np.isnan(day_prices)
+    # 同一商品当日有多条记录时取第一条，与 build_price_matrix 保持一致
+    day_product_ids, first = np.unique(np.asarray(day_product_ids)[keep], return_index=True)
+    day_prices = day_prices[keep][first]
+
+    all_ids = np.union1d(product_ids, day_product_ids)
+    base_prices = np.full(len(all_ids), np.nan)
+    base_prices[np.searchsorted(all_ids, product_ids)] = last_prices
+    current_prices = base_prices.copy()
+    current_prices[np.searchsorted(all_ids, day_product_ids)] = day_prices
+    return all_ids, base_prices, current_prices, len(day_product_ids) > 0
+
+
+def carry_price_matrix(carry_ids, carry_prices, product_ids, price_matrix, dtype=np.float64, max_bytes=None,
+                       spill_dir=None):
+    """在分块的价格矩阵前拼接上一块最后一日的价格，用于跨块衔接链式计算
+
+    carry_ids / carry_prices 为上一块最后一日向前填充后的价格，price_matrix 为本块的价格矩阵。
+    返回 (product_ids, matrix)：商品ID为两者的并集（升序），matrix 的第 0 列为上一块最后一日的价格，
+    本块中商品首次出现价格之前的日期由该列向前填充，与整个区间一次构建的矩阵逐位一致。
+    dtype、max_bytes、spill_dir 的含义同 build_price_matrix。
+    """
+    all_ids = np.union1d(carry_ids, product_ids)
+    matrix = allocate_matrix((len(all_ids), price_matrix.shape[1] + 1), dtype, max_bytes, spill_dir)
+    matrix[:] = np.nan
+    matrix[np.searchsorted(all_ids, carry_ids), 0] = carry_prices
+    matrix[np.searchsorted(all_ids, product_ids), 1:] = as_price64(price_matrix)
+    forward_fill_blocks(matrix, max_bytes)
+    return all_ids, matrix
+
+
+def forward_fill_blocks(matrix, max_bytes=None):
+    """按行分块原地向前填充，每块的临时数组不超过 max_bytes（forward_fill 的临时数组约为每个元素 24 字节）"""
+    n_rows, n_days = matrix.shape
+    block_rows = n_rows if max_bytes is None else max(int(max_bytes // (24 * max(n_days, 1))), 1)
+    for start in range(0, n_rows, max(block_rows, 1)):
+        matrix[start:start + block_rows] = forward_fill(matrix[start:start + block_rows])
+
+
+def forward_fill(matrix):
+    """沿日期方向（axis=1）向前填充缺失值"""
+    filled = ~np.isnan(matrix)
+    last = np.where(filled, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(last, axis=1, out=last)
+    return matrix[np.arange(matrix.shape[0])[:, None], last]
+
+
+def leaf_weights(leaf_categories):
+    """返回升序排列的叶子分类ID及对应权重，分类编码即其在数组中的位置"""
+    leaf_categories = leaf_categories.drop_duplicates('category_id')
+    category_ids = np.sort(leaf_categories['category_id'].to_numpy())
+    weights = (
+        leaf_categories.set_index('category_id')['weight']
+        .reindex(category_ids)
+        .to_numpy(dtype=np.float64)
+    )
+    return category_ids, weights
+
+
+def encode_categories(product_ids, products, leaf_categories):
+    """将矩阵行映射为叶子分类的整数编码
+
+    返回 (rows, codes, weights)：rows 为参与计算的矩阵行号（商品重复出现时行号也重复），
+    codes 为对应的分类编码，weights 为按编码排列的分类权重。
+    """
+    import pandas as pd
+    category_ids, weights = leaf_weights(leaf_categories)
+    product_info = products[products['category_id'].isin(category_ids)]
+
+    rows = pd.Index(product_ids).get_indexer(product_info['product_id'])
+    matched = rows >= 0
+
+    codes = np.searchsorted(category_ids, product_info['category_id'].to_numpy()[matched])
+    return rows[matched], codes, weights
+
+
+def chained_category_sums(log_prices, codes, n_categories, mask=None):
+    """计算每个分类每日对数价格比（相对前一日）之和及有效商品数
+
+    log_prices 的第 0 列只作为基期，返回的 (sums, counts) 形状均为 (分类数, 日期数 - 1)。
+    mask 为 (行数, 日期数 - 1) 的布尔数组（如 quality.chained_ratio_mask 的结果），为 False 的价格比不参与计算。
+    """
+    return _log_ratio_sums(log_prices[:, :-1], log_prices[:, 1:], codes, n_categories, mask)
+
+
+def fixed_base_category_sums(log_prices, codes, n_categories):
+    """计算每个分类每日对数价格比（相对第 0 列基期）之和及有效商品数
+
+    返回的 (sums, counts) 形状均为 (分类数, 日期数)，第 0 列为基期自身。
+    """
+    return _log_ratio_sums(log_prices[:, :1], log_prices, codes, n_categories)
+
+
+def _log_ratio_sums(base, current, codes, n_categories, mask=None):
+    """按分类汇总对数价格比，基期价格需大于 0，当期价格非空，且 mask（若指定）为 True"""
+    with np.errstate(invalid='ignore'):
+        valid = (base > -np.inf) & ~np.isnan(current)
+        if mask is not None:
+            valid &= mask
+        log_ratio = np.where(valid, current - base, 0.0)
+    return _sum_by_category(log_ratio, valid, codes, n_categories)
+
+
+def log_price_block(price_matrix, rows, start, end):
+    """取矩阵中 rows 行、第 start 至 end - 1 列的对数价格（float64）"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log(as_price64(price_matrix[rows, start:end]))
+
+
+def block_days(n_rows, max_bytes):
+    """在 max_bytes 内每块可处理的日期数，按每个元素约 32 字节的临时数组估计"""
+    if max_bytes is None:
+        return None
+    return max(int(max_bytes // (32 * max(n_rows, 1))), 1)
+
+
+def blocked_category_sums(price_matrix, rows, codes, n_categories, days_per_block, fixed_base=False, mask=None):
+    """按日期分块计算 chained_category_sums 或 fixed_base_category_sums
+
+    每块只将 rows×days_per_block 的价格转换为 float64 对数价格，链式计算额外带上前一日作为基期，
+    定基计算额外带上第 0 列基期。各日期的结果互不影响，与整体计算的结果逐位一致。
+    mask 只用于链式计算，含义同 chained_category_sums。
+    """
+    n_days = price_matrix.shape[1]
+    if fixed_base:
+        base = log_price_block(price_matrix, rows, 0, 1)
+        results = [
+            fixed_base_category_sums(
+                np.hstack([base, log_price_block(price_matrix, rows, start, start + days_per_block)]),
+                codes,
+                n_categories
+            )
+            for start in range(0, max(n_days, 1), days_per_block)
+        ]
+        sums = np.concatenate([result[0][:, 1:] for result in results], axis=1)
+        counts = np.concatenate([result[1][:, 1:] for result in results], axis=1)
+        return sums, counts
+
+    results = [
+        chained_category_sums(
+            log_price_block(price_matrix, rows, start, start + days_per_block + 1), codes, n_categories,
+            None if mask is None else mask[:, start:start + days_per_block]
+        )
+        for start in range(0, max(n_days - 1, 1), days_per_block)
+    ]
+    sums = np.concatenate([result[0] for result in results], axis=1)
+    counts = np.concatenate([result[1] for result in results], axis=1)
+    return sums, counts
+
+
+def parallel_chained_category_sums(price_matrix, rows, codes, n_categories, workers, days_per_block=None,
+                                   mask=None, spill_dir=None, shard_days=None):
+    """在多个进程中按日期分片计算 blocked_category_sums 的链式结果
+
+    价格矩阵经 shared_matrix 以内存映射文件共享，子进程只读取自己分片内 rows 行的价格，自行取对数并汇总，
+    父进程不计算对数价格，也不向子进程传递矩阵切片。每个分片额外带上前一日的一列作为基期，
+    分片内再按 days_per_block 分块（为 None 时整个分片一次计算），结果按日期顺序拼接，与单进程计算逐位一致。
+    shard_days 为每个分片的日期数，默认按进程数均分。
+    """
+    n_ratios = price_matrix.shape[1] - 1
+    if shard_days is None:
+        shard_days = -(-n_ratios // workers)
+    bounds = [(start, min(start + shard_days, n_ratios)) for start in range(0, n_ratios, max(shard_days, 1))]
+    if workers <= 1 or len(bounds) <= 1:
+        return blocked_category_sums(
+            price_matrix, rows, codes, n_categories, days_per_block or max(n_ratios, 1), mask=mask
+        )
+
+    with shared_matrix(price_matrix, spill_dir) as handle, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _shard_category_sums, handle, rows, codes, n_categories, start, end, days_per_block,
+                None if mask is None else mask[:, start:end]
+            )
+            for start, end in bounds
+        ]
+        results = [future.result() for future in futures]
+
+    sums = np.concatenate([result[0] for result in results], axis=1)
+    counts = np.concatenate([result[1] for result in results], axis=1)
+    return sums, counts
+
+
+def _shard_category_sums(handle, rows, codes, n_categories, start, end, days_per_block, mask):
+    """子进程中计算第 start 至 end - 1 个价格比的分片，handle 为 shared_matrix 的共享句柄"""
+    path, dtype, shape, offset = handle
+    matrix = np.memmap(path, dtype=dtype, mode='r', shape=shape, offset=offset)
+    return blocked_category_sums(
+        matrix[:, start:end + 1], rows, codes, n_categories, days_per_block or end - start, mask=mask
+    )
+
+
+def _sum_by_category(log_ratio, valid, codes, n_categories):
+    """按分类编码对行求和，得到 分类×日期 的对数比之和与有效商品数"""
+    return (
+        _reduce_by_category(log_ratio, codes, n_categories),
+        _reduce_by_category(valid.astype(np.int64), codes, n_categories),
+    )
+
+
+def _reduce_by_category(values, codes, n_categories):
+    """按分类编码对行分段求和，得到 分类×日期 的数组，没有商品的分类为 0"""
+    result = np.zeros((n_categories, values.shape[1]), dtype=values.dtype)
+    if len(codes) == 0:
+        return result
+
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    result[sorted_codes[starts]] = np.add.reduceat(values[order], starts, axis=0)
+    return result
+
+
+def price_events(product_ids, prices, dates, all_dates):
+    """将价格明细整理为价格变动事件，每个商品每天一条，按 (商品, 日期) 排序
+
+    返回 (product_ids, dates, prices, prev_prices)：prev_prices 为同一商品上一条事件的价格，
+    即向前填充后的前一日价格，区间内的首条事件为 NaN。同一商品同一日期有多条记录时取第一条，
+    与 build_price_matrix 保持一致。
+    """
+    import pandas as pd
+    day_index = pd.DatetimeIndex(pd.to_datetime(all_dates)).values.astype('datetime64[D]')
+    prices = as_price64(prices)
+    dates = np.asarray(dates, dtype='datetime64[D]')
+
+    cols = np.searchsorted(day_index, dates)
+    keep = (cols < len(day_index)) & ~np.isnan(prices)
+    keep[keep] = day_index[cols[keep]] == dates[keep]
+    product_ids, cols, prices = np.asarray(product_ids)[keep], cols[keep], prices[keep]
+
+    # 稳定排序，同一商品同一日期的记录保持原有顺序
+    order = np.lexsort((cols, product_ids))
+    product_ids, cols, prices = product_ids[order], cols[order], prices[order]
+    first = np.ones(len(product_ids), dtype=bool)
+    first[1:] = (product_ids[1:] != product_ids[:-1]) | (cols[1:] != cols[:-1])
+    product_ids, cols, prices = product_ids[first], cols[first], prices[first]
+
+    prev_prices = np.full(len(prices), np.nan)
+    same_product = product_ids[1:] == product_ids[:-1]
+    prev_prices[1:][same_product] = prices[:-1][same_product]
+    return product_ids, day_index[cols], prices, prev_prices
+
+
+def last_event_prices(product_ids, prices):
+    """由按 (商品, 日期) 排序的价格变动事件取每个商品最近的价格，返回 (product_ids, last_prices)"""
+    last = np.ones(len(product_ids), dtype=bool)
+    last[:-1] = product_ids[1:] != product_ids[:-1]
+    return product_ids[last], prices[last]
+
+
+def sparse_category_events(product_ids, dates, prices, prev_prices, products, leaf_categories):
+    """将价格变动事件映射到叶子分类，计算每条事件对分类汇总的贡献
+
+    结果格式与 loader.load_category_ratios 相同，可直接交给 event_category_sums：
+    每个 (商品, 分类) 的事件各占一行，商品重复出现在商品表中时事件也重复；
+    不属于任何叶子分类的事件分类为 NaN，只用于判断当日是否有价格数据。
+    事件需按 (商品, 日期) 排序，即 price_events 的结果。
+    """
+    category_ids, _ = leaf_weights(leaf_categories)
+    product_info = products[products['category_id'].isin(category_ids)]
+    info_ids = product_info['product_id'].to_numpy()
+
+    # 按商品表的顺序展开每个商品的事件，分类内的求和顺序与 chained_category_sums 一致
+    starts = np.searchsorted(product_ids, info_ids, side='left')
+    lengths = np.searchsorted(product_ids, info_ids, side='right') - starts
+    offsets = np.cumsum(lengths) - lengths
+    rows = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    unmatched = np.ones(len(product_ids), dtype=bool)
+    unmatched[rows] = False
+    rows = np.r_[rows, np.flatnonzero(unmatched)]
+    event_categories = np.r_[
+        np.repeat(product_info['category_id'].to_numpy(dtype=np.float64), lengths),
+        np.full(unmatched.sum(), np.nan)
+    ]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prev_active = prev_prices > 0
+        valid = prev_active & (prices >= 0)
+        log_sums = np.where(valid, np.log(prices) - np.log(prev_prices), 0.0)
+    active_deltas = (prices > 0).astype(np.int64) - prev_active
+    excluded = (prev_active & (prices < 0)).astype(np.int64)
+    return event_categories, dates[rows], log_sums[rows], active_deltas[rows], excluded[rows]
+
+
+def event_category_sums(category_ids, dates, log_sums, active_deltas, excluded, leaf_categories, all_dates):
+    """由按 分类×日期 汇总的价格变动事件计算分类对数比之和及有效商品数
+
+    有效商品数为前一日价格大于 0 的商品数，由每日变化量沿日期累加得到。
+    返回 (sums, counts, present, weights)，其中 sums、counts 的形状为 (分类数, 日期数 - 1)，
+    与 chained_category_sums 的结果一致。
+    """
+    import pandas as pd
+    day_index = pd.DatetimeIndex(pd.to_datetime(all_dates)).values.astype('datetime64[D]')
+    leaf_ids, weights = leaf_weights(leaf_categories)
+
+    cols = np.searchsorted(day_index, dates)
+    present = np.zeros(len(day_index), dtype=bool)
+    present[cols] = True
+
+    codes = np.searchsorted(leaf_ids, category_ids)
+    is_leaf = codes < len(leaf_ids)
+    is_leaf[is_leaf] = leaf_ids[codes[is_leaf]] == category_ids[is_leaf]
+    codes, cols = codes[is_leaf], cols[is_leaf]
+
+    # bincount 按输入顺序依次累加，同一单元格内的求和顺序与事件顺序一致
+    shape = (len(leaf_ids), len(day_index))
+    cells = codes * len(day_index) + cols
+    size = shape[0] * shape[1]
+    sums = np.bincount(cells, log_sums[is_leaf], minlength=size).reshape(shape)
+    deltas = np.bincount(cells, active_deltas[is_leaf], minlength=size).astype(np.int64).reshape(shape)
+    dropped = np.bincount(cells, excluded[is_leaf], minlength=size).astype(np.int64).reshape(shape)
+
+    active = np.cumsum(deltas, axis=1)
+    counts = active[:, :-1] - dropped[:, 1:]
+    return sums[:, 1:], counts, present, weights
+
+
+def weighted_cpi(sums, counts, weights, day_valid):
+    """由分类对数比之和计算加权CPI
+
+    分类指数为对数均值的指数；当日没有有效商品的分类不参与加权，
+    当日全部分类均无有效商品或 day_valid 为 False 时结果为 NaN。
+    """
+    has_data = counts > 0
+    cpi = np.where(has_data, category_index(sums, counts) * weights[:, None], 0.0).sum(axis=0)
+    cpi = np.round(cpi, 4)
+    return np.where(day_valid & has_data.any(axis=0), cpi, np.nan)
+
+
+def scenario_cpi(index, weight_matrix, day_valid):
+    """分类指数（分类×日期）与权重矩阵（分类×方案）相乘，一次得到所有方案的加权CPI（日期×方案）
+
+    规则与 weighted_cpi 相同：当日没有数据的分类不参与加权，
+    当日全部分类均无数据或 day_valid 为 False 时该日所有方案为 NaN。
+    """
+    has_data = ~np.isnan(index)
+    cpi = np.round(np.where(has_data, index, 0.0).T @ weight_matrix, 4)
+    cpi[~(day_valid & has_data.any(axis=0))] = np.nan
+    return cpi
+
+
+def scenario_weights(scenarios, leaf_ids):
+    """将权重方案整理为 叶子分类×方案 的矩阵，行顺序与 leaf_ids 一致
+
+    scenarios 为 DataFrame（行索引为分类ID，每列为一个方案）或 {方案名: {分类ID: 权重}}，
+    方案中未出现的叶子分类权重为 0。返回 (names, weight_matrix)。
+    """
+    import pandas as pd
+    scenarios = pd.DataFrame(scenarios)
+    matrix = scenarios.reindex(leaf_ids).fillna(0.0).to_numpy(dtype=np.float64)
+    return list(scenarios.columns), matrix
+
+
+def category_index(sums, counts):
+    """分类每日指数（对数均值的指数），当日没有有效商品的分类为 NaN"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, np.exp(sums / counts), np.nan)
+
+
+def cumulative_index(daily):
+    """沿日期方向（axis=0）累乘日指数，跳过 NaN，与 dropna().cumprod() 的结果一致"""
+    return np.where(np.isnan(daily), np.nan, np.nancumprod(daily, axis=0))
+
+
+INDEX_FORMULAS = (
+    'jevons_fixed', 'jevons_chained', 'dutot_fixed', 'dutot_chained', 'carli_fixed', 'carli_chained', 'geks'
+)
+
+
+# 各指数公式所需的分类统计量（Jevons 的 log_sums / counts 总是计算）
+FORMULA_STATS = {
+    'jevons': (),
+    'dutot': ('base_sums', 'current_sums'),
+    'carli': ('ratio_sums',),
+}
+
+
+def price_relative_sums(base, current, codes, n_categories, formulas=tuple(FORMULA_STATS)):
+    """按分类汇总各指数公式所需的统计量，base、current 为 float64 价格（可广播）
+
+    参与计算的商品与 Jevons 一致：基期价格大于 0 且当期价格不小于 0。
+    只计算 formulas（'jevons'、'dutot'、'carli'）需要的统计量，逐项求和，
+    临时数组不超过两个 商品×日期 大小。返回字典，各项形状均为 (分类数, 日期数)：
+    - log_sums / counts: 对数价格比之和及有效商品数（Jevons）
+    - ratio_sums: 价格比之和（Carli）
+    - base_sums / current_sums: 基期与当期价格之和（Dutot）
+    """
+    needed = {name for formula in formulas for name in FORMULA_STATS[formula]}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        valid = (base > 0) & (current >= 0)
+        stats = dict(zip(('log_sums', 'counts'), _sum_by_category(
+            np.where(valid, np.log(current) - np.log(base), 0.0), valid, codes, n_categories
+        )))
+        if 'ratio_sums' in needed:
+            stats['ratio_sums'] = _reduce_by_category(np.where(valid, current / base, 0.0), codes, n_categories)
+    if 'base_sums' in needed:
+        stats['base_sums'] = _reduce_by_category(np.where(valid, base, 0.0), codes, n_categories)
+    if 'current_sums' in needed:
+        stats['current_sums'] = _reduce_by_category(np.where(valid, current, 0.0), codes, n_categories)
+    return stats
+
+
+def blocked_price_relative_sums(price_matrix, rows, codes, n_categories, days_per_block, fixed_base=False,
+                                formulas=tuple(FORMULA_STATS)):
+    """按日期分块计算 price_relative_sums，价格矩阵可为 float32 或内存映射文件
+
+    链式计算每块额外带上前一日作为基期，返回的各项形状为 (分类数, 日期数 - 1)；
+    定基计算以第 0 列为基期，形状为 (分类数, 日期数)。每块只将 rows×days_per_block 的价格转换为 float64，
+    各日期的结果互不影响，与整体计算的结果逐位一致。
+    """
+    n_days = price_matrix.shape[1]
+    if fixed_base:
+        base = as_price64(price_matrix[rows, :1])
+        results = [
+            price_relative_sums(
+                base, as_price64(price_matrix[rows, start:start + days_per_block]), codes, n_categories, formulas
+            )
+            for start in range(0, max(n_days, 1), days_per_block)
+        ]
+    else:
+        results = []
+        for start in range(0, max(n_days - 1, 1), days_per_block):
+            block = as_price64(price_matrix[rows, start:start + days_per_block + 1])
+            results.append(price_relative_sums(block[:, :-1], block[:, 1:], codes, n_categories, formulas))
+    return {name: np.concatenate([result[name] for result in results], axis=1) for name in results[0]}
+
+
+def formula_category_index(stats, formula):
+    """由 price_relative_sums 的结果计算分类指数，formula 为 'jevons'、'dutot' 或 'carli'
+
+    当日没有有效商品的分类为 NaN。
+    """
+    counts = stats['counts']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if formula == 'jevons':
+            return category_index(stats['log_sums'], counts)
+        if formula == 'dutot':
+            return np.where(counts > 0, stats['current_sums'] / stats['base_sums'], np.nan)
+        if formula == 'carli':
+            return np.where(counts > 0, stats['ratio_sums'] / counts, np.nan)
+    raise ValueError(f"未知的指数公式：{formula}")
+
+
+def weighted_index(index, weights, day_valid):
+    """分类指数（分类×日期）按权重加权，NaN 的分类不参与加权，其余规则与 weighted_cpi 相同"""
+    has_data = ~np.isnan(index)
+    cpi = np.where(has_data, index * weights[:, None], 0.0).sum(axis=0)
+    cpi = np.round(cpi, 4)
+    return np.where(day_valid & has_data.any(axis=0), cpi, np.nan)
+
+
+def geks_category_index(price_matrix, rows, codes, n_categories):
+    """计算每个分类相对第 0 日的 GEKS-Jevons 多边指数，返回形状为 (分类数, 日期数)
+
+    任意两日 l、t 之间的双边 Jevons 指数只使用两日价格均大于 0 的商品，
+    第 t 日的指数为 ln P(0,t) = mean_l [ln P(l,t) - ln P(l,0)]，只对两项均有定义的 l 取平均。
+    每个分类需要 日期数×日期数 的矩阵乘法，适合一年以内的窗口；对数价格逐个分类由价格矩阵的 rows 行读取，
+    临时数组只有一个分类的大小。
+    """
+    n_days = price_matrix.shape[1]
+    index = np.full((n_categories, n_days), np.nan)
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(codes) else []
+    for start, end in zip(starts, np.r_[starts[1:], len(codes)]):
+        log_prices = log_price_block(price_matrix, rows[order[start:end]], 0, n_days)
+        valid = log_prices > -np.inf
+        values = np.where(valid, log_prices, 0.0)
+        valid = valid.astype(np.float64)
+        # totals[l, t] 为 l、t 两日均有价格的商品在第 t 日的对数价格之和，matched[l, t] 为商品数
+        totals = valid.T @ values
+        matched = valid.T @ valid
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bilateral = np.where(matched > 0, (totals - totals.T) / matched, np.nan)
+        # 第 0 列为 ln P(l,0)
+        links = bilateral - bilateral[:, :1]
+        defined = ~np.isnan(links)
+        with np.errstate(invalid='ignore'):
+            mean_links = np.where(defined, links, 0.0).sum(axis=0) / defined.sum(axis=0)
+        index[sorted_codes[start]] = np.exp(mean_links)
+    return index
+
+
+class CategoryRollup:
+    """分类树逐层汇总
+
+    构造时由 tree.CategoryTree 预先计算每一层 子节点→父节点 的索引数组，汇总时每层只需一次分段求和。
+    父节点指数为当日有数据的子节点指数按权重的加权平均，权重为子节点在本层的权重。
+    leaf_ids 为参与计算的叶子分类，默认为树的全部叶子。
+    """
+
+    def __init__(self, tree, leaf_ids=None):
+        self.node_ids = tree.node_ids
+        self.weights = tree.weights
+        self.leaf_pos = tree.position(tree.leaf_ids if leaf_ids is None else leaf_ids)
+
+        # 自底向上按深度记录 (子节点位置, 分段起点, 父节点位置)，CSR 中的子节点已按父节点排序
+        self.steps = []
+        for depth in range(tree.max_depth, 0, -1):
+            children = tree.children[tree.depth[tree.children] == depth]
+            child_parents = tree.parent[children]
+            starts = np.flatnonzero(np.r_[True, child_parents[1:] != child_parents[:-1]])
+            self.steps.append((children, starts, child_parents[starts]))
+
+    def apply(self, leaf_index):
+        """由叶子分类指数（叶子分类×日期）计算全部节点的指数（节点×日期）"""
+        index = np.full((len(self.node_ids), leaf_index.shape[1]), np.nan)
+        index[self.leaf_pos] = leaf_index
+
+        for children, starts, parents in self.steps:
+            values = index[children]
+            has_data = ~np.isnan(values)
+            weights = np.where(has_data, self.weights[children][:, None], 0.0)
+            numerator = np.add.reduceat(np.where(has_data, values, 0.0) * weights, starts, axis=0)
+            denominator = np.add.reduceat(weights, starts, axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                index[parents] = np.where(denominator > 0, numerator / denominator, np.nan)
+        return index
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from engine import (
+    weighted_cpi, category_index, cumulative_index, scenario_cpi, scenario_weights, CategoryRollup
+)
+
+# 分类指数产物的格式版本，计算口径或存储格式变化时递增，旧版本的产物不再命中
+FORMAT_VERSION = 1
+
+
+def input_fingerprint(start_date, end_date, price_summary, products, leaf_ids, options=None):
+    """计算分类指数所用输入数据的指纹（SHA-256 十六进制）
+
+    price_summary 为价格数据的摘要（可 JSON 序列化），通常由数据源的 price_summary 给出，
+    不需要读取价格明细；其余部分为日期区间、商品→分类映射、叶子分类集合以及影响计算口径的选项
+    （如数据质量规则）。权重不参与指纹，只改变权重时可以直接复用已有的分类指数。
+    """
+    digest = hashlib.sha256()
+    header = {
+        'version': FORMAT_VERSION,
+        'start_date': str(start_date),
+        'end_date': str(end_date),
+        'prices': price_summary,
+        'options': options or {},
+    }
+    digest.update(json.dumps(header, sort_keys=True, default=str).encode('utf-8'))
+    for values in (
+        products['product_id'].to_numpy(dtype=np.int64),
+        products['category_id'].to_numpy(dtype=np.int64),
+        np.asarray(leaf_ids, dtype=np.int64),
+    ):
+        digest.update(np.ascontiguousarray(values).data)
+    return digest.hexdigest()
+
+
+def rebase(levels, base_date, base_value=1.0):
+    """将指数水平（Series 或 DataFrame，行为日期）换算为以 base_date 为基期、基期值为 base_value 的水平"""
+    return levels / levels.loc[base_date] * base_value
+
+
+class CategoryIndex:
+    """叶子分类×日期 的基本指数数据，可复用的计算产物
+
+    保存各叶子分类每日对数价格比之和 sums 及有效商品数 counts（形状均为 分类数×(日期数 - 1)），
+    分类指数、加权CPI、分类树汇总、多组权重方案和累计指数都可以由它直接得到，不需要重新加载商品价格。
+    weights 为计算时的叶子分类权重；panel 为 (product_ids, last_prices)，用于保存增量计算的检查点，可为 None。
+    """
+
+    def __init__(self, dates, leaf_ids, sums, counts, present, weights, panel=None, fingerprint=None,
+                 created=None, version=FORMAT_VERSION):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.leaf_ids = np.asarray(leaf_ids, dtype=np.int64)
+        self.sums = sums
+        self.counts = counts
+        self.present = np.asarray(present, dtype=bool)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.panel = panel
+        self.fingerprint = fingerprint
+        self.created = created
+        self.version = version
+
+    @property
+    def index_dates(self):
+        """结果使用的日期索引（datetime.date），与计算器的输出一致"""
+        return self.dates.astype(object)
+
+    @property
+    def day_valid(self):
+        """每个环比日（第 1 日起）当日及前一日是否都有价格数据"""
+        return self.present[:-1] & self.present[1:]
+
+    def category_index(self):
+        """叶子分类每日环比指数（分类×日期），当日没有有效商品的分类为 NaN"""
+        return category_index(self.sums, self.counts)
+
+    def leaf_weights(self, weights=None):
+        """按 leaf_ids 排列的权重；weights 为 {分类ID: 权重} 或 Series，未列出的分类权重为 0，为 None 时使用计算时的权重"""
+        import pandas as pd
+        if weights is None:
+            return self.weights
+        return scenario_weights({'weight': pd.Series(weights, dtype=np.float64)}, self.leaf_ids)[1][:, 0]
+
+    def daily_cpi(self, weights=None):
+        """每日环比CPI，第一天为 NaN；只保留部分叶子分类时，在 weights 中省略其余分类即可"""
+        import pandas as pd
+        daily = weighted_cpi(self.sums, self.counts, self.leaf_weights(weights), self.day_valid)
+        return pd.Series(np.r_[np.nan, daily], index=self.index_dates, dtype='float64')
+
+    def cumulative_cpi(self, weights=None):
+        """累计CPI，无效的日期不计入"""
+        return self.daily_cpi(weights).dropna().cumprod()
+
+    def scenario_cpi(self, scenarios):
+        """多组权重方案的每日环比CPI（行为日期，列为方案），scenarios 的格式见 engine.scenario_weights"""
+        import pandas as pd
+        names, weight_matrix = scenario_weights(scenarios, self.leaf_ids)
+        daily = scenario_cpi(self.category_index(), weight_matrix, self.day_valid)
+        return pd.DataFrame(
+            np.vstack([np.full(len(names), np.nan), daily]),
+            index=self.index_dates,
+            columns=names
+        )
+
+    def rollup(self, tree):
+        """分类树全部节点的每日环比指数（行为日期，列为分类ID），tree 为 tree.CategoryTree"""
+        import pandas as pd
+        rollup = CategoryRollup(tree, self.leaf_ids)
+        node_index = rollup.apply(self.category_index())
+        node_index[:, ~self.day_valid] = np.nan
+        return pd.DataFrame(
+            np.vstack([np.full(len(rollup.node_ids), np.nan), np.round(node_index, 4).T]),
+            index=self.index_dates,
+            columns=rollup.node_ids
+        )
+
+    @staticmethod
+    def cumulative(daily):
+        """将每日环比指数（DataFrame，行为日期）累乘为累计指数，跳过 NaN"""
+        import pandas as pd
+        return pd.DataFrame(cumulative_index(daily.to_numpy()), index=daily.index, columns=daily.columns)
+
+
+class IndexStore:
+    """CategoryIndex 的本地存储，按输入数据指纹保存，每个产物一个 .npz 文件
+
+    文件名为 <指纹>.npz，文件内记录格式版本、生成时间和日期区间；格式版本不一致的产物视为不存在。
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, fingerprint):
+        return self.directory / f'{fingerprint}.npz'
+
+    def get(self, fingerprint):
+        """读取指纹对应的产物，不存在或版本不一致时返回 None"""
+        path = self.path(fingerprint)
+        if not path.exists():
+            return None
+        return self._read(path)
+
+    def put(self, artifact):
+        """保存产物，先写临时文件再替换"""
+        arrays = {
+            'dates': artifact.dates,
+            'leaf_ids': artifact.leaf_ids,
+            'sums': artifact.sums,
+            'counts': artifact.counts,
+            'present': artifact.present,
+            'weights': artifact.weights,
+        }
+        if artifact.panel is not None:
+            arrays['panel_ids'], arrays['panel_prices'] = artifact.panel
+        meta = {
+            'version': artifact.version,
+            'fingerprint': artifact.fingerprint,
+            'created': artifact.created or datetime.now().isoformat(timespec='seconds'),
+        }
+        path = self.path(artifact.fingerprint)
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    def latest(self, start_date=None, end_date=None):
+        """最近生成的、日期区间与给定区间相同的产物（未指定区间时不限），没有时返回 None
+
+        用于在新的会话中直接由已保存的分类指数重新汇总，不加载价格、不计算指纹。
+        """
+        for path in sorted(self.directory.glob('*.npz'), key=lambda path: path.stat().st_mtime, reverse=True):
+            artifact = self._read(path)
+            if artifact is None or len(artifact.dates) == 0:
+                continue
+            if start_date is not None and artifact.dates[0] != np.datetime64(start_date, 'D'):
+                continue
+            if end_date is not None and artifact.dates[-1] != np.datetime64(end_date, 'D'):
+                continue
+            return artifact
+        return None
+
+    @staticmethod
+    def _read(path):
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].item())
+            if meta['version'] != FORMAT_VERSION:
+                return None
+            panel = (data['panel_ids'], data['panel_prices']) if 'panel_ids' in data.files else None
+            return CategoryIndex(
+                data['dates'], data['leaf_ids'], data['sums'], data['counts'], data['present'], data['weights'],
+                panel=panel, fingerprint=meta['fingerprint'], created=meta['created'], version=meta['version']
+            )
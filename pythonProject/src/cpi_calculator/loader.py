@@ -0,0 +1,207 @@
+import hashlib
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+# price 为 DECIMAL(12,2)，clickhouse_driver 的 NumPy 列没有 Decimal 类型，需在查询中转换为浮点数；
+# 同一商品同一日期有多条记录时计算取第一条，按价格排序使其确定为价格最低的一条，与 CATEGORY_RATIO_QUERY 的 min(price) 一致
+PRICE_QUERY = """
+    SELECT product_id, toFloat32(price) AS price, toDate(date) AS date
+    FROM prices
+    WHERE toDate(date) BETWEEN %(start_date)s AND %(end_date)s
+    ORDER BY product_id, date, price
+"""
+
+
+def month_ranges(start_date: date, end_date: date):
+    """将日期区间按自然月切分，逐个返回 (月初或区间起点, 月末或区间终点)"""
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        next_month = (chunk_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        chunk_end = min(next_month - timedelta(days=1), end_date)
+        yield chunk_start, chunk_end
+        chunk_start = next_month
+
+
+def empty_prices():
+    """返回空的价格数组三元组"""
+    return (
+        np.empty(0, dtype=np.int64),
+        np.empty(0, dtype=np.float32),
+        np.empty(0, dtype='datetime64[D]'),
+    )
+
+
+def to_price_arrays(product_ids, prices, dates):
+    """将列式查询结果转换为类型确定的数组：int64 商品ID、float32 价格、datetime64[D] 日期"""
+    import pandas as pd
+    return (
+        np.asarray(product_ids, dtype=np.int64),
+        np.asarray(prices, dtype=np.float32),
+        pd.to_datetime(np.asarray(dates)).values.astype('datetime64[D]'),
+    )
+
+
+def query_prices(client, start_date: date, end_date: date):
+    """以 BETWEEN 条件查询一段日期的价格，结果以列式 NumPy 数组返回，避免逐行构造 Python 元组"""
+    columns = client.execute(
+        PRICE_QUERY,
+        {'start_date': start_date, 'end_date': end_date},
+        columnar=True,
+        settings={'use_numpy': True}
+    )
+    if not columns:
+        return empty_prices()
+    return to_price_arrays(*columns)
+
+
+def iter_price_chunks(client, start_date: date, end_date: date):
+    """按月分块查询价格，逐块返回 (块起点, 块终点, 价格数组)"""
+    for chunk_start, chunk_end in month_ranges(start_date, end_date):
+        yield chunk_start, chunk_end, query_prices(client, chunk_start, chunk_end)
+
+
+def prefetch_chunks(load, ranges, depth=1):
+    """在后台线程中预取后续日期块的数据，逐块返回 (块起点, 块终点, load(块起点, 块终点))
+
+    当前块交给调用方处理的同时，后续最多 depth 块已在加载或已加载完毕，
+    内存中同时存在的块数不超过 depth + 1。加载在同一个后台线程中依次进行，
+    数据库客户端不会被并发使用。调用方提前结束迭代时，尚未开始的加载会被取消。
+    """
+    ranges = iter(ranges)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        try:
+            for chunk_start, chunk_end in ranges:
+                pending.append((chunk_start, chunk_end, executor.submit(load, chunk_start, chunk_end)))
+                if len(pending) >= depth:
+                    break
+            while pending:
+                chunk_start, chunk_end, future = pending.popleft()
+                arrays = future.result()
+                # 先提交下一块的加载，再把当前块交给调用方
+                for next_start, next_end in ranges:
+                    pending.append((next_start, next_end, executor.submit(load, next_start, next_end)))
+                    break
+                yield chunk_start, chunk_end, arrays
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+
+def filter_dates(arrays, start_date: date, end_date: date):
+    """从价格数组中筛选日期区间内的记录"""
+    product_ids, prices, dates = arrays
+    mask = (dates >= np.datetime64(start_date, 'D')) & (dates <= np.datetime64(end_date, 'D'))
+    return product_ids[mask], prices[mask], dates[mask]
+
+
+def concat_prices(chunks):
+    """拼接多个价格数组三元组"""
+    chunks = list(chunks)
+    if not chunks:
+        return empty_prices()
+    return tuple(np.concatenate(parts) for parts in zip(*chunks))
+
+
+def load_prices(client, start_date: date, end_date: date):
+    """加载日期区间内的价格数据，返回 (product_ids, prices, dates) 数组"""
+    return concat_prices(arrays for _, _, arrays in iter_price_chunks(client, start_date, end_date))
+
+
+def price_digest(arrays):
+    """价格数组的 SHA-256 摘要（十六进制），与记录顺序有关（同一商品同一日期取第一条记录）"""
+    digest = hashlib.sha256()
+    product_ids, prices, dates = arrays
+    for values in (
+        np.asarray(product_ids, dtype=np.int64),
+        np.asarray(prices, dtype=np.float32),
+        np.asarray(dates, dtype='datetime64[D]').astype(np.int64),
+    ):
+        digest.update(np.ascontiguousarray(values).data)
+    return digest.hexdigest()
+
+
+PRICE_SUMMARY_QUERY = """
+    SELECT
+        toStartOfMonth(toDate(date)) AS month,
+        count() AS rows,
+        max(toDate(date)) AS last_date,
+        sum(cityHash64(product_id, toFloat32(price), toDate(date))) AS checksum
+    FROM prices
+    WHERE toDate(date) BETWEEN %(start_date)s AND %(end_date)s
+    GROUP BY month
+    ORDER BY month
+"""
+
+
+def load_price_summary(client, start_date: date, end_date: date):
+    """按月汇总日期区间内的价格记录：[(月份, 记录数, 最后日期, 校验和), ...]
+
+    只返回每月一行，用于判断价格数据是否变化，不传输价格明细。校验和为各行哈希之和，与记录顺序无关。
+    """
+    rows = client.execute(PRICE_SUMMARY_QUERY, {'start_date': start_date, 'end_date': end_date})
+    return [(str(month), int(count), str(last_date), int(checksum)) for month, count, last_date, checksum in rows]
+
+
+CATEGORY_RATIO_QUERY = """
+    WITH
+    daily AS (
+        SELECT product_id, toDate(date) AS d, round(toFloat64(min(price)), 2) AS day_price
+        FROM prices
+        WHERE toDate(date) BETWEEN %(start_date)s AND %(end_date)s AND price IS NOT NULL
+        GROUP BY product_id, d
+    ),
+    events AS (
+        SELECT
+            product_id,
+            d,
+            day_price AS price,
+            lagInFrame(toNullable(day_price)) OVER (
+                PARTITION BY product_id ORDER BY d ASC
+                ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+            ) AS prev_price
+        FROM daily
+    )
+    SELECT
+        p.category_id,
+        e.d AS date,
+        sumIf(log(e.price) - log(e.prev_price), e.prev_price > 0 AND e.price >= 0) AS log_sum,
+        sum((e.price > 0) - ifNull(e.prev_price > 0, 0)) AS active_delta,
+        countIf(e.prev_price > 0 AND e.price < 0) AS excluded
+    FROM events AS e
+    LEFT JOIN products AS p ON e.product_id = p.product_id
+    GROUP BY p.category_id, e.d
+"""
+
+
+def load_category_ratios(client, start_date: date, end_date: date):
+    """在 ClickHouse 端按 分类×日期 汇总价格变动事件
+
+    每个商品的前一价格由窗口函数 lagInFrame 取得，即区间内向前填充后的前一日价格。
+    同一商品同一日期有多条记录时取价格最低的一条，与 PRICE_QUERY 排序后取第一条的结果一致。
+    返回 (category_ids, dates, log_sums, active_deltas, excluded) 数组：
+    - log_sums: 当日有价格记录且前一价格大于 0 的商品的对数价格比之和
+    - active_deltas: 前一价格大于 0 的商品数在当日的变化量
+    - excluded: 前一价格大于 0 但当日价格为负、不参与计算的商品数
+    未匹配到商品信息的价格记录仍会返回（分类为默认值或 NULL），用于判断当日是否有价格数据。
+    """
+    import pandas as pd
+    columns = client.execute(
+        CATEGORY_RATIO_QUERY,
+        {'start_date': start_date, 'end_date': end_date},
+        columnar=True,
+        settings={'use_numpy': True}
+    )
+    if not columns:
+        columns = [[], [], [], [], []]
+    category_ids, dates, log_sums, active_deltas, excluded = columns
+    return (
+        # 分类可能为 NULL，统一转为 float64，NULL 转为 NaN
+        np.asarray(category_ids, dtype=np.float64),
+        pd.to_datetime(np.asarray(dates)).values.astype('datetime64[D]'),
+        np.asarray(log_sums, dtype=np.float64),
+        np.asarray(active_deltas, dtype=np.int64),
+        np.asarray(excluded, dtype=np.int64),
+    )
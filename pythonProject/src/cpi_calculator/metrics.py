@@ -0,0 +1,107 @@
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+logger = logging.getLogger('cpi_calculator')
+
+
+def max_rss_bytes():
+    """进程的常驻内存峰值（字节），平台不支持时返回 None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """以单行 JSON 输出结构化日志"""
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({'event': event, **fields}, ensure_ascii=False, default=str))
+
+
+class Metrics:
+    """一次计算的阶段指标
+
+    每个阶段记录墙钟时间、CPU 时间、调用次数以及阶段内登记的行数、字节数等计数；
+    trace_memory 为 True 时用 tracemalloc 记录阶段内的内存峰值（有额外开销），
+    否则只记录进程的常驻内存峰值。阶段结束时输出一条结构化日志。
+    阶段可以在后台线程中记录（如流水线模式的预取），内存峰值只在主线程的阶段中统计。
+    """
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个阶段，yield 的字典用于登记计数，例如 counters['rows'] = n
+
+        同名阶段多次出现时（如逐日续算）耗时和计数累加，内存峰值取最大值。
+        """
+        counters = {}
+        # tracemalloc 是进程级的，后台线程的阶段不统计内存峰值，避免与主线程的阶段互相干扰
+        trace_memory = self.trace_memory and threading.current_thread() is threading.main_thread()
+        started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if trace_memory:
+            tracemalloc.reset_peak()
+            base_memory = tracemalloc.get_traced_memory()[0]
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield counters
+        finally:
+            record = {
+                'wall_seconds': time.perf_counter() - wall,
+                'cpu_seconds': time.process_time() - cpu,
+                **counters,
+            }
+            if trace_memory:
+                record['peak_bytes'] = tracemalloc.get_traced_memory()[1] - base_memory
+                if started_tracing:
+                    tracemalloc.stop()
+            self._merge(name, record)
+            log_event('stage', run=self.name, stage=name, **record)
+
+    def _merge(self, name, record):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'calls': 0})
+            stage['calls'] += 1
+            for key, value in record.items():
+                if key == 'peak_bytes':
+                    stage[key] = max(stage.get(key, 0), value)
+                else:
+                    stage[key] = stage.get(key, 0) + value
+
+    def as_dict(self):
+        return {
+            'run': self.name,
+            'wall_seconds': time.perf_counter() - self.started,
+            'max_rss_bytes': max_rss_bytes(),
+            'stages': self.stages,
+        }
+
+    def log_summary(self):
+        """输出整次计算的汇总日志，返回汇总字典"""
+        summary = self.as_dict()
+        log_event('summary', **summary)
+        return summary
+
+
+def array_bytes(*arrays):
+    """数组占用的字节数之和"""
+    return int(sum(getattr(array, 'nbytes', 0) for array in arrays))
@@ -0,0 +1,100 @@
+import numpy as np
+from engine import log_price_block, category_index
+
+
+class QualityRules:
+    """价格面板的数据质量规则，整个区间一次性向量化检查，结果为引擎直接使用的布尔掩码
+
+    - 去重：同一商品同一日期只保留第一条有效记录，价格缺失或不大于 0 的记录视为无效并剔除
+      （与 clean.py 的口径一致，剔除后该日沿用之前的价格）
+    - max_jump: 相邻两日价格之比超过 max_jump 倍（或低于 1 / max_jump）时标记为异常跳变，该日价格比不参与计算
+    - min_products: 分类当日有效商品数少于该值时，该分类当日以其余分类的加权平均指数填补
+      （即在商品数足够的分类间重新归一化权重）
+    价格明细只记录价格变动，没有记录的日期沿用之前的价格，因此不按记录间隔判断商品退出。
+    为 None 的规则不检查。
+    """
+
+    def __init__(self, max_jump=None, min_products=1):
+        if max_jump is not None and max_jump <= 1:
+            raise ValueError("max_jump 需大于 1")
+        self.max_jump = max_jump
+        self.min_products = min_products
+
+
+def deduplicate(product_ids, prices, dates):
+    """价格明细的去重及有效性检查
+
+    返回 (keep, report)：keep 为保留的记录，每个 (商品, 日期) 至多保留一条价格大于 0 的记录（取第一条）；
+    report 统计无效价格数、重复记录数，以及重复记录中价格与保留记录不一致的条数。
+    """
+    product_ids = np.asarray(product_ids)
+    prices = np.asarray(prices, dtype=np.float64)
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    with np.errstate(invalid='ignore'):
+        valid = prices > 0
+
+    # 稳定排序，同一商品同一日期的记录保持原有顺序
+    candidates = np.flatnonzero(valid)
+    order = candidates[np.lexsort((dates[candidates], product_ids[candidates]))]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (product_ids[order][1:] != product_ids[order][:-1]) | (dates[order][1:] != dates[order][:-1])
+
+    keep = np.zeros(len(prices), dtype=bool)
+    keep[order[first]] = True
+    # 每条重复记录对应的保留记录
+    kept = order[np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))]
+    duplicates = order[~first]
+    report = {
+        'rows': len(prices),
+        'invalid_prices': int((~valid).sum()),
+        'duplicates': len(duplicates),
+        'conflicting_duplicates': int((prices[duplicates] != prices[kept[~first]]).sum()),
+    }
+    return keep, report
+
+
+def jump_flags(log_prices, max_jump):
+    """相邻两日对数价格之差超过 log(max_jump) 的异常跳变，形状为 (商品数, 日期数 - 1)"""
+    with np.errstate(invalid='ignore'):
+        return np.abs(log_prices[:, 1:] - log_prices[:, :-1]) > np.log(max_jump)
+
+
+def chained_ratio_mask(price_matrix, rows, rules, days_per_block=None):
+    """链式价格比的有效掩码，形状为 (len(rows), 日期数 - 1)，返回 (mask, report)；不检查跳变时 mask 为 None
+
+    price_matrix 为向前填充后的价格矩阵，rows 为参与计算的行，当日没有异常跳变时为 True。
+    对数价格按 days_per_block 天分块计算，价格矩阵为内存映射文件时临时数组不超过一块的大小。
+    """
+    if rules.max_jump is None:
+        return None, {}
+    n_days = price_matrix.shape[1]
+    mask = np.ones((len(rows), max(n_days - 1, 0)), dtype=bool)
+    jumps = 0
+    days_per_block = days_per_block or max(n_days - 1, 1)
+    for start in range(0, max(n_days - 1, 0), days_per_block):
+        end = min(start + days_per_block, n_days - 1)
+        block_jumps = jump_flags(log_price_block(price_matrix, rows, start, end + 1), rules.max_jump)
+        jumps += int(block_jumps.sum())
+        mask[:, start:end] = ~block_jumps
+    return mask, {'jumps': jumps}
+
+
+def apply_min_products(sums, counts, weights, min_products):
+    """有效商品数少于 min_products 的 分类×日期 以当日其余分类的加权平均指数填补，返回 (sums, counts, 填补的单元数)
+
+    填补后的加权CPI等于只在商品数足够的分类间重新归一化权重的结果，分类汇总和其他权重方案也使用填补后的指数；
+    当日全部分类的商品数都不足时，该日所有分类计数置 0，结果为 NaN。
+    """
+    thin = (counts > 0) & (counts < min_products)
+    if not thin.any():
+        return sums, counts, 0
+    kept = (counts > 0) & ~thin
+    index = np.where(kept, category_index(sums, counts), 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (index * weights[:, None]).sum(axis=0) / np.where(kept, weights[:, None], 0.0).sum(axis=0)
+        log_mean = np.log(mean)
+    fill = thin & kept.any(axis=0)
+    # 填补的单元计为 1 件商品，对数比之和即填补指数的对数
+    sums = np.where(fill, log_mean, sums)
+    counts = np.where(fill, 1, np.where(thin, 0, counts))
+    return sums, counts, int(thin.sum())
@@ -0,0 +1,145 @@
+import os
+import numpy as np
+from pathlib import Path
+
+CPI_DAILY_DDL = """
+CREATE TABLE IF NOT EXISTS {table}
+(
+    name String,
+    series String,
+    date Date,
+    value Float64
+)
+ENGINE = ReplacingMergeTree
+ORDER BY (name, series, date)
+"""
+
+
+def as_frame(result):
+    """将结果统一为 DataFrame，Series 的列名为其 name，未命名时为 'cpi'"""
+    import pandas as pd
+    if isinstance(result, pd.Series):
+        return result.to_frame('cpi' if result.name is None else result.name)
+    return result
+
+
+class ResultSink:
+    """计算结果输出接口
+
+    name 为结果名（如 'c_daily_cpi'），result 为以日期为索引的 Series 或 DataFrame。
+    append 为 True 时只追加已有结果中尚不存在的日期，重复运行不会写入重复的行。
+    """
+
+    def write(self, name, result, append=False):
+        raise NotImplementedError
+
+
+class CsvSink(ResultSink):
+    """写出到 directory/<name>.csv，格式与原先直接调用 to_csv 的结果相同"""
+
+    def __init__(self, directory='.'):
+        self.directory = Path(directory)
+
+    def path(self, name):
+        return self.directory / f'{name}.csv'
+
+    def write(self, name, result, append=False):
+        import pandas as pd
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(name)
+        if append and path.exists():
+            # 只读取第一列（日期），跳过已写出的日期
+            written = pd.read_csv(path, usecols=[0], dtype=str).iloc[:, 0]
+            result = result[~result.index.astype(str).isin(written)]
+            result.to_csv(path, mode='a', header=False)
+            return
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        result.to_csv(tmp_path, header=True)
+        os.replace(tmp_path, path)
+
+
+class ParquetSink(ResultSink):
+    """写出到 directory/<name>.parquet，列名统一转为字符串，日期索引保存为 date 列"""
+
+    def __init__(self, directory='.'):
+        self.directory = Path(directory)
+
+    def path(self, name):
+        return self.directory / f'{name}.parquet'
+
+    def write(self, name, result, append=False):
+        import pandas as pd
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(name)
+        frame = as_frame(result)
+        frame = frame.set_axis([str(column) for column in frame.columns], axis=1)
+        frame = frame.rename_axis('date').reset_index()
+        frame['date'] = pd.to_datetime(frame['date'])
+        if append and path.exists():
+            existing = pd.read_parquet(path)
+            frame = pd.concat([existing, frame[~frame['date'].isin(existing['date'])]], ignore_index=True)
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+
+class ClickHouseSink(ResultSink):
+    """按列批量写入 ClickHouse 的 cpi_daily 表
+
+    结果转为长表 (name, series, date, value)，series 为结果的列名（Series 为 'cpi'），
+    值为 NaN 的行不写入。表使用 ReplacingMergeTree，相同 (name, series, date) 的重复写入在合并时去重；
+    append 为 True 时还会先查询已写入的日期，只插入新的日期。
+    """
+
+    def __init__(self, client, table='cpi_daily', batch_size=100000):
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+
+    def create_table(self):
+        self.client.execute(CPI_DAILY_DDL.format(table=self.table))
+
+    def written_dates(self, name):
+        rows = self.client.execute(
+            f"SELECT DISTINCT date FROM {self.table} WHERE name = %(name)s",
+            {'name': name}
+        )
+        return {row[0] for row in rows}
+
+    def write(self, name, result, append=False):
+        import pandas as pd
+        frame = as_frame(result)
+        dates = pd.to_datetime(pd.Index(frame.index)).date
+        if append:
+            keep = ~np.isin(dates, list(self.written_dates(name)))
+            frame, dates = frame[keep], dates[keep]
+
+        values = frame.to_numpy(dtype=np.float64)
+        series = np.array([str(column) for column in frame.columns], dtype=object)
+        # 按列展开为长表：列优先，每个 series 的日期连续
+        rows_series = np.repeat(series, len(frame))
+        rows_dates = np.tile(np.asarray(dates, dtype=object), len(series))
+        rows_values = values.T.ravel()
+        valid = ~np.isnan(rows_values)
+        rows_series, rows_dates, rows_values = rows_series[valid], rows_dates[valid], rows_values[valid]
+
+        query = f"INSERT INTO {self.table} (name, series, date, value) VALUES"
+        for start in range(0, len(rows_values), self.batch_size):
+            end = start + self.batch_size
+            self.client.execute(
+                query,
+                [[name] * len(rows_values[start:end]), rows_series[start:end].tolist(),
+                 rows_dates[start:end].tolist(), rows_values[start:end].tolist()],
+                columnar=True
+            )
+
+
+class MultiSink(ResultSink):
+    """同时写出到多个输出"""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, name, result, append=False):
+        for sink in self.sinks:
+            sink.write(name, result, append)
@@ -0,0 +1,218 @@
+import hashlib
+import re
+from typing import TYPE_CHECKING
+from datetime import date
+from pathlib import Path
+from loader import (
+    load_prices, load_category_ratios, load_price_summary, price_digest, to_price_arrays, filter_dates, concat_prices
+)
+from cache import month_bounds
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+CATEGORY_COLUMNS = ["category_id", "parent", "weight", "is_leaf"]
+PRODUCT_COLUMNS = ["product_id", "category_id"]
+PRICE_COLUMNS = ["product_id", "price", "date"]
+
+
+class DataSource:
+    """数据源接口：分类、商品以及日期区间内的价格"""
+
+    def load_categories(self) -> 'pd.DataFrame':
+        """返回分类表，列为 category_id, parent, weight, is_leaf（即 hierarchy 层级）"""
+        raise NotImplementedError
+
+    def load_products(self) -> 'pd.DataFrame':
+        """返回商品表，列为 product_id, category_id"""
+        raise NotImplementedError
+
+    def load_prices(self, start_date: date, end_date: date):
+        """返回日期区间内的价格，(product_ids, prices, dates) 数组"""
+        raise NotImplementedError
+
+    def load_category_ratios(self, start_date: date, end_date: date):
+        """在数据源端按 分类×日期 汇总价格变动事件，格式见 loader.load_category_ratios"""
+        raise NotImplementedError(f"{type(self).__name__} 不支持服务端计算")
+
+    def price_summary(self, start_date: date, end_date: date):
+        """日期区间内价格数据的摘要（可 JSON 序列化），数据变化时摘要随之变化，不需要读取价格明细
+
+        用于 index_store 的输入指纹；返回 None 表示不支持，此时需要加载全部价格计算指纹。
+        """
+        return None
+
+    def identity(self):
+        """区分不同数据源的标识（字符串），本地缓存按其分开存放；返回 None 表示不支持缓存"""
+        return None
+
+
+class ClickHouseSource(DataSource):
+    """ClickHouse 数据源"""
+
+    def __init__(self, db_config, client=None):
+        self.db_config = db_config
+        self._client = client
+
+    @property
+    def client(self):
+        """ClickHouse 客户端，首次查询时才建立连接"""
+        if self._client is None:
+            self._client = self._connect_clickhouse()
+        return self._client
+
+    def _connect_clickhouse(self):
+        """连接到 ClickHouse 数据库"""
+        import clickhouse_driver
+        return clickhouse_driver.Client(
+            host=self.db_config['HOST'],
+            port=self.db_config['PORT'],
+            user=self.db_config['USER'],
+            password=self.db_config['PASSWORD']
+        )
+
+    def _execute_clickhouse_query(self, query):
+        """执行 ClickHouse 查询"""
+        return self.client.execute(query)
+
+    def load_categories(self):
+        import pandas as pd
+        query = """
+        SELECT
+            category_id,
+            parent,
+            weight,
+            hierarchy AS is_leaf
+        FROM categories
+        """
+        # 显式指定列名，避免隐式转换问题
+        return pd.DataFrame(self._execute_clickhouse_query(query), columns=CATEGORY_COLUMNS)
+
+    def load_products(self):
+        import pandas as pd
+        query = "SELECT product_id, category_id FROM products"
+        return pd.DataFrame(self._execute_clickhouse_query(query), columns=PRODUCT_COLUMNS)
+
+    def load_prices(self, start_date, end_date):
+        return load_prices(self.client, start_date, end_date)
+
+    def load_category_ratios(self, start_date, end_date):
+        return load_category_ratios(self.client, start_date, end_date)
+
+    def price_summary(self, start_date, end_date):
+        return load_price_summary(self.client, start_date, end_date)
+
+    def identity(self):
+        config = self.db_config or {}
+        return f"clickhouse://{config.get('HOST')}:{config.get('PORT')}/{config.get('DATABASE', '')}"
+
+
+class LocalSource(DataSource):
+    """本地 Parquet/CSV 数据源
+
+    目录结构：
+        root/categories.parquet|csv   列 category_id, parent, weight, hierarchy
+        root/products.parquet|csv     列 product_id, category_id
+        root/price/*.parquet|csv      价格分区，至少包含 product_id, price, date 列
+
+    只读取需要的列；分区文件名为 YYYY-MM 或 YYYY-MM-DD（可带 _partNNNN 后缀，同一分区拆分为多个文件）时，
+    按文件名跳过区间外的分区。
+    """
+
+    PARTITION_PATTERN = re.compile(r'(\d{4})-(\d{2})(?:-(\d{2}))?(?:_part\d+)?')
+
+    def __init__(self, root, price_dir='price'):
+        self.root = Path(root)
+        self.price_dir = self.root / price_dir
+
+    def _read(self, path, columns, dtype=None):
+        """按列读取单个 Parquet 或 CSV 文件"""
+        import pandas as pd
+        if path.suffix == '.parquet':
+            return pd.read_parquet(path, columns=columns)
+        return pd.read_csv(path, usecols=columns, dtype=dtype, encoding='utf-8-sig')
+
+    def _read_table(self, name, columns):
+        parquet_path = self.root / f'{name}.parquet'
+        return self._read(parquet_path if parquet_path.exists() else self.root / f'{name}.csv', columns)
+
+    def load_categories(self):
+        df = self._read_table('categories', ["category_id", "parent", "weight", "hierarchy"])
+        return df.rename(columns={'hierarchy': 'is_leaf'})[CATEGORY_COLUMNS]
+
+    def load_products(self):
+        return self._read_table('products', PRODUCT_COLUMNS)[PRODUCT_COLUMNS]
+
+    def partition_span(self, path):
+        """由分区文件名推断其覆盖的日期范围，无法推断时返回 None"""
+        match = self.PARTITION_PATTERN.fullmatch(path.stem)
+        if match is None:
+            return None
+        year, month, day = match.groups()
+        first = date(int(year), int(month), int(day or 1))
+        return (first, first) if day else month_bounds(first)
+
+    def partition_files(self, start_date, end_date):
+        """可能包含日期区间内价格的分区文件（按文件名排序），文件名无法推断日期的分区总是包含在内"""
+        for path in sorted(self.price_dir.glob('*')):
+            if path.suffix not in ('.parquet', '.csv'):
+                continue
+            span = self.partition_span(path)
+            if span is not None and (span[1] < start_date or span[0] > end_date):
+                continue
+            yield path
+
+    def price_summary(self, start_date, end_date):
+        """各分区文件的文件名、大小和修改时间，只读取文件属性"""
+        summary = []
+        for path in self.partition_files(start_date, end_date):
+            stat = path.stat()
+            summary.append((path.name, stat.st_size, stat.st_mtime_ns))
+        return summary
+
+    def identity(self):
+        return f'local:{self.price_dir.resolve()}'
+
+    def load_prices(self, start_date, end_date):
+        chunks = []
+        for path in self.partition_files(start_date, end_date):
+            df = self._read(path, PRICE_COLUMNS, dtype={'product_id': 'int64', 'price': 'float32'})
+            arrays = to_price_arrays(df['product_id'], df['price'], df['date'])
+            chunks.append(filter_dates(arrays, start_date, end_date))
+        return concat_prices(chunks)
+
+
+class MemorySource(DataSource):
+    """内存数据源：分类表、商品表和价格数组直接传入，用于离线测试和基准测试
+
+    prices 为 (product_ids, prices, dates) 数组，或包含 product_id, price, date 列的 DataFrame；
+    同一商品同一日期有多条记录时保持传入的顺序。
+    """
+
+    def __init__(self, categories, products, prices):
+        import pandas as pd
+        self.categories = categories
+        self.products = products
+        if isinstance(prices, pd.DataFrame):
+            prices = (prices['product_id'], prices['price'], prices['date'])
+        self.prices = to_price_arrays(*prices)
+
+    def load_categories(self):
+        return self.categories[CATEGORY_COLUMNS].copy()
+
+    def load_products(self):
+        return self.products[PRODUCT_COLUMNS].copy()
+
+    def load_prices(self, start_date, end_date):
+        return filter_dates(self.prices, start_date, end_date)
+
+    def price_summary(self, start_date, end_date):
+        return price_digest(self.load_prices(start_date, end_date))
+
+    def identity(self):
+        """由价格数组和分类、商品表的内容计算，数据相同的内存数据源共用缓存"""
+        import pandas as pd
+        digest = hashlib.sha256(price_digest(self.prices).encode('utf-8'))
+        for table in (self.load_categories(), self.load_products()):
+            digest.update(pd.util.hash_pandas_object(table, index=False).to_numpy().tobytes())
+        return f'memory:{digest.hexdigest()}'
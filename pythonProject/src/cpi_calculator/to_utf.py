@@ -1,14 +1,98 @@
+import io
 import os
+import sys
+import codecs
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 data_path = Path(__file__).resolve().parent.parent.parent / 'data' / 'data'
-filelist = ['products.csv']  # 需要上传的文件列表
-for file in filelist:
-    src_path = os.path.join(data_path, file)
-    dest_path = os.path.join(data_path, f'utf8_{file}')
+filelist = ['products.csv']  # 默认需要转码的文件列表
 
-    with open(src_path, 'r', encoding='gbk') as f_in, open(dest_path, 'w', encoding='utf-8-sig') as f_out:
-        for line in f_in:
-            f_out.write(line)
+# 每次读取的块大小，多字节字符被块边界截断时由增量解码器保留到下一块
+BLOCK_SIZE = 4 * 1024 * 1024
 
-# 然后将 output_path 上传到 OSS
+
+def transcode_stream(src, dst, source_encoding='gbk', target_encoding='utf-8-sig', block_size=BLOCK_SIZE):
+    """按块将二进制流从 source_encoding 转码为 target_encoding"""
+    decoder = codecs.getincrementaldecoder(source_encoding)()
+    encoder = codecs.getincrementalencoder(target_encoding)()
+    while True:
+        block = src.read(block_size)
+        if not block:
+            break
+        dst.write(encoder.encode(decoder.decode(block)))
+    dst.write(encoder.encode(decoder.decode(b'', final=True), final=True))
+
+
+def transcode_file(src_path, dest_path, source_encoding='gbk', target_encoding='utf-8-sig'):
+    """转码单个文件，先写临时文件再替换，返回目标文件路径"""
+    tmp_path = f'{dest_path}.tmp'
+    with open(src_path, 'rb') as f_in, open(tmp_path, 'wb') as f_out:
+        transcode_stream(f_in, f_out, source_encoding, target_encoding)
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+
+def transcode_files(paths, workers=None, prefix='utf8_', source_encoding='gbk', target_encoding='utf-8-sig'):
+    """在多个进程中并行转码多个文件，目标文件与源文件同目录，文件名加 prefix 前缀"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                transcode_file,
+                path,
+                os.path.join(os.path.dirname(path), f'{prefix}{os.path.basename(path)}'),
+                source_encoding,
+                target_encoding
+            )
+            for path in paths
+        ]
+        return [future.result() for future in futures]
+
+
+class TranscodingReader(io.RawIOBase):
+    """只读流适配器：从底层二进制流按块读取 source_encoding 字节，输出 target_encoding 字节
+
+    可直接交给 pandas.read_csv 等按 UTF-8 读取，无需先写出中间文件。
+    """
+
+    def __init__(self, raw, source_encoding='gbk', target_encoding='utf-8', block_size=BLOCK_SIZE):
+        self.raw = raw
+        self.block_size = block_size
+        self.decoder = codecs.getincrementaldecoder(source_encoding)()
+        self.encoder = codecs.getincrementalencoder(target_encoding)()
+        self.buffer = b''
+        self.position = 0
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.position >= len(self.buffer) and not self.eof:
+            block = self.raw.read(self.block_size)
+            if not block:
+                self.eof = True
+                self.buffer = self.encoder.encode(self.decoder.decode(b'', final=True), final=True)
+            else:
+                self.buffer = self.encoder.encode(self.decoder.decode(block))
+            self.position = 0
+        n = min(len(b), len(self.buffer) - self.position)
+        b[:n] = self.buffer[self.position:self.position + n]
+        self.position += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super().close()
+
+
+def open_utf8(path, source_encoding='gbk'):
+    """以 UTF-8 字节流的形式打开 source_encoding 编码的文件"""
+    return io.BufferedReader(TranscodingReader(open(path, 'rb'), source_encoding), BLOCK_SIZE)
+
+
+if __name__ == '__main__':
+    files = sys.argv[1:] or filelist
+    for dest_path in transcode_files([os.path.join(data_path, file) for file in files]):
+        print("已转码:", dest_path)
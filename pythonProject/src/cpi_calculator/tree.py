@@ -0,0 +1,138 @@
+import numpy as np
+
+
+class CategoryTree:
+    """数组表示的分类树
+
+    节点按分类ID升序编号，节点编号即其在 node_ids 中的位置，所有结构均为整数数组：
+    - parent: 父节点编号，根节点（父分类不存在）为 -1
+    - depth: 深度，根节点为 0
+    - child_ptr / children: CSR 格式的子节点，节点 i 的子节点为 children[child_ptr[i]:child_ptr[i + 1]]（按ID升序）
+    - order / tin / tout: 先序遍历（Euler tour）顺序，节点 i 的子树为 order[tin[i]:tout[i]]
+    - ancestor_table: 节点×深度 的祖先表，ancestor_table[i, d] 为节点 i 在深度 d 的祖先（超出深度为 -1）
+    - is_leaf: 没有子节点的节点
+
+    构造完成后，子树判断、祖先查找、商品到各级分类的映射都是数组下标运算。
+    """
+
+    def __init__(self, node_ids, parent_ids, weights=None):
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        parent_ids = np.asarray(parent_ids, dtype=np.int64)
+        order = np.argsort(node_ids, kind='stable')
+        self.node_ids = node_ids[order]
+        if len(self.node_ids) > 1 and (self.node_ids[1:] == self.node_ids[:-1]).any():
+            raise ValueError("分类ID重复")
+        self.weights = (
+            np.full(len(node_ids), np.nan) if weights is None
+            else np.asarray(weights, dtype=np.float64)[order]
+        )
+        # 父分类不在表中（如 -1）的节点视为根节点
+        self.parent = self.position(parent_ids[order])
+        n = len(self.node_ids)
+
+        # 子节点按父节点编号排序（同一父节点下按ID升序），得到 CSR 结构
+        has_parent = self.parent >= 0
+        self.children = np.flatnonzero(has_parent)[np.argsort(self.parent[has_parent], kind='stable')]
+        self.child_ptr = np.r_[0, np.cumsum(np.bincount(self.parent[has_parent], minlength=n))].astype(np.int64)
+        self.is_leaf = np.diff(self.child_ptr) == 0
+
+        # 逐级向上跳转求深度，同时记录每个节点到各级祖先的距离
+        self.depth = np.zeros(n, dtype=np.int64)
+        ancestors = [np.arange(n)]
+        current = self.parent.copy()
+        while (current >= 0).any():
+            if len(ancestors) > n:
+                raise ValueError("分类树中存在环")
+            ancestors.append(current)
+            self.depth += current >= 0
+            current = np.where(current >= 0, self.parent[np.maximum(current, 0)], -1)
+        self.max_depth = int(self.depth.max()) if n else 0
+
+        # ancestor_table[i, depth[i] - k] 为节点 i 的第 k 级祖先
+        self.ancestor_table = np.full((n, self.max_depth + 1), -1, dtype=np.int64)
+        for distance, nodes in enumerate(ancestors):
+            valid = nodes >= 0
+            self.ancestor_table[np.flatnonzero(valid), self.depth[valid] - distance] = nodes[valid]
+
+        # 自底向上累加子树大小，再自顶向下按兄弟节点顺序分配先序编号
+        size = np.ones(n, dtype=np.int64)
+        for d in range(self.max_depth, 0, -1):
+            nodes = np.flatnonzero(self.depth == d)
+            np.add.at(size, self.parent[nodes], size[nodes])
+        self.tin = np.zeros(n, dtype=np.int64)
+        roots = np.flatnonzero(~has_parent)
+        self.tin[roots] = np.cumsum(size[roots]) - size[roots]
+        for d in range(1, self.max_depth + 1):
+            nodes = self.children[self.depth[self.children] == d]
+            parents = self.parent[nodes]
+            # 同一父节点下，排在前面的兄弟节点的子树大小之和
+            offset = np.cumsum(size[nodes]) - size[nodes]
+            group_start = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+            offset -= np.repeat(offset[group_start], np.diff(np.r_[group_start, len(nodes)]))
+            self.tin[nodes] = self.tin[parents] + 1 + offset
+        self.tout = self.tin + size
+        self.order = np.argsort(self.tin)
+
+    @classmethod
+    def from_frame(cls, categories):
+        """由分类表（category_id, parent[, weight]）构建，父分类缺失或为 -1 的节点为根节点"""
+        import pandas as pd
+        categories = categories.drop_duplicates('category_id')
+        parents = pd.to_numeric(categories['parent'], errors='coerce').fillna(-1)
+        weights = categories['weight'].to_numpy() if 'weight' in categories else None
+        return cls(categories['category_id'].to_numpy(), parents.to_numpy(), weights)
+
+    @classmethod
+    def from_records(cls, records):
+        """由 generator01.parse_category_hierarchy 解析出的记录（code, parent_code[, weight]）构建"""
+        node_ids = [int(record['code']) for record in records]
+        parent_ids = [-1 if record.get('parent_code') is None else int(record['parent_code']) for record in records]
+        weights = [record.get('weight', np.nan) for record in records]
+        return cls(node_ids, parent_ids, weights)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def position(self, category_ids):
+        """分类ID对应的节点编号，不在树中的分类为 -1"""
+        category_ids = np.asarray(category_ids, dtype=np.int64)
+        pos = np.searchsorted(self.node_ids, category_ids)
+        found = pos < len(self.node_ids)
+        found[found] = self.node_ids[pos[found]] == category_ids[found]
+        return np.where(found, pos, -1)
+
+    @property
+    def leaf_ids(self):
+        """叶子分类ID（升序）"""
+        return self.node_ids[self.is_leaf]
+
+    def leaf_categories(self):
+        """叶子分类及权重，列为 category_id, weight"""
+        import pandas as pd
+        return pd.DataFrame({'category_id': self.leaf_ids, 'weight': self.weights[self.is_leaf]})
+
+    def children_of(self, node):
+        """节点的子节点编号"""
+        return self.children[self.child_ptr[node]:self.child_ptr[node + 1]]
+
+    def subtree(self, node):
+        """节点子树（含自身）的全部节点编号，按先序排列"""
+        return self.order[self.tin[node]:self.tout[node]]
+
+    def in_subtree(self, nodes, root):
+        """nodes 中的节点是否位于 root 的子树内（含 root 本身）"""
+        nodes = np.asarray(nodes)
+        tin = self.tin[np.maximum(nodes, 0)]
+        return (nodes >= 0) & (tin >= self.tin[root]) & (tin < self.tout[root])
+
+    def ancestor(self, nodes, depth):
+        """节点在指定深度的祖先编号，节点深度不足或节点为 -1 时为 -1"""
+        nodes = np.asarray(nodes)
+        if depth > self.max_depth:
+            return np.full(nodes.shape, -1, dtype=np.int64)
+        return np.where(nodes >= 0, self.ancestor_table[np.maximum(nodes, 0), depth], -1)
+
+    def ancestor_ids(self, category_ids, depth):
+        """分类ID在指定深度的祖先分类ID，例如由商品的分类得到其一级分类；找不到时为 -1"""
+        ancestors = self.ancestor(self.position(category_ids), depth)
+        return np.where(ancestors >= 0, self.node_ids[np.maximum(ancestors, 0)], -1)
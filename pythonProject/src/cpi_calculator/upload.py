@@ -1,18 +1,234 @@
 import os
+import json
+import shutil
+import hashlib
+import threading
+import uuid
 from pathlib import Path
-from config import settings
-import oss2
-
-# 替换为你自己的 AccessKey 和 Endpoint 信息
-auth = oss2.Auth(settings.ACCESS_KEY, settings.ACCESS_KEY_SECRET)
-bucket = oss2.Bucket(auth, settings.OSS.ENDPOINT, settings.OSS.BUCKET)
+from concurrent.futures import ThreadPoolExecutor
 
 # 本地文件路径
 base_path = Path(__file__).resolve().parent.parent.parent / 'data' / 'data'
-filelist = [ 'products.csv', 'categories.csv', 'price.csv']  # 需要上传的文件列表
-for file in filelist:
-    local_file = os.path.join(base_path, file)  # 本地文件路径
-    oss_key = f'{file}'  # OSS 中的路径
-    # 上传文件
-    bucket.put_object_from_file(oss_key, local_file)
-    print(f"已上传至 OSS：oss://price-index-demo/{oss_key}")
+filelist = ['products.csv', 'categories.csv']  # 需要上传的文件列表
+partition_dirs = ['price']  # 需要上传的分区目录（clean.py 按源文件输出的价格分区）
+state_path = base_path / '.upload_state.json'  # 未完成的分片上传记录，用于断点续传
+
+MULTIPART_THRESHOLD = 64 * 1024 * 1024  # 超过该大小的文件使用分片上传
+PART_SIZE = 16 * 1024 * 1024
+META_MD5 = 'content-md5'
+
+
+def file_md5(path):
+    """计算文件内容的 MD5（十六进制）"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OssBucket:
+    """OSS 存储桶适配，内容 MD5 记录在对象的自定义元数据中"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def get_md5(self, key):
+        import oss2
+        try:
+            headers = self.bucket.head_object(key).headers
+        except oss2.exceptions.NotFound:
+            return None
+        return headers.get(f'x-oss-meta-{META_MD5}')
+
+    def put_file(self, key, path, md5):
+        self.bucket.put_object_from_file(key, path, headers={f'x-oss-meta-{META_MD5}': md5})
+
+    def init_multipart(self, key, md5):
+        return self.bucket.init_multipart_upload(key, headers={f'x-oss-meta-{META_MD5}': md5}).upload_id
+
+    def list_parts(self, key, upload_id):
+        import oss2
+        try:
+            return {part.part_number: part.etag for part in oss2.PartIterator(self.bucket, key, upload_id)}
+        except oss2.exceptions.NoSuchUpload:
+            return None
+
+    def upload_part(self, key, upload_id, part_number, data):
+        return self.bucket.upload_part(key, upload_id, part_number, data).etag
+
+    def complete_multipart(self, key, upload_id, parts):
+        import oss2
+        part_infos = [oss2.models.PartInfo(number, etag) for number, etag in sorted(parts.items())]
+        self.bucket.complete_multipart_upload(key, upload_id, part_infos)
+
+
+class LocalBucket:
+    """以本地目录模拟的存储桶，接口与 OssBucket 相同，用于离线测试"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.meta_dir = self.root / '.meta'
+        self.upload_dir = self.root / '.multipart'
+        self.meta_dir.mkdir(parents=True, exist_ok=True)
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+
+    def _meta_path(self, key):
+        return self.meta_dir / f'{key}.json'
+
+    def _write_meta(self, key, md5):
+        path = self._meta_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({META_MD5: md5}), encoding='utf-8')
+
+    def get_md5(self, key):
+        path = self._meta_path(key)
+        if not (self.root / key).exists() or not path.exists():
+            return None
+        return json.loads(path.read_text(encoding='utf-8'))[META_MD5]
+
+    def put_file(self, key, path, md5):
+        target = self.root / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, target)
+        self._write_meta(key, md5)
+
+    def init_multipart(self, key, md5):
+        upload_id = uuid.uuid4().hex
+        (self.upload_dir / upload_id).mkdir()
+        (self.upload_dir / upload_id / 'meta.json').write_text(json.dumps({'key': key, META_MD5: md5}), encoding='utf-8')
+        return upload_id
+
+    def list_parts(self, key, upload_id):
+        path = self.upload_dir / upload_id
+        if not path.is_dir():
+            return None
+        return {int(part.stem): hashlib.md5(part.read_bytes()).hexdigest() for part in path.glob('*.part')}
+
+    def upload_part(self, key, upload_id, part_number, data):
+        path = self.upload_dir / upload_id / f'{part_number}.part'
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart(self, key, upload_id, parts):
+        path = self.upload_dir / upload_id
+        md5 = json.loads((path / 'meta.json').read_text(encoding='utf-8'))[META_MD5]
+        target = self.root / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, 'wb') as f_out:
+            for part_number in sorted(parts):
+                with open(path / f'{part_number}.part', 'rb') as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+        self._write_meta(key, md5)
+        shutil.rmtree(path)
+
+
+class Uploader:
+    """并发、可续传、按内容去重的上传器
+
+    - 存储桶中对象的内容 MD5 与本地文件一致时跳过上传
+    - 大于 multipart_threshold 的文件分片上传，各分片并发上传
+    - 未完成的分片上传记录在 state_file 中，再次运行时只补传缺失的分片
+    """
+
+    def __init__(self, bucket, state_file, workers=4, part_size=PART_SIZE, multipart_threshold=MULTIPART_THRESHOLD):
+        self.bucket = bucket
+        self.state_file = Path(state_file)
+        self.workers = workers
+        self.part_size = part_size
+        self.multipart_threshold = multipart_threshold
+        self.lock = threading.Lock()
+
+    def _load_state(self):
+        if not self.state_file.exists():
+            return {}
+        return json.loads(self.state_file.read_text(encoding='utf-8'))
+
+    def _update_state(self, key, record):
+        """更新单个对象的续传记录，record 为 None 时删除"""
+        with self.lock:
+            state = self._load_state()
+            if record is None:
+                state.pop(key, None)
+            else:
+                state[key] = record
+            tmp_path = self.state_file.with_name(f'{self.state_file.name}.tmp')
+            tmp_path.write_text(json.dumps(state, indent=2), encoding='utf-8')
+            os.replace(tmp_path, self.state_file)
+
+    def upload_file(self, key, path):
+        """上传单个文件，返回 'skipped' 或 'uploaded'"""
+        md5 = file_md5(path)
+        if self.bucket.get_md5(key) == md5:
+            return 'skipped'
+        if os.path.getsize(path) <= self.multipart_threshold:
+            self.bucket.put_file(key, path, md5)
+        else:
+            self._upload_multipart(key, path, md5)
+        return 'uploaded'
+
+    def _upload_multipart(self, key, path, md5):
+        """分片上传，内容未变化时沿用上次未完成的上传，只补传缺失的分片"""
+        with self.lock:
+            record = self._load_state().get(key)
+        parts = None
+        if record and record['md5'] == md5 and record['part_size'] == self.part_size:
+            parts = self.bucket.list_parts(key, record['upload_id'])
+        if parts is None:
+            record = {'upload_id': self.bucket.init_multipart(key, md5), 'md5': md5, 'part_size': self.part_size}
+            self._update_state(key, record)
+            parts = {}
+
+        size = os.path.getsize(path)
+        part_count = max(-(-size // self.part_size), 1)
+        missing = [number for number in range(1, part_count + 1) if number not in parts]
+
+        def upload_part(part_number):
+            with open(path, 'rb') as f:
+                f.seek((part_number - 1) * self.part_size)
+                data = f.read(self.part_size)
+            return part_number, self.bucket.upload_part(key, record['upload_id'], part_number, data)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for part_number, etag in executor.map(upload_part, missing):
+                parts[part_number] = etag
+
+        self.bucket.complete_multipart(key, record['upload_id'], parts)
+        self._update_state(key, None)
+
+    def upload_files(self, files):
+        """并发上传多个文件，files 为 {对象键: 本地路径}，返回 {对象键: 结果}"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(lambda item: (item[0], self.upload_file(*item)), files.items())
+            return dict(results)
+
+
+def collect_files(base_path, filelist, partition_dirs):
+    """收集需要上传的文件，返回 {对象键: 本地路径}，分区文件的对象键保留目录前缀"""
+    files = {file: os.path.join(base_path, file) for file in filelist}
+    for directory in partition_dirs:
+        local_dir = os.path.join(base_path, directory)
+        if not os.path.isdir(local_dir):
+            continue
+        for name in sorted(os.listdir(local_dir)):
+            if name.endswith('.csv'):
+                files[f'{directory}/{name}'] = os.path.join(local_dir, name)
+    return files
+
+
+if __name__ == '__main__':
+    import oss2
+    from config import settings
+
+    # 替换为你自己的 AccessKey 和 Endpoint 信息
+    auth = oss2.Auth(settings.ACCESS_KEY, settings.ACCESS_KEY_SECRET)
+    bucket = oss2.Bucket(auth, settings.OSS.ENDPOINT, settings.OSS.BUCKET)
+
+    uploader = Uploader(OssBucket(bucket), state_path)
+    for oss_key, result in uploader.upload_files(collect_files(base_path, filelist, partition_dirs)).items():
+        if result == 'skipped':
+            print(f"内容未变化，跳过：oss://{settings.OSS.BUCKET}/{oss_key}")
+        else:
+            print(f"已上传至 OSS：oss://{settings.OSS.BUCKET}/{oss_key}")
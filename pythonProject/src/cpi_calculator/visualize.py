@@ -1,25 +1,149 @@
-import plotly.express as px
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
-def plot_cpi_trend(cpi_series: pd.Series):
-    """绘制CPI趋势图（使用Plotly）"""
-    fig = px.line(
-        cpi_series,
-        labels={'index': 'Date', 'value': 'CPI'},
-        title='Daily Consumer Price Index Trend',
-        markers=True
-    )
-    fig.update_traces(line=dict(color='steelblue'), marker=dict(size=6))
+# 单条序列默认保留的点数，超过时用 LTTB 降采样，图形上与原序列几乎无差别
+MAX_POINTS = 2000
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets 降采样，返回保留点的下标（升序）
+
+    首尾两点固定保留，中间的点均分为 threshold - 2 个桶，每个桶保留与前一个保留点、
+    下一个桶均值所构成三角形面积最大的点。x 需为升序的数值；y 为二维数组（点数×序列数）时
+    所有序列一起计算，返回形状为 (threshold, 序列数) 的下标。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n) if np.ndim(y) == 1 else np.repeat(np.arange(n)[:, None], np.shape(y)[1], axis=1)
+    x = np.asarray(x, dtype=np.float64)
+    values = np.asarray(y, dtype=np.float64).reshape(n, -1)
+    columns = np.arange(values.shape[1])
+
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    selected = np.empty((threshold, values.shape[1]), dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = np.zeros(values.shape[1], dtype=np.int64)
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = values[next_start:next_end].mean(axis=0)
+        x_a, y_a = x[a], values[a, columns]
+        area = np.abs((x_a - avg_x) * (values[start:end] - y_a) - (x_a - x[start:end, None]) * (avg_y - y_a))
+        a = start + area.argmax(axis=0)
+        selected[i + 1] = a
+    return selected[:, 0] if np.ndim(y) == 1 else selected
+
+
+def day_numbers(index):
+    """日期索引转换为天数，作为 LTTB 的横坐标"""
+    return pd.to_datetime(pd.Index(index)).values.astype('datetime64[D]').astype(np.float64)
+
+
+def downsample(series: pd.Series, max_points=MAX_POINTS) -> pd.Series:
+    """去掉 NaN 后按 LTTB 降采样到不超过 max_points 个点"""
+    series = series.dropna()
+    if max_points is None or len(series) <= max_points:
+        return series
+    return series.iloc[lttb(day_numbers(series.index), series.to_numpy(), max_points)]
+
+
+def downsample_columns(data, max_points=MAX_POINTS):
+    """将 Series 或 DataFrame（每列一条序列）降采样，返回 {序列名: Series}
+
+    DataFrame 的所有列共用日期索引，一次向量化完成全部序列的 LTTB；
+    选点时 NaN 用相邻值填充，绘图时仍保留为 NaN（显示为断开）。
+    """
+    if isinstance(data, pd.Series):
+        return {data.name if data.name is not None else 'CPI': downsample(data, max_points)}
+    data = data.dropna(how='all')
+    if max_points is None or len(data) <= max_points:
+        return {column: data[column] for column in data.columns}
+    filled = data.ffill().bfill().fillna(0.0)
+    selected = lttb(day_numbers(data.index), filled.to_numpy(), max_points)
+    return {column: data[column].iloc[selected[:, j]] for j, column in enumerate(data.columns)}
+
+
+def save_static_chart(data, path='2.png', max_points=MAX_POINTS, title='Daily Consumer Price Index Trend', dpi=150):
+    """无界面的快速静态图：直接使用 Agg 画布，不经过 pyplot，不弹出窗口，适合批处理任务
+
+    data 为 Series 或 DataFrame（每列一条序列），每条序列先降采样到 max_points 个点，不绘制逐点标记。
+    """
+    from matplotlib import dates as mdates
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(15, 6))
+    ax = fig.subplots()
+    columns = downsample_columns(data, max_points)
+    if len(columns) <= 20:
+        for name, series in columns.items():
+            ax.plot(pd.to_datetime(pd.Index(series.index)), series.to_numpy(), linewidth=1, label=str(name))
+    else:
+        # 序列很多时合并为一个 LineCollection 绘制，比逐条 plot 快得多
+        segments = [
+            np.column_stack([mdates.date2num(pd.to_datetime(pd.Index(series.index))), series.to_numpy()])
+            for series in columns.values()
+        ]
+        ax.add_collection(LineCollection(segments, linewidths=0.6, colors=[f'C{i % 10}' for i in range(len(segments))]))
+        ax.xaxis_date()
+        ax.autoscale_view()
+    ax.set_title(title)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('CPI')
+    ax.grid(True)
+    if 1 < len(columns) <= 20:
+        ax.legend(loc='upper left', fontsize='small')
+    fig.autofmt_xdate()
+    # 固定边距，避免 tight_layout 额外渲染一遍
+    fig.subplots_adjust(left=0.06, right=0.98, top=0.93, bottom=0.15)
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def plot_cpi_trend(cpi_series, path='2.png', max_points=MAX_POINTS, show=True, title='Daily Consumer Price Index Trend'):
+    """绘制CPI趋势图（使用Plotly WebGL 轨迹）
+
+    cpi_series 可为 Series 或 DataFrame（如 compute_category_cpi 的结果，每列一条序列），
+    每条序列先降采样，再以 Scattergl 绘制，数百条序列也能快速渲染。
+    path 以 .html 结尾时写出交互式页面，否则调用 write_image 导出静态图片（需要 kaleido）。
+    批处理任务可传入 show=False 不打开浏览器，或改用不依赖 kaleido 的 save_static_chart。
+    """
+    import plotly.graph_objects as go
+
+    columns = downsample_columns(cpi_series, max_points)
+    fig = go.Figure()
+    for name, series in columns.items():
+        fig.add_trace(go.Scattergl(
+            x=pd.to_datetime(pd.Index(series.index)),
+            y=series.to_numpy(),
+            mode='lines',
+            name=str(name),
+            line=dict(width=1.5, color='steelblue' if len(columns) == 1 else None)
+        ))
     fig.update_layout(
+        title=title,
         title_font_size=20,
+        xaxis_title='Date',
+        yaxis_title='CPI',
         xaxis_title_font_size=16,
         yaxis_title_font_size=16,
-        hovermode='x unified'
+        showlegend=1 < len(columns) <= 50,
+        hovermode='x unified' if len(columns) <= 20 else 'closest'
     )
-    fig.write_image("2.png", width=1200, height=500, scale=2)
-    print("图表已保存为 2.png")
-    fig.show()
+    if str(path).endswith('.html'):
+        fig.write_html(path, include_plotlyjs='cdn')
+    else:
+        fig.write_image(path, width=1200, height=500, scale=2)
+    print(f"图表已保存为 {path}")
+    if show:
+        fig.show()
+    return fig
+
 
 if __name__ == '__main__':
     # 读取原始 CSV
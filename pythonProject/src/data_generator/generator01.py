@@ -99,17 +99,18 @@ def generate_category_csv(categories, filename):
             ])
 
 
-# 示例文档内容解析（实际应读取docx文件）
-doc_content = "raw.docx"
+if __name__ == '__main__':
+    # 示例文档内容解析（实际应读取docx文件）
+    doc_content = "raw.docx"
 
-# 解析分类体系
-categories = parse_category_hierarchy(doc_content)
+    # 解析分类体系
+    categories = parse_category_hierarchy(doc_content)
 
-# 生成CSV文件
-generate_category_csv(categories, "国家统计分类标准.csv")
+    # 生成CSV文件
+    generate_category_csv(categories, "国家统计分类标准.csv")
 
-# 生成ClickHouse建表语句
-print(f"""
+    # 生成ClickHouse建表语句
+    print(f"""
 CREATE TABLE national_category_stats
 (
     `分类代码` String,
@@ -124,4 +125,4 @@ ENGINE = S3(
     'SECRET_KEY',
     'CSVWithNames'
 );
-""")
\ No newline at end of file
+""")
@@ -0,0 +1,277 @@
+"""可复现的大规模合成数据生成器
+
+生成三级分类、商品以及按 change_date 记录的每日价格变动，用于对清洗、上传和 CPI 计算流程做压力测试。
+相同的参数和 seed 总是生成完全相同的数据，与并行进程数无关：商品按 block_size 分块，
+每个分块使用由 (seed, 分块号) 派生的独立随机数流，在各自的进程中生成并写出。
+
+输出目录结构：
+    root/categories.csv|parquet   列 category_id, name, parent, weight, hierarchy（1~3 级，3 为叶子）
+    root/products.csv|parquet     列 product_id, category_id, name
+    root/daily_price/<分区>_part<分块号>.csv|parquet
+        layout='raw'   时为 clean.py 的输入格式，列 product_id, category_id, name, price, change_date
+    root/price/<分区>_part<分块号>.csv|parquet
+        layout='clean' 时为 LocalSource 可直接读取的格式，日期列名为 date
+
+用法：
+    python src/data_generator/price_generator.py data/synthetic --products 1000000 --days 365 --workers 8
+    python src/data_generator/price_generator.py data/synthetic --layout clean --format parquet --partition month
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+START_DATE = date(2025, 5, 17)
+BLOCK_SIZE = 100000
+
+# 随机数流的派生键，分块的键为 (PRICE_STREAM, 分块号)
+CATEGORY_STREAM, PRODUCT_STREAM, PRICE_STREAM = 0, 1, 2
+
+
+def stream_rng(seed, *key):
+    """由 seed 和派生键得到独立的随机数生成器"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key))
+
+
+def generate_categories(seed=0, n_top=8, n_mid=(3, 8), n_leaf=(3, 10)):
+    """生成三级分类树
+
+    n_mid / n_leaf 为每个上级分类下子分类数量的范围（含两端）。分类代码按层级分段：
+    一级为 i * 10000，二级为 一级 + j * 100，三级为 二级 + k。各级权重由 Dirichlet 分布逐级拆分，
+    每一层的权重之和均为 1。
+    """
+    rng = stream_rng(seed, CATEGORY_STREAM)
+    rows = []
+    top_weights = rng.dirichlet(np.full(n_top, 2.0))
+    for i, top_weight in enumerate(top_weights, start=1):
+        top_id = i * 10000
+        rows.append((top_id, f'分类{top_id}', -1, top_weight, 1))
+        mid_weights = top_weight * rng.dirichlet(np.full(rng.integers(n_mid[0], n_mid[1] + 1), 2.0))
+        for j, mid_weight in enumerate(mid_weights, start=1):
+            mid_id = top_id + j * 100
+            rows.append((mid_id, f'分类{mid_id}', top_id, mid_weight, 2))
+            leaf_weights = mid_weight * rng.dirichlet(np.full(rng.integers(n_leaf[0], n_leaf[1] + 1), 2.0))
+            for k, leaf_weight in enumerate(leaf_weights, start=1):
+                rows.append((mid_id + k, f'分类{mid_id + k}', mid_id, leaf_weight, 3))
+    categories = pd.DataFrame(rows, columns=['category_id', 'name', 'parent', 'weight', 'hierarchy'])
+    categories['weight'] = categories['weight'].round(8)
+    return categories
+
+
+def category_dynamics(leaf_ids, seed=0, change_rate=0.05, inflation=0.02):
+    """为每个叶子分类生成价格变动参数，返回与 leaf_ids 对齐的字典
+
+    - rate: 每个商品每天发生价格变动的概率，服从均值为 change_rate 的 Beta 分布，
+      少数分类（如鲜活食品）几乎每天变价，多数分类（如耐用品）很少变价
+    - drift: 每次变动的对数涨幅均值，使分类的年化涨幅约为 inflation 附近的随机值
+    - volatility: 每次变动的对数涨幅标准差
+    - log_level: 分类价格水平的对数，商品的初始价格围绕该水平分布
+    """
+    rng = stream_rng(seed, CATEGORY_STREAM, 1)
+    n = len(leaf_ids)
+    concentration = 0.8
+    rate = rng.beta(concentration, concentration * (1 / change_rate - 1), n).clip(1e-4, 0.9)
+    annual = rng.normal(inflation, 0.03, n)
+    return {
+        'rate': rate,
+        'drift': annual / 365 / rate,
+        'volatility': rng.uniform(0.02, 0.1, n),
+        'log_level': rng.uniform(np.log(5), np.log(500), n),
+    }
+
+
+def generate_products(categories, n_products, n_days, seed=0, entry_share=0.3):
+    """生成商品及其初始状态，返回 (products, state)
+
+    商品按 权重的平方根 比例分配到叶子分类；约 1 - entry_share 的商品在首日已存在，
+    其余在区间内陆续上架。state 为生成价格所需的按商品排列的数组：
+    leaf 为叶子分类的位置，first_day 为首条价格记录的日序号，log_price 为初始价格的对数偏移。
+    """
+    rng = stream_rng(seed, PRODUCT_STREAM)
+    leaves = categories[categories['hierarchy'] == 3]
+    p = np.sqrt(leaves['weight'].to_numpy())
+    leaf = rng.choice(len(leaves), n_products, p=p / p.sum())
+
+    entering = rng.random(n_products) < entry_share
+    first_day = np.where(entering, rng.integers(0, max(n_days, 1), n_products), 0)
+
+    product_ids = np.arange(1, n_products + 1, dtype=np.int64)
+    products = pd.DataFrame({
+        'product_id': product_ids,
+        'category_id': leaves['category_id'].to_numpy()[leaf],
+    })
+    products['name'] = '商品' + products['product_id'].astype(str)
+    state = {
+        'product_id': product_ids,
+        'leaf': leaf,
+        'first_day': first_day,
+        'log_price': rng.normal(0, 0.4, n_products),
+    }
+    return products, state
+
+
+def generate_price_events(state, dynamics, n_days, rng):
+    """生成一批商品的价格变动记录，返回按 (商品, 日期) 排序的 (product_ids, days, prices)
+
+    每个商品在 first_day 给出初始价格，之后每天以所属分类的 rate 为概率变价（同一天至多一次），
+    变动为对数正态跳跃，价格保留两位小数且不低于 0.01。
+    """
+    n = len(state['product_id'])
+    leaf = state['leaf']
+    first_day = state['first_day']
+    remaining = n_days - first_day - 1
+
+    n_changes = rng.binomial(np.maximum(remaining, 0), dynamics['rate'][leaf])
+    owner = np.repeat(np.arange(n), n_changes)
+    change_day = first_day[owner] + 1 + (rng.random(len(owner)) * remaining[owner]).astype(np.int64)
+
+    owners = np.concatenate([np.arange(n), owner])
+    days = np.concatenate([first_day, change_day])
+    # 同一商品同一天只保留一条记录；键的顺序即 (商品, 日期) 的顺序
+    keys, first = np.unique(owners.astype(np.int64) * n_days + days, return_index=True)
+    owners, days = keys // n_days, keys % n_days
+    is_first = first < n
+
+    # 首条记录为初始价格，之后逐条累加对数跳跃，每个商品的累加从 0 开始
+    leaf = leaf[owners]
+    log_steps = np.where(
+        is_first,
+        dynamics['log_level'][leaf] + state['log_price'][owners],
+        rng.normal(dynamics['drift'][leaf], dynamics['volatility'][leaf])
+    )
+    log_prices = np.cumsum(log_steps)
+    group_start = np.maximum.accumulate(np.where(is_first, np.arange(len(days)), 0))
+    offset = np.where(group_start > 0, log_prices[group_start - 1], 0.0)
+    prices = np.maximum(np.round(np.exp(log_prices - offset), 2), 0.01)
+    return state['product_id'][owners], days, prices
+
+
+def partition_bounds(dates, partition):
+    """按分区切分已排序的日期，返回 (分区名, 边界)
+
+    分区名 'day' 为 YYYY-MM-DD，'month' 为 YYYY-MM；第 i 个分区为 bounds[i]:bounds[i + 1]。
+    """
+    unit = 'D' if partition == 'day' else 'M'
+    periods, starts = np.unique(dates.astype(f'datetime64[{unit}]'), return_index=True)
+    return np.datetime_as_string(periods), np.r_[starts, len(dates)]
+
+
+def write_table(df, path, file_format, encoding):
+    """写出单个 CSV 或 Parquet 文件，先写临时文件再替换"""
+    tmp_path = path.with_name(f'{path.name}.tmp')
+    if file_format == 'parquet':
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False, encoding=encoding)
+    os.replace(tmp_path, path)
+
+
+def write_price_block(task):
+    """生成并写出一个商品分块的全部价格记录，返回 (分块号, 记录数, 文件数)
+
+    分块内的记录按日期、商品排序后按分区切分，每个分区写出一个文件。
+    """
+    block = task['block']
+    rng = stream_rng(task['seed'], PRICE_STREAM, block)
+    product_ids, days, prices = generate_price_events(task['state'], task['dynamics'], task['n_days'], rng)
+
+    order = np.lexsort((product_ids, days))
+    product_ids, days, prices = product_ids[order], days[order], prices[order]
+    dates = np.datetime64(task['start_date'], 'D') + days
+    names, bounds = partition_bounds(dates, task['partition'])
+
+    category_ids = task['category_ids'][np.searchsorted(task['state']['product_id'], product_ids)]
+    directory = Path(task['directory'])
+    suffix = 'parquet' if task['file_format'] == 'parquet' else 'csv'
+    for name, start, end in zip(names, bounds[:-1], bounds[1:]):
+        df = pd.DataFrame({
+            'product_id': product_ids[start:end],
+            'category_id': category_ids[start:end],
+            'name': '商品' + pd.Series(product_ids[start:end]).astype(str),
+            'price': prices[start:end],
+            task['date_column']: np.datetime_as_string(dates[start:end]),
+        })
+        write_table(df, directory / f'{name}_part{block:04d}.{suffix}', task['file_format'], task['encoding'])
+    return block, len(prices), len(names)
+
+
+def generate_dataset(root, n_products=100000, n_days=365, start_date=START_DATE, seed=0, change_rate=0.05,
+                     layout='raw', file_format='csv', encoding='gbk', partition='day', block_size=BLOCK_SIZE,
+                     workers=None):
+    """生成完整的数据集并写出到 root，返回生成的价格记录数
+
+    layout 为 'raw' 时模拟原始导出数据：价格文件为 clean.py 的输入（daily_price 目录、change_date 列），
+    CSV 均使用 encoding 编码；为 'clean' 时直接写出 LocalSource 可读取的表和价格分区（price 目录、date 列），
+    CSV 均为 UTF-8。
+    """
+    root = Path(root)
+    price_dir = root / ('daily_price' if layout == 'raw' else 'price')
+    price_dir.mkdir(parents=True, exist_ok=True)
+    text_encoding = encoding if layout == 'raw' else 'utf-8-sig'
+    suffix = 'parquet' if file_format == 'parquet' else 'csv'
+
+    categories = generate_categories(seed)
+    leaves = categories[categories['hierarchy'] == 3]
+    dynamics = category_dynamics(leaves['category_id'].to_numpy(), seed, change_rate)
+    products, state = generate_products(categories, n_products, n_days, seed)
+    write_table(categories, root / f'categories.{suffix}', file_format, text_encoding)
+    write_table(products, root / f'products.{suffix}', file_format, text_encoding)
+
+    category_ids = products['category_id'].to_numpy()
+    tasks = [
+        {
+            'block': block,
+            'seed': seed,
+            'state': {key: values[start:start + block_size] for key, values in state.items()},
+            'category_ids': category_ids[start:start + block_size],
+            'dynamics': dynamics,
+            'n_days': n_days,
+            'start_date': start_date,
+            'partition': partition,
+            'directory': str(price_dir),
+            'file_format': file_format,
+            'encoding': text_encoding,
+            'date_column': 'change_date' if layout == 'raw' else 'date',
+        }
+        for block, start in enumerate(range(0, n_products, block_size))
+    ]
+
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for block, rows, files in executor.map(write_price_block, tasks):
+            print("已生成分块:", block, "记录数:", rows, "文件数:", files)
+            total += rows
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成可复现的合成分类、商品和每日价格变动数据')
+    parser.add_argument('root', help='输出目录')
+    parser.add_argument('--products', type=int, default=100000, help='商品数量')
+    parser.add_argument('--days', type=int, default=365, help='天数')
+    parser.add_argument('--start', type=date.fromisoformat, default=START_DATE, help='起始日期 YYYY-MM-DD')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--change-rate', type=float, default=0.05, help='商品每天变价概率的平均值')
+    parser.add_argument('--layout', choices=['raw', 'clean'], default='raw')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', dest='file_format')
+    parser.add_argument('--encoding', choices=['gbk', 'utf-8-sig'], default='gbk', help='raw 布局下 CSV 的编码')
+    parser.add_argument('--partition', choices=['day', 'month'], default='day')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='每个分块（进程任务）的商品数')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数，默认为 CPU 核数')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    total = generate_dataset(
+        args.root, args.products, args.days, args.start, args.seed, args.change_rate, args.layout,
+        args.file_format, args.encoding, args.partition, args.block_size, args.workers
+    )
+    print(f"生成完成，共 {total} 条价格记录，耗时 {time.perf_counter() - started:.1f} 秒，结果保存在 {args.root}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""离线测试的公共部分：源码路径、计算器模块、合成数据以及原始实现的逐日循环"""
+import importlib.util
+import sys
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+SRC = Path(__file__).resolve().parents[1] / 'src'
+# 源码目录内的模块使用平铺导入（from engine import ...）
+sys.path.insert(0, str(SRC / 'cpi_calculator'))
+sys.path.insert(0, str(SRC / 'data_generator'))
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    # 没有 config（dynaconf 配置）时，依赖线上 ClickHouse 的脚本式测试无法导入，只运行离线测试
+    collect_ignore = ['test_calculator.py', 'test_calculator02.py']
+
+
+def load_module(file_name, module_name):
+    spec = importlib.util.spec_from_file_location(module_name, SRC / 'cpi_calculator' / file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+START = date(2025, 1, 20)
+N_DAYS = 45
+# 整日缺失的日期（第 10、11、30 天），跨越月份边界
+MISSING_DAYS = (10, 11, 30)
+
+
+def synthetic_data(seed, n_products=120):
+    """三级分类树；商品包含挂在非叶子分类、未知分类、商品表中重复以及不在商品表中的情况，
+    价格包含同一商品同一日期的重复记录（价格不同）和整日缺失"""
+    rng = np.random.default_rng(seed)
+    categories = pd.DataFrame({
+        'category_id': [1, 2, 11, 12, 21, 101, 102, 111, 121, 122, 211],
+        'parent': [-1, -1, 1, 1, 2, 11, 11, 11, 12, 12, 21],
+        'weight': [.6, .4, .3, .3, .4, .1, .1, .1, .15, .15, .4],
+        'is_leaf': [1, 1, 2, 2, 2, 3, 3, 3, 3, 3, 3],
+    })
+    products = pd.DataFrame({
+        'product_id': np.arange(n_products),
+        'category_id': rng.choice([101, 102, 111, 121, 122, 211, 11, 999], n_products),
+    })
+    products = pd.concat([products, products.iloc[:3]], ignore_index=True)
+
+    dates = pd.date_range(START, periods=N_DAYS).date
+    rows = []
+    for product_id in range(n_products + 5):
+        # 约一半的商品从第一天起就有价格，其余中途进入
+        first = 0 if rng.random() < 0.5 else int(rng.integers(1, N_DAYS // 2))
+        price = float(np.round(rng.uniform(5, 500), 2))
+        for day in range(first, N_DAYS):
+            if day == first or rng.random() < 0.15:
+                price = float(np.round(price * np.exp(rng.normal(0, 0.05)), 2))
+                rows.append((product_id, price, dates[day]))
+                if rng.random() < 0.05:
+                    rows.append((product_id, price + 1, dates[day]))
+    prices = pd.DataFrame(rows, columns=['product_id', 'price', 'date'])
+    prices = prices[~prices['date'].isin([dates[day] for day in MISSING_DAYS])]
+    prices = prices.sample(frac=1, random_state=seed).reset_index(drop=True)
+    return categories, products, prices, dates
+
+
+def reference_leaf_indices(categories, products, prices, all_dates, min_products=1):
+    """原始实现的逐日循环（基准价格为前一天的价格）得到的叶子分类指数，{日期: 分类ID→指数}
+
+    有效商品数少于 min_products 的分类以当日其余分类的加权平均指数填补，全部分类都不足的日期没有指数。
+    """
+    leaf_categories = categories[categories['is_leaf'] == 3][['category_id', 'weight']]
+    price_pivot = prices.pivot_table(index='product_id', columns='date', values='price', aggfunc='first').ffill(axis=1)
+    product_info = products.merge(leaf_categories, on='category_id', how='inner')
+
+    indices = {}
+    previous_date = None
+    for current_date in all_dates:
+        if previous_date is None:
+            previous_date = current_date
+            continue
+        try:
+            base_price = price_pivot[previous_date].rename('base_price')
+            current_price = price_pivot[current_date].rename('current_price')
+        except KeyError:
+            previous_date = current_date
+            continue
+        daily_data = product_info.merge(base_price, left_on='product_id', right_index=True, how='inner').merge(
+            current_price, left_on='product_id', right_index=True, how='inner'
+        )
+        valid_data = daily_data[(daily_data['base_price'] > 0) & (daily_data['current_price'].notnull())].copy()
+        previous_date = current_date
+        if valid_data.empty:
+            continue
+        valid_data['log_ratio'] = np.log(valid_data['current_price'] / valid_data['base_price'])
+        groups = valid_data.groupby('category_id')['log_ratio']
+        category_index = groups.mean().apply(np.exp)
+        thin = groups.size() < min_products
+        if thin.all():
+            continue
+        weights = leaf_categories.set_index('category_id')['weight'].reindex(category_index.index)
+        kept = ~thin
+        mean = (category_index[kept] * weights[kept]).sum() / weights[kept].sum()
+        category_index[thin] = mean
+        indices[current_date] = category_index
+    return indices
+
+
+def reference_chained(categories, products, prices, all_dates, min_products=1):
+    """原始实现的逐日循环：基准价格为前一天的价格"""
+    leaf_categories = categories[categories['is_leaf'] == 3][['category_id', 'weight']]
+    cpi_series = pd.Series(index=all_dates, dtype='float64')
+    leaf_indices = reference_leaf_indices(categories, products, prices, all_dates, min_products)
+    for current_date, category_index in leaf_indices.items():
+        final_data = category_index.reset_index(name='price_index').merge(leaf_categories, on='category_id', how='inner')
+        cpi_series[current_date] = (final_data['price_index'] * final_data['weight']).sum().round(4)
+    return cpi_series
+
+
+def reference_category_chained(categories, products, prices, all_dates):
+    """逐节点递归汇总叶子分类指数：父分类为当日有数据的子分类按权重的加权平均（日期×分类ID，保留 4 位小数）"""
+    children = categories.groupby('parent')['category_id'].apply(list).to_dict()
+    weights = categories.set_index('category_id')['weight']
+
+    def node_index(node, leaf_index):
+        if node not in children:
+            return leaf_index.get(node, np.nan)
+        values = [(node_index(child, leaf_index), weights[child]) for child in children[node]]
+        values = [(value, weight) for value, weight in values if not np.isnan(value)]
+        if not values:
+            return np.nan
+        return sum(value * weight for value, weight in values) / sum(weight for _, weight in values)
+
+    node_ids = sorted(categories['category_id'])
+    result = pd.DataFrame(np.nan, index=all_dates, columns=node_ids)
+    for current_date, leaf_index in reference_leaf_indices(categories, products, prices, all_dates).items():
+        result.loc[current_date] = [round(node_index(node, leaf_index), 4) for node in node_ids]
+    return result
+
+
+def reference_fixed(categories, products, prices, all_dates):
+    """原始实现的逐日循环：基准价格为区间第一天的价格"""
+    leaf_categories = categories[categories['is_leaf'] == 3][['category_id', 'weight']]
+    price_pivot = prices.pivot_table(index='product_id', columns='date', values='price', aggfunc='first').ffill(axis=1)
+    merged_data = products.merge(leaf_categories, on='category_id', how='inner').merge(
+        price_pivot[all_dates[0]].rename('base_price'), left_on='product_id', right_index=True
+    )
+    cpi_series = pd.Series(index=all_dates, dtype='float64')
+    for current_date in all_dates:
+        if current_date not in price_pivot.columns:
+            continue
+        daily_data = merged_data.merge(
+            price_pivot[current_date].rename('current_price'), left_on='product_id', right_index=True, how='inner'
+        )
+        valid_data = daily_data[(daily_data['base_price'] > 0) & (daily_data['current_price'].notnull())].copy()
+        if valid_data.empty:
+            continue
+        valid_data['log_ratio'] = np.log(valid_data['current_price'] / valid_data['base_price'])
+        category_index = valid_data.groupby('category_id')['log_ratio'].mean().apply(np.exp)
+        final_data = category_index.reset_index(name='price_index').merge(leaf_categories, on='category_id')
+        cpi_series[current_date] = (final_data['price_index'] * final_data['weight']).sum().round(4)
+    return cpi_series
+
+
+@pytest.fixture(scope='session')
+def change_date():
+    return load_module('calculator(change_date).py', 'calculator_change_date')
+
+
+@pytest.fixture(scope='session')
+def fix_date():
+    return load_module('calculator(fix_date).py', 'calculator_fix_date')
+
+
+@pytest.fixture(scope='session', name='synthetic_data')
+def synthetic_data_fixture():
+    return synthetic_data
+
+
+@pytest.fixture(scope='session', name='reference_chained')
+def reference_chained_fixture():
+    return reference_chained
+
+
+@pytest.fixture(scope='session', name='reference_fixed')
+def reference_fixed_fixture():
+    return reference_fixed
+
+
+@pytest.fixture(scope='session', name='reference_category_chained')
+def reference_category_chained_fixture():
+    return reference_category_chained
@@ -0,0 +1,121 @@
+import os
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache import PriceCache
+from sinks import CsvSink
+from sources import DataSource, MemorySource
+
+MONTHS = (date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1))
+
+
+def month_arrays(day, n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    return (
+        rng.integers(0, 1000, n).astype(np.int64),
+        np.round(rng.uniform(1, 100, n), 2).astype(np.float32),
+        np.full(n, np.datetime64(day, 'D')),
+    )
+
+
+def test_month_hit_miss_and_invalidate(tmp_path):
+    cache = PriceCache(tmp_path, identity='a')
+    assert cache.get_month(MONTHS[0]) is None
+    arrays = month_arrays(MONTHS[0])
+    cache.put_month(MONTHS[0], arrays)
+    for cached, expected in zip(cache.get_month(date(2025, 1, 20)), arrays):
+        np.testing.assert_array_equal(cached, expected)
+    assert cache.get_month(MONTHS[1]) is None
+
+    cache.invalidate([MONTHS[0]])
+    assert cache.get_month(MONTHS[0]) is None
+    cache.put_month(MONTHS[1], month_arrays(MONTHS[1]))
+    cache.invalidate()
+    assert cache.get_month(MONTHS[1]) is None
+
+
+def test_identity_separates_sources(tmp_path):
+    PriceCache(tmp_path, identity='a').put_month(MONTHS[0], month_arrays(MONTHS[0]))
+    assert PriceCache(tmp_path, identity='b').get_month(MONTHS[0]) is None
+    assert PriceCache(tmp_path, identity='a').get_month(MONTHS[0]) is not None
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = PriceCache(tmp_path, identity='a')
+    for k, day in enumerate(MONTHS[:2]):
+        cache.put_month(day, month_arrays(day))
+        os.utime(cache.price_dir / day.strftime('%Y-%m'), (k, k))
+    # 读取一月分区后，二月成为最久未使用的分区
+    cache.get_month(MONTHS[0])
+    cache.max_bytes = cache.size() + 10
+    cache.put_month(MONTHS[2], month_arrays(MONTHS[2]))
+    assert cache.get_month(MONTHS[1]) is None
+    assert cache.get_month(MONTHS[0]) is not None and cache.get_month(MONTHS[2]) is not None
+    assert cache.size() <= cache.max_bytes
+
+
+def test_tables_round_trip_without_pickle(tmp_path):
+    cache = PriceCache(tmp_path, identity='a')
+    table = pd.DataFrame({
+        'category_id': np.array([1, 2, 3], dtype=np.int64),
+        'name': ['食品', None, 'x'],
+        'weight': np.array([Decimal('0.15'), Decimal('0.5'), Decimal('0.35')], dtype=object),
+    })
+    assert cache.get_table('categories') is None
+    cache.put_table('categories', table)
+    for path in (cache.table_dir / 'categories').glob('*.npy'):
+        np.load(path, allow_pickle=False)
+
+    cached = cache.get_table('categories')
+    assert list(cached.columns) == ['category_id', 'name', 'weight']
+    np.testing.assert_array_equal(cached['category_id'], [1, 2, 3])
+    assert cached['name'].tolist()[0] == '食品' and pd.isna(cached['name'][1])
+    np.testing.assert_allclose(cached['weight'].to_numpy(dtype=np.float64), [0.15, 0.5, 0.35])
+
+    cache.invalidate_tables()
+    assert cache.get_table('categories') is None
+
+
+def make_source(data, scale=1.0):
+    """偶数商品的全部价格乘以 scale，在后半段日期再乘一次"""
+    categories, products, prices, dates = data
+    factor = np.where(prices['product_id'] % 2 == 0, scale, 1.0) ** np.where(prices['date'] >= dates[20], 2, 1)
+    return MemorySource(categories, products, prices.assign(price=np.round(prices['price'] * factor, 2)))
+
+
+@pytest.fixture(scope='module')
+def data(synthetic_data):
+    return synthetic_data(6, n_products=40)
+
+
+def test_calculator_hits_cache_and_separates_sources(change_date, data, tmp_path):
+    dates = data[3]
+    calls = []
+    source = make_source(data)
+    load_prices = source.load_prices
+    source.load_prices = lambda *args: calls.append(args) or load_prices(*args)
+
+    def compute(source):
+        calculator = change_date.CPICalculator(source=source, sink=CsvSink(tmp_path), cache_dir=tmp_path / 'cache')
+        return calculator.compute_daily_cpi(dates[0], dates[-1])
+
+    expected = compute(source)
+    first_calls = len(calls)
+    assert compute(source).equals(expected)
+    # 已结束的月份全部命中，不再查询数据源
+    assert len(calls) == first_calls
+
+    # 价格不同的数据源不会读到前一个数据源的缓存
+    changed = compute(make_source(data, scale=1.1))
+    uncached = change_date.CPICalculator(source=make_source(data, scale=1.1), sink=CsvSink(tmp_path))
+    assert changed.equals(uncached.compute_daily_cpi(dates[0], dates[-1]))
+    assert not changed.equals(expected)
+
+
+def test_source_without_identity_cannot_cache(change_date, tmp_path):
+    with pytest.raises(ValueError):
+        change_date.CPICalculator(source=DataSource(), cache_dir=tmp_path)
@@ -0,0 +1,179 @@
+"""向量化计算与原始逐日循环的等价性回归测试（离线，数据源为 sources.MemorySource）"""
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quality import QualityRules
+from sinks import CsvSink
+from sources import MemorySource
+
+
+@pytest.fixture(scope='module', params=[0, 1, 2])
+def data(request, synthetic_data, reference_chained, reference_fixed, reference_category_chained):
+    categories, products, prices, dates = synthetic_data(request.param)
+    return {
+        'categories': categories,
+        'products': products,
+        'prices': prices,
+        'dates': dates,
+        'chained': reference_chained(categories, products, prices, dates),
+        'fixed': reference_fixed(categories, products, prices, dates),
+        'category': reference_category_chained(categories, products, prices, dates),
+    }
+
+
+def make_calculator(module, data, tmp_path, **options):
+    source = MemorySource(data['categories'], data['products'], data['prices'])
+    return module.CPICalculator(source=source, sink=CsvSink(tmp_path), **options)
+
+
+def read_daily(path):
+    return pd.read_csv(path, index_col=0).iloc[:, 0]
+
+
+def assert_matches_reference(cpi_series, expected):
+    np.testing.assert_array_equal(cpi_series.to_numpy(), expected.to_numpy())
+    assert list(cpi_series.index) == list(expected.index)
+
+
+def test_reference_data_covers_edge_cases(data):
+    prices, products = data['prices'], data['products']
+    assert prices.duplicated(['product_id', 'date']).any()
+    assert (~prices['product_id'].isin(products['product_id'])).any()
+    assert products['category_id'].isin([11, 999]).any()
+    assert products['product_id'].duplicated().any()
+    assert data['chained'].isna().sum() > 1
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'sparse': True},
+    {'workers': 2},
+    {'memory_budget': 4096},
+    {'prefetch': 1},
+    {'prefetch': 2, 'memory_budget': 4096},
+    {'quality': QualityRules()},
+    {'workers': 2, 'memory_budget': 4096},
+    {'workers': 3, 'quality': QualityRules()},
+    {'prefetch': 1, 'workers': 2},
+], ids=['dense', 'sparse', 'workers', 'memory_budget', 'prefetch', 'prefetch_budget', 'quality', 'workers_budget',
+        'workers_quality', 'prefetch_workers'])
+def test_chained_matches_loop(change_date, data, tmp_path, options):
+    if 'memory_budget' in options:
+        options = {**options, 'spill_dir': tmp_path}
+    calculator = make_calculator(change_date, data, tmp_path, **options)
+    cumulative = calculator.compute_daily_cpi(data['dates'][0], data['dates'][-1])
+
+    expected = data['chained']
+    assert_matches_reference(read_daily(tmp_path / 'c_daily_cpi.csv').rename(None), pd.Series(
+        expected.to_numpy(), index=[str(day) for day in expected.index]
+    ))
+    expected_cumulative = expected.dropna().cumprod()
+    np.testing.assert_array_equal(cumulative.to_numpy(), expected_cumulative.to_numpy())
+    assert list(cumulative.index) == list(expected_cumulative.index)
+    if 'memory_budget' in options:
+        # 预算内放不下整个矩阵，价格矩阵确实存放在内存映射文件中
+        assert calculator.last_metrics.stages['build_price_matrix']['spilled'] > 0
+
+
+@pytest.mark.parametrize('min_products', [8, 12])
+def test_min_products_matches_loop(change_date, data, tmp_path, reference_chained, min_products):
+    calculator = make_calculator(
+        change_date, data, tmp_path, quality=QualityRules(max_jump=100, min_products=min_products)
+    )
+    calculator.compute_daily_cpi(data['dates'][0], data['dates'][-1])
+    assert calculator.last_metrics.stages['category_sums']['thin_category_days'] > 0
+
+    expected = reference_chained(data['categories'], data['products'], data['prices'], data['dates'], min_products)
+    daily = read_daily(tmp_path / 'c_daily_cpi.csv').rename(None)
+    assert_matches_reference(daily, pd.Series(expected.to_numpy(), index=[str(day) for day in expected.index]))
+    # 商品数不足的分类不会拉低指数：权重在商品数足够的分类间重新归一化
+    assert daily.dropna().between(0.8, 1.2).all()
+
+
+@pytest.mark.parametrize('options', [{'sparse': True}, {'server_side': True}],
+                         ids=['sparse', 'server_side'])
+def test_workers_reject_unsupported_modes(change_date, options):
+    with pytest.raises(ValueError):
+        change_date.CPICalculator(source=object(), workers=2, **options)
+
+
+def test_checkpoint_resume_matches_loop(change_date, data, tmp_path):
+    dates = data['dates']
+    checkpoint_path = tmp_path / 'checkpoint.npz'
+    calculator = make_calculator(change_date, data, tmp_path)
+    # 第一段在整日缺失的日期之后结束，续算跨越月份边界
+    calculator.compute_daily_cpi(dates[0], dates[20], checkpoint_path=checkpoint_path)
+    calculator.compute_incremental_cpi(dates[32], checkpoint_path)
+    cumulative = calculator.compute_incremental_cpi(dates[-1], checkpoint_path)
+
+    daily = read_daily(tmp_path / 'c_daily_cpi.csv')
+    np.testing.assert_array_equal(daily.to_numpy(), data['chained'].to_numpy())
+    np.testing.assert_allclose(cumulative.iloc[-1], data['chained'].dropna().cumprod().iloc[-1], rtol=1e-12)
+
+
+def test_category_cpi_matches_loop(change_date, data, tmp_path):
+    calculator = make_calculator(change_date, data, tmp_path)
+    cumulative = calculator.compute_category_cpi(data['dates'][0], data['dates'][-1])
+
+    expected = data['category']
+    daily = pd.read_csv(tmp_path / 'c_category_cpi.csv', index_col=0)
+    assert list(daily.columns) == [str(category_id) for category_id in expected.columns]
+    assert list(daily.index) == [str(day) for day in expected.index]
+    np.testing.assert_array_equal(daily.to_numpy(), expected.to_numpy())
+    expected_cumulative = expected.apply(lambda column: column.dropna().cumprod()).reindex(expected.index)
+    np.testing.assert_allclose(cumulative.to_numpy(), expected_cumulative.to_numpy(), rtol=1e-12)
+
+
+def test_fixed_base_matches_loop(fix_date, data, tmp_path):
+    calculator = make_calculator(fix_date, data, tmp_path)
+    cpi_series = calculator.compute_daily_cpi(data['dates'][0], data['dates'][-1])
+    assert_matches_reference(cpi_series, data['fixed'])
+
+
+def test_fixed_base_memory_budget_matches_loop(fix_date, data, tmp_path):
+    calculator = make_calculator(fix_date, data, tmp_path, memory_budget=4096, spill_dir=tmp_path)
+    cpi_series = calculator.compute_daily_cpi(data['dates'][0], data['dates'][-1])
+    assert_matches_reference(cpi_series, data['fixed'])
+
+
+def test_module_import_defers_pandas():
+    # 定时任务只导入模块、构造计算器时不应加载 pandas（及其引入的 pyarrow）
+    code = (
+        "import sys, importlib.util as u; sys.path.insert(0, sys.argv[1]);"
+        "s = u.spec_from_file_location('c', sys.argv[2]); m = u.module_from_spec(s); s.loader.exec_module(m);"
+        "m.CPICalculator(source=object()); print('pandas' in sys.modules, 'pyarrow' in sys.modules)"
+    )
+    src = Path(__file__).resolve().parents[1] / 'src' / 'cpi_calculator'
+    result = subprocess.run(
+        [sys.executable, '-c', code, str(src), str(src / 'calculator(change_date).py')],
+        capture_output=True, text=True, check=True,
+    )
+    assert result.stdout.split() == ['False', 'False']
+
+
+def test_weight_scenarios_match_loop(change_date, data, tmp_path, reference_chained):
+    categories = data['categories']
+    leaf = categories[categories['is_leaf'] == 3]
+    base = dict(zip(leaf['category_id'], leaf['weight']))
+    # 调整部分权重并去掉一个叶子分类（未列出的分类权重为 0）
+    perturbed = {category_id: weight * (1.5 if category_id % 2 else 0.5) for category_id, weight in base.items()}
+    del perturbed[211]
+
+    calculator = make_calculator(change_date, data, tmp_path)
+    dates = data['dates']
+    cumulative = calculator.compute_weight_scenarios(dates[0], dates[-1], {'base': base, 'perturbed': perturbed})
+    daily = pd.read_csv(tmp_path / 'c_scenario_cpi.csv', index_col=0)
+
+    expected_cumulative = make_calculator(change_date, data, tmp_path).compute_daily_cpi(dates[0], dates[-1])
+    np.testing.assert_array_equal(daily['base'].to_numpy(), read_daily(tmp_path / 'c_daily_cpi.csv').to_numpy())
+    np.testing.assert_array_equal(cumulative['base'].dropna().to_numpy(), expected_cumulative.to_numpy())
+
+    weights = categories['category_id'].map(perturbed).fillna(0.0)
+    reweighted = categories.assign(weight=weights.where(categories['is_leaf'] == 3, categories['weight']))
+    expected = reference_chained(reweighted, data['products'], data['prices'], dates)
+    np.testing.assert_array_equal(daily['perturbed'].to_numpy(), expected.to_numpy())
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from index_store import IndexStore, rebase
+from sinks import CsvSink
+from sources import LocalSource, MemorySource
+
+
+@pytest.fixture(scope='module')
+def data(synthetic_data):
+    return synthetic_data(5, n_products=60)
+
+
+@pytest.fixture
+def run(change_date):
+    def run_store(source, tmp_path, store_dir, **options):
+        calculator = change_date.CPICalculator(source=source, sink=CsvSink(tmp_path), index_store=store_dir, **options)
+        dates = pd.date_range(source.start, source.end).date
+        cumulative = calculator.compute_daily_cpi(dates[0], dates[-1])
+        return calculator, cumulative, (tmp_path / 'c_daily_cpi.csv').read_text()
+    return run_store
+
+
+def memory_source(categories, products, prices, dates):
+    source = MemorySource(categories, products, prices)
+    source.start, source.end = dates[0], dates[-1]
+    return source
+
+
+def test_hit_skips_price_load_and_reproduces_outputs(change_date, run, data, tmp_path):
+    categories, products, prices, dates = data
+    baseline = change_date.CPICalculator(source=MemorySource(categories, products, prices), sink=CsvSink(tmp_path))
+    expected = baseline.compute_daily_cpi(dates[0], dates[-1])
+    expected_csv = (tmp_path / 'c_daily_cpi.csv').read_text()
+
+    store_dir = tmp_path / 'store'
+    miss, cumulative, csv = run(memory_source(*data), tmp_path, store_dir)
+    assert miss.last_metrics.stages['index_store']['hit'] == 0
+    assert csv == expected_csv
+    pd.testing.assert_series_equal(cumulative, expected, check_names=False)
+
+    hit, cumulative, csv = run(memory_source(*data), tmp_path, store_dir)
+    assert hit.last_metrics.stages['index_store']['hit'] == 1
+    assert 'load_prices' not in hit.last_metrics.stages
+    assert 'build_price_matrix' not in hit.last_metrics.stages
+    assert csv == expected_csv
+    pd.testing.assert_series_equal(cumulative, expected, check_names=False)
+    assert len(list(store_dir.glob('*.npz'))) == 1
+
+
+def test_changed_prices_or_rules_miss(run, data, tmp_path):
+    categories, products, prices, dates = data
+    store_dir = tmp_path / 'store'
+    run(memory_source(*data), tmp_path, store_dir)
+    changed = prices.assign(price=prices['price'] * 1.01)
+    calculator, _, _ = run(memory_source(categories, products, changed, dates), tmp_path, store_dir)
+    assert calculator.last_metrics.stages['index_store']['hit'] == 0
+    calculator, _, _ = run(memory_source(*data), tmp_path, store_dir, sparse=True)
+    assert calculator.last_metrics.stages['index_store']['hit'] == 0
+    assert len(list(store_dir.glob('*.npz'))) == 3
+
+
+def test_local_source_fingerprint_uses_file_attributes(run, data, tmp_path):
+    categories, products, prices, dates = data
+    root = tmp_path / 'data'
+    (root / 'price').mkdir(parents=True)
+    categories.rename(columns={'is_leaf': 'hierarchy'}).to_csv(root / 'categories.csv', index=False)
+    products.to_csv(root / 'products.csv', index=False)
+    months = pd.to_datetime(prices['date']).dt.strftime('%Y-%m')
+    for month, group in prices.groupby(months):
+        group.to_csv(root / 'price' / f'{month}.csv', index=False)
+
+    source = LocalSource(root)
+    source.start, source.end = dates[0], dates[-1]
+    store_dir = tmp_path / 'store'
+    run(source, tmp_path, store_dir)
+
+    # 命中时不读取任何价格分区
+    read = source._read
+
+    def read_tables_only(path, *args, **kwargs):
+        if path.parent == source.price_dir:
+            pytest.fail('命中时不应读取价格分区')
+        return read(path, *args, **kwargs)
+
+    source._read = read_tables_only
+    calculator, _, _ = run(source, tmp_path, store_dir)
+    assert calculator.last_metrics.stages['index_store']['hit'] == 1
+    assert [name for name, _, _ in source.price_summary(dates[0], dates[-1])] == sorted(
+        f'{month}.csv' for month in months.unique()
+    )
+
+
+def test_reaggregate_from_latest(change_date, run, data, tmp_path):
+    categories, products, prices, dates = data
+    store_dir = tmp_path / 'store'
+    run(memory_source(*data), tmp_path, store_dir)
+
+    # 只保留一半的叶子分类，在 categories 中改权重直接计算作为对照
+    leaf = categories[categories['is_leaf'] == 3]
+    weights = dict(zip(leaf['category_id'], np.where(np.arange(len(leaf)) % 2, leaf['weight'], 0.0)))
+    reweighted = categories.assign(weight=categories['category_id'].map(weights).fillna(categories['weight']))
+    direct = change_date.CPICalculator(source=MemorySource(reweighted, products, prices), sink=CsvSink(tmp_path))
+    expected = direct.compute_daily_cpi(dates[0], dates[-1])
+    expected_daily = pd.read_csv(tmp_path / 'c_daily_cpi.csv', index_col=0).iloc[:, 0].to_numpy()
+
+    store = IndexStore(store_dir)
+    assert store.latest(dates[0], dates[1]) is None
+    index = store.latest(dates[0], dates[-1])
+    np.testing.assert_array_equal(index.daily_cpi(weights).to_numpy(), expected_daily)
+    np.testing.assert_array_equal(index.cumulative_cpi(weights).to_numpy(), expected.to_numpy())
+
+    levels = rebase(index.cumulative_cpi(), index.cumulative_cpi().index[5], 100)
+    assert levels.iloc[5] == pytest.approx(100)
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from quality import QualityRules
+from sinks import CsvSink
+from engine import INDEX_FORMULAS
+from sources import MemorySource
+
+FORMULAS = INDEX_FORMULAS[:-1]
+
+
+def reference_indices(categories, products, prices, all_dates):
+    """逐日逐分类计算各公式的指数水平（相对首日）"""
+    leaf_categories = categories[categories['is_leaf'] == 3][['category_id', 'weight']]
+    pivot = prices.pivot_table(index='product_id', columns='date', values='price', aggfunc='first')
+    pivot = pivot.reindex(columns=all_dates).ffill(axis=1)
+    panel = products.merge(leaf_categories, on='category_id').merge(pivot, left_on='product_id', right_index=True)
+    present = np.isin(all_dates, prices['date'].unique())
+
+    def daily_index(name, base_day, day):
+        values = []
+        for category_id, weight in leaf_categories.itertuples(index=False):
+            group = panel[panel['category_id'] == category_id]
+            base, current = group[base_day].to_numpy(), group[day].to_numpy()
+            valid = (base > 0) & (current >= 0)
+            if not valid.any():
+                continue
+            base, current = base[valid], current[valid]
+            if name == 'jevons':
+                index = np.exp(np.mean(np.log(current) - np.log(base)))
+            elif name == 'dutot':
+                index = current.sum() / base.sum()
+            else:
+                index = np.mean(current / base)
+            values.append(index * weight)
+        return round(sum(values), 4) if values else np.nan
+
+    result = {}
+    for formula in FORMULAS:
+        name, base = formula.split('_')
+        levels = []
+        level = 1.0
+        for k, day in enumerate(all_dates):
+            if base == 'fixed':
+                valid = present[0] and present[k]
+                levels.append(daily_index(name, all_dates[0], day) if valid else np.nan)
+                continue
+            if k == 0:
+                levels.append(1.0)
+                continue
+            daily = daily_index(name, all_dates[k - 1], day) if present[k - 1] and present[k] else np.nan
+            if np.isnan(daily):
+                levels.append(np.nan)
+            else:
+                level *= daily
+                levels.append(level)
+        result[formula] = levels
+    return pd.DataFrame(result, index=all_dates)
+
+
+@pytest.fixture(scope='module')
+def data(synthetic_data):
+    return synthetic_data(4, n_products=60)
+
+
+@pytest.fixture
+def make_calculator(change_date):
+    def make(data, tmp_path, **options):
+        categories, products, prices, _ = data
+        return change_date.CPICalculator(source=MemorySource(categories, products, prices), sink=CsvSink(tmp_path), **options)
+    return make
+
+
+def test_indices_match_reference(make_calculator, data, tmp_path):
+    categories, products, prices, dates = data
+    indices = make_calculator(data, tmp_path).compute_indices(dates[0], dates[-1])
+    expected = reference_indices(categories, products, prices, dates)
+    np.testing.assert_allclose(indices.to_numpy(), expected.to_numpy(), rtol=1e-10)
+    assert (tmp_path / 'c_index_formulas.csv').exists()
+
+
+def test_memory_budget_is_bit_identical(make_calculator, data, tmp_path):
+    dates = data[3]
+    dense = make_calculator(data, tmp_path).compute_indices(dates[0], dates[-1], INDEX_FORMULAS)
+    calculator = make_calculator(data, tmp_path, memory_budget=4096, spill_dir=tmp_path)
+    budgeted = calculator.compute_indices(dates[0], dates[-1], INDEX_FORMULAS)
+    pd.testing.assert_frame_equal(budgeted, dense)
+    assert calculator.last_metrics.stages['build_price_matrix']['bytes'] > 4096
+
+
+@pytest.mark.parametrize('options', [
+    {'sparse': True}, {'prefetch': 1}, {'workers': 2}, {'quality': QualityRules()}, {'index_store': 'store'},
+], ids=['sparse', 'prefetch', 'workers', 'quality', 'index_store'])
+def test_unsupported_options_raise(make_calculator, data, tmp_path, options):
+    if 'index_store' in options:
+        options = {'index_store': tmp_path / 'store'}
+    dates = data[3]
+    with pytest.raises(ValueError):
+        make_calculator(data, tmp_path, **options).compute_indices(dates[0], dates[-1])
+
+
+def test_unknown_formula_raises(make_calculator, data, tmp_path):
+    with pytest.raises(ValueError):
+        make_calculator(data, tmp_path).compute_indices(data[3][0], data[3][-1], ['fisher_fixed'])
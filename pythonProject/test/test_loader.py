@@ -0,0 +1,138 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from loader import (
+    CATEGORY_RATIO_QUERY, PRICE_QUERY, PRICE_SUMMARY_QUERY, load_price_summary, load_prices, query_prices
+)
+from sinks import CsvSink
+from sources import ClickHouseSource
+
+
+class FakeClient:
+    """记录查询的 ClickHouse 客户端，按 use_numpy 列式结果的类型返回价格"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def execute(self, query, params=None, columnar=False, settings=None):
+        self.calls.append((query, params, columnar, settings))
+        rows = [row for row in self.rows if params['start_date'] <= row[2] <= params['end_date']]
+        if not rows:
+            return []
+        product_ids, prices, dates = zip(*rows)
+        return [
+            np.array(product_ids, dtype=np.uint64),
+            np.array(prices, dtype=np.float32),
+            np.array(dates, dtype='datetime64[D]'),
+        ]
+
+
+def test_price_query_casts_decimal_price():
+    # clickhouse_driver 的 NumPy 列不支持 Decimal，price 必须在查询中转换为浮点数
+    select = PRICE_QUERY.split('FROM')[0]
+    assert 'toFloat32(price) AS price' in select
+    assert 'toDate(date) AS date' in select
+
+
+def test_query_prices_is_columnar_numpy():
+    client = FakeClient([(1, 10.5, date(2025, 1, 3)), (2, 3.25, date(2025, 1, 4))])
+    product_ids, prices, dates = query_prices(client, date(2025, 1, 1), date(2025, 1, 31))
+
+    query, params, columnar, settings = client.calls[0]
+    assert query == PRICE_QUERY
+    assert params == {'start_date': date(2025, 1, 1), 'end_date': date(2025, 1, 31)}
+    assert columnar and settings == {'use_numpy': True}
+    assert product_ids.dtype == np.int64
+    assert prices.dtype == np.float32
+    assert dates.dtype == np.dtype('datetime64[D]')
+    np.testing.assert_array_equal(prices, np.array([10.5, 3.25], dtype=np.float32))
+
+
+def test_load_prices_queries_by_month():
+    client = FakeClient([(1, 1.0, date(2025, 1, 31)), (1, 2.0, date(2025, 2, 1)), (2, 3.0, date(2025, 3, 10))])
+    product_ids, prices, dates = load_prices(client, date(2025, 1, 15), date(2025, 3, 5))
+
+    assert [(params['start_date'], params['end_date']) for _, params, _, _ in client.calls] == [
+        (date(2025, 1, 15), date(2025, 1, 31)),
+        (date(2025, 2, 1), date(2025, 2, 28)),
+        (date(2025, 3, 1), date(2025, 3, 5)),
+    ]
+    np.testing.assert_array_equal(product_ids, [1, 1])
+    assert prices.dtype == np.float32
+    np.testing.assert_array_equal(dates, np.array(['2025-01-31', '2025-02-01'], dtype='datetime64[D]'))
+
+
+def test_empty_result():
+    product_ids, prices, dates = query_prices(FakeClient([]), date(2025, 1, 1), date(2025, 1, 2))
+    assert len(product_ids) == len(prices) == len(dates) == 0
+    assert prices.dtype == np.float32
+
+
+def test_price_summary_returns_one_row_per_month():
+    calls = []
+
+    class SummaryClient:
+        def execute(self, query, params=None):
+            calls.append((query, params))
+            return [(date(2025, 1, 1), 10, date(2025, 1, 31), 2 ** 63 + 5), (date(2025, 2, 1), 3, date(2025, 2, 2), 7)]
+
+    summary = load_price_summary(SummaryClient(), date(2025, 1, 15), date(2025, 2, 2))
+    assert calls == [(PRICE_SUMMARY_QUERY, {'start_date': date(2025, 1, 15), 'end_date': date(2025, 2, 2)})]
+    assert 'GROUP BY month' in PRICE_SUMMARY_QUERY and 'toFloat32(price)' in PRICE_SUMMARY_QUERY
+    assert summary == [('2025-01-01', 10, '2025-01-31', 2 ** 63 + 5), ('2025-02-01', 3, '2025-02-02', 7)]
+
+
+class RatioClient:
+    """按 CATEGORY_RATIO_QUERY 的语义在 pandas 中汇总 分类×日期 价格变动事件的 ClickHouse 客户端"""
+
+    def __init__(self, categories, products, prices):
+        self.categories = categories
+        self.products = products
+        self.prices = prices
+        self.queries = []
+
+    def execute(self, query, params=None, columnar=False, settings=None):
+        self.queries.append(query)
+        if query != CATEGORY_RATIO_QUERY:
+            # 分类表、商品表查询按行返回
+            table = self.categories if 'FROM categories' in query else self.products
+            return list(table.itertuples(index=False, name=None))
+        prices = self.prices[self.prices['date'].between(params['start_date'], params['end_date'])]
+        prices = prices.assign(price=np.round(prices['price'].astype(np.float64), 2))
+        daily = prices.groupby(['product_id', 'date'], as_index=False)['price'].min()
+        daily['prev'] = daily.groupby('product_id')['price'].shift()
+        # LEFT JOIN 未匹配的商品分类为默认值 0
+        events = daily.merge(self.products, on='product_id', how='left').fillna({'category_id': 0})
+        counted = (events['prev'] > 0) & (events['price'] >= 0)
+        events['log_sum'] = np.where(counted, np.log(events['price']) - np.log(events['prev']), 0.0)
+        events['active_delta'] = (events['price'] > 0).astype(int) - (events['prev'] > 0).astype(int)
+        events['excluded'] = ((events['prev'] > 0) & (events['price'] < 0)).astype(int)
+        grouped = events.groupby(['category_id', 'date'], as_index=False)[['log_sum', 'active_delta', 'excluded']].sum()
+        return [grouped[column].to_numpy() for column in grouped.columns]
+
+
+def test_category_ratio_query_is_deterministic():
+    daily = CATEGORY_RATIO_QUERY.split('FROM prices')[0]
+    assert 'any(' not in CATEGORY_RATIO_QUERY
+    assert 'min(price)' in daily
+    assert PRICE_QUERY.rstrip().endswith('ORDER BY product_id, date, price')
+
+
+def test_server_side_matches_loop_on_ordered_prices(change_date, synthetic_data, reference_chained, tmp_path):
+    categories, products, prices, dates = synthetic_data(7, n_products=80)
+    client = RatioClient(categories.rename(columns={'is_leaf': 'hierarchy'}), products, prices)
+    calculator = change_date.CPICalculator(
+        source=ClickHouseSource(None, client=client), sink=CsvSink(tmp_path), server_side=True
+    )
+    cumulative = calculator.compute_daily_cpi(dates[0], dates[-1])
+    assert CATEGORY_RATIO_QUERY in client.queries
+
+    # PRICE_QUERY 按 (商品, 日期, 价格) 排序，同一商品同一日期的重复记录中第一条为价格最低的一条
+    ordered = prices.sort_values(['product_id', 'date', 'price'], kind='stable')
+    expected = reference_chained(categories, products, ordered, dates)
+    daily = pd.read_csv(tmp_path / 'c_daily_cpi.csv', index_col=0).iloc[:, 0]
+    np.testing.assert_allclose(daily.to_numpy(), expected.to_numpy(), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(cumulative.to_numpy(), expected.dropna().cumprod().to_numpy(), rtol=1e-12)
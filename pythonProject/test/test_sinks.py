@@ -0,0 +1,101 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from sinks import CPI_DAILY_DDL, ClickHouseSink, CsvSink, MultiSink, ParquetSink
+
+
+class FakeClient:
+    """在内存中保存 cpi_daily 表行的 ClickHouse 客户端"""
+
+    def __init__(self):
+        self.queries = []
+        self.rows = []
+
+    def execute(self, query, params=None, columnar=False):
+        self.queries.append((query, params, columnar))
+        if query.startswith('INSERT'):
+            assert columnar
+            self.rows.extend(zip(*params))
+            return None
+        if query.startswith('SELECT DISTINCT date'):
+            return sorted({(row[2],) for row in self.rows if row[0] == params['name']})
+        return None
+
+
+def daily_frame(start, periods):
+    index = pd.date_range(start, periods=periods, freq='D').date
+    return pd.DataFrame({'cpi': np.r_[np.nan, np.arange(1, periods) / 100 + 1]}, index=index)
+
+
+def test_clickhouse_sink_ddl():
+    client = FakeClient()
+    ClickHouseSink(client, table='cpi_test').create_table()
+    query = client.queries[0][0]
+    assert query == CPI_DAILY_DDL.format(table='cpi_test')
+    assert 'CREATE TABLE IF NOT EXISTS cpi_test' in query
+    assert 'ENGINE = ReplacingMergeTree' in query
+    assert 'ORDER BY (name, series, date)' in query
+
+
+def test_clickhouse_sink_batched_columnar_insert():
+    client = FakeClient()
+    frame = pd.DataFrame(
+        {'A': [1.0, np.nan, 1.5], 'B': [2.0, 2.5, np.nan]},
+        index=pd.date_range('2025-01-01', periods=3, freq='D').date
+    )
+    ClickHouseSink(client, batch_size=2).write('c_scenario_cpi', frame)
+
+    inserts = [(query, params) for query, params, _ in client.queries if query.startswith('INSERT')]
+    assert [query for query, _ in inserts] == ['INSERT INTO cpi_daily (name, series, date, value) VALUES'] * 2
+    # NaN 不写入，按列展开后分两批
+    assert [len(params[0]) for _, params in inserts] == [2, 2]
+    assert client.rows == [
+        ('c_scenario_cpi', 'A', date(2025, 1, 1), 1.0),
+        ('c_scenario_cpi', 'A', date(2025, 1, 3), 1.5),
+        ('c_scenario_cpi', 'B', date(2025, 1, 1), 2.0),
+        ('c_scenario_cpi', 'B', date(2025, 1, 2), 2.5),
+    ]
+
+
+def test_clickhouse_sink_append_skips_written_dates():
+    client = FakeClient()
+    sink = ClickHouseSink(client)
+    sink.write('c_daily_cpi', pd.Series([1.01, 1.02], index=[date(2025, 1, 1), date(2025, 1, 2)]))
+    sink.write('c_daily_cpi', pd.Series([9.0, 1.03], index=[date(2025, 1, 2), date(2025, 1, 3)]), append=True)
+    assert client.rows == [
+        ('c_daily_cpi', 'cpi', date(2025, 1, 1), 1.01),
+        ('c_daily_cpi', 'cpi', date(2025, 1, 2), 1.02),
+        ('c_daily_cpi', 'cpi', date(2025, 1, 3), 1.03),
+    ]
+
+
+def test_csv_sink_append_skips_written_dates(tmp_path):
+    sink = CsvSink(tmp_path)
+    sink.write('c_daily_cpi', daily_frame('2025-01-01', 3))
+    sink.write('c_daily_cpi', daily_frame('2025-01-02', 4), append=True)
+
+    written = pd.read_csv(tmp_path / 'c_daily_cpi.csv', index_col=0)
+    assert list(written.index) == ['2025-01-01', '2025-01-02', '2025-01-03', '2025-01-04', '2025-01-05']
+    # 已有日期保留第一次写出的值
+    assert written.loc['2025-01-03', 'cpi'] == 1.02
+    assert written.loc['2025-01-04', 'cpi'] == 1.02
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_csv_sink_matches_to_csv(tmp_path):
+    frame = daily_frame('2025-01-01', 3)
+    CsvSink(tmp_path).write('c_daily_cpi', frame)
+    frame.to_csv(tmp_path / 'expected.csv')
+    assert (tmp_path / 'c_daily_cpi.csv').read_text() == (tmp_path / 'expected.csv').read_text()
+
+
+def test_multi_sink_writes_every_sink(tmp_path):
+    client = FakeClient()
+    MultiSink(CsvSink(tmp_path), ParquetSink(tmp_path), ClickHouseSink(client)).write(
+        'c_daily_cpi', daily_frame('2025-01-01', 3)
+    )
+    assert (tmp_path / 'c_daily_cpi.csv').exists()
+    assert pd.read_parquet(tmp_path / 'c_daily_cpi.parquet').columns.tolist() == ['date', 'cpi']
+    assert len(client.rows) == 2
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import CategoryRollup
+from tree import CategoryTree
+
+
+def random_tree(seed, n_nodes, max_children=4):
+    """随机分类树：节点 ID 打乱，父节点总是先于子节点生成，另含一个父分类不存在的孤儿分类"""
+    rng = np.random.default_rng(seed)
+    ids = rng.permutation(np.arange(100, 100 + n_nodes))
+    parents = np.full(n_nodes, -1)
+    n_children = np.zeros(n_nodes, dtype=int)
+    for i in range(1, n_nodes):
+        candidates = np.flatnonzero(n_children[:i] < max_children)
+        parent = int(rng.choice(candidates))
+        parents[i] = ids[parent]
+        n_children[parent] += 1
+    # 孤儿分类：父分类不在分类表中
+    ids = np.r_[ids, 99]
+    parents = np.r_[parents, 12345]
+    weights = np.round(rng.uniform(0.1, 1, len(ids)), 2)
+    return ids, parents, weights
+
+
+def reference_children(ids, parents):
+    children = {int(i): [] for i in ids}
+    for node_id, parent_id in zip(ids, parents):
+        if int(parent_id) in children:
+            children[int(parent_id)].append(int(node_id))
+    return {node_id: sorted(values) for node_id, values in children.items()}
+
+
+def reference_subtree(children, node_id):
+    result = [node_id]
+    for child in children[node_id]:
+        result += reference_subtree(children, child)
+    return result
+
+
+def reference_rollup(children, weights, leaf_values, node_id):
+    """逐节点递归：父节点为有数据的子节点按权重的加权平均"""
+    if not children[node_id]:
+        return leaf_values.get(node_id, np.nan)
+    values = [(reference_rollup(children, weights, leaf_values, child), weights[child]) for child in children[node_id]]
+    values = [(value, weight) for value, weight in values if not np.isnan(value)]
+    if not values:
+        return np.nan
+    return sum(value * weight for value, weight in values) / sum(weight for _, weight in values)
+
+
+@pytest.mark.parametrize('seed, n_nodes, max_children', [(0, 40, 4), (1, 200, 3), (2, 60, 1)],
+                         ids=['small', 'wide', 'chain'])
+def test_tree_matches_recursive_reference(seed, n_nodes, max_children):
+    ids, parents, weights = random_tree(seed, n_nodes, max_children)
+    tree = CategoryTree(ids, parents, weights)
+    children = reference_children(ids, parents)
+
+    for node_id in ids:
+        node = tree.position([node_id])[0]
+        assert list(tree.node_ids[tree.children_of(node)]) == children[int(node_id)]
+        assert list(tree.node_ids[tree.subtree(node)]) == reference_subtree(children, int(node_id))
+        inside = tree.in_subtree(np.arange(len(tree)), node)
+        assert set(tree.node_ids[inside]) == set(reference_subtree(children, int(node_id)))
+    assert set(tree.leaf_ids) == {node_id for node_id, values in children.items() if not values}
+
+
+def test_deep_chain_depth_and_ancestors():
+    n = 300
+    tree = CategoryTree(np.arange(n), np.r_[-1, np.arange(n - 1)])
+    assert tree.max_depth == n - 1
+    assert list(tree.leaf_ids) == [n - 1]
+    np.testing.assert_array_equal(tree.ancestor_ids(np.arange(n), 0), np.zeros(n))
+    np.testing.assert_array_equal(tree.ancestor_ids([n - 1, 5], 10), [10, -1])
+    np.testing.assert_array_equal(tree.subtree(tree.position([n - 2])[0]), [n - 2, n - 1])
+
+
+def test_orphan_and_unknown_categories():
+    categories = pd.DataFrame({
+        'category_id': [1, 11, 12, 7],
+        'parent': [-1, 1, 1, 404],
+        'weight': [1.0, .5, .5, .2],
+    })
+    tree = CategoryTree.from_frame(categories)
+    orphan = tree.position([7])[0]
+    # 父分类不存在的分类作为独立的根节点，也是叶子
+    assert tree.parent[orphan] == -1 and tree.depth[orphan] == 0
+    assert list(tree.leaf_ids) == [7, 11, 12]
+    assert not tree.in_subtree([orphan], tree.position([1])[0])[0]
+    # 不在树中的分类（如商品挂在已删除的分类上）映射为 -1
+    np.testing.assert_array_equal(tree.position([999, 12]), [-1, 3])
+    np.testing.assert_array_equal(tree.ancestor_ids([12, 999, 7], 0), [1, -1, 7])
+
+
+def test_duplicate_ids_and_cycles_raise():
+    with pytest.raises(ValueError):
+        CategoryTree([1, 1], [-1, -1])
+    with pytest.raises(ValueError):
+        CategoryTree([1, 2, 3], [-1, 3, 2])
+
+
+@pytest.mark.parametrize('seed, n_nodes, max_children', [(3, 50, 4), (4, 150, 2), (5, 40, 1)],
+                         ids=['small', 'wide', 'chain'])
+def test_rollup_matches_recursive_reference(seed, n_nodes, max_children):
+    ids, parents, weights = random_tree(seed, n_nodes, max_children)
+    tree = CategoryTree(ids, parents, weights)
+    children = reference_children(ids, parents)
+    weight_of = dict(zip(ids.tolist(), weights))
+
+    rng = np.random.default_rng(seed)
+    leaf_index = rng.uniform(0.9, 1.1, (len(tree.leaf_ids), 6))
+    # 部分叶子分类在部分日期没有数据
+    leaf_index[rng.random(leaf_index.shape) < 0.3] = np.nan
+    index = CategoryRollup(tree).apply(leaf_index)
+
+    for day in range(leaf_index.shape[1]):
+        leaf_values = dict(zip(tree.leaf_ids.tolist(), leaf_index[:, day]))
+        expected = [reference_rollup(children, weight_of, leaf_values, int(node_id)) for node_id in tree.node_ids]
+        np.testing.assert_allclose(index[:, day], expected, rtol=1e-12)
+
+
+def test_rollup_subset_of_leaves():
+    tree = CategoryTree([1, 11, 12, 13, 7], [-1, 1, 1, 1, 404], [1.0, .2, .3, .5, 1.0])
+    index = CategoryRollup(tree, leaf_ids=[13, 11]).apply(np.array([[1.5], [1.0]]))
+    expected = {1: (1.5 * .5 + 1.0 * .2) / .7, 11: 1.0, 12: np.nan, 13: 1.5, 7: np.nan}
+    np.testing.assert_allclose(index[:, 0], [expected[node_id] for node_id in tree.node_ids])
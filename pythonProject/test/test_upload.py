@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from upload import LocalBucket, Uploader, collect_files
+
+
+class FlakyBucket(LocalBucket):
+    """记录上传的分片，第 fail_at 个及之后的分片上传时抛出异常，模拟中途断开"""
+
+    def __init__(self, root, fail_at=None):
+        super().__init__(root)
+        self.fail_at = fail_at
+        self.uploaded_parts = []
+        self.puts = 0
+
+    def put_file(self, key, path, md5):
+        self.puts += 1
+        super().put_file(key, path, md5)
+
+    def upload_part(self, key, upload_id, part_number, data):
+        if self.fail_at is not None and part_number >= self.fail_at:
+            raise ConnectionError('上传中断')
+        self.uploaded_parts.append(part_number)
+        return super().upload_part(key, upload_id, part_number, data)
+
+
+def make_uploader(bucket, tmp_path):
+    # workers=1 时分片按顺序上传，失败位置确定
+    return Uploader(bucket, tmp_path / '.upload_state.json', workers=1, part_size=10, multipart_threshold=64)
+
+
+def test_unchanged_file_is_skipped(tmp_path):
+    source = tmp_path / 'products.csv'
+    source.write_text('product_id,category_id\n1,2\n', encoding='utf-8')
+    bucket = FlakyBucket(tmp_path / 'bucket')
+    uploader = make_uploader(bucket, tmp_path)
+
+    assert uploader.upload_file('products.csv', source) == 'uploaded'
+    assert uploader.upload_file('products.csv', source) == 'skipped'
+    assert bucket.puts == 1
+
+    source.write_text('product_id,category_id\n1,3\n', encoding='utf-8')
+    assert uploader.upload_file('products.csv', source) == 'uploaded'
+    assert (tmp_path / 'bucket' / 'products.csv').read_bytes() == source.read_bytes()
+
+
+def test_multipart_upload_resumes_missing_parts(tmp_path):
+    source = tmp_path / 'price.csv'
+    data = bytes(range(95))
+    source.write_bytes(data)
+    state_file = tmp_path / '.upload_state.json'
+
+    bucket = FlakyBucket(tmp_path / 'bucket', fail_at=4)
+    with pytest.raises(ConnectionError):
+        make_uploader(bucket, tmp_path).upload_file('price/a.csv', source)
+    assert bucket.uploaded_parts == [1, 2, 3]
+    record = json.loads(state_file.read_text(encoding='utf-8'))['price/a.csv']
+    assert record['part_size'] == 10
+    assert not (tmp_path / 'bucket' / 'price' / 'a.csv').exists()
+
+    # 再次运行时沿用同一个 upload_id，只补传缺失的分片
+    bucket = FlakyBucket(tmp_path / 'bucket')
+    assert make_uploader(bucket, tmp_path).upload_file('price/a.csv', source) == 'uploaded'
+    assert bucket.uploaded_parts == [4, 5, 6, 7, 8, 9, 10]
+    assert (tmp_path / 'bucket' / 'price' / 'a.csv').read_bytes() == data
+    assert json.loads(state_file.read_text(encoding='utf-8')) == {}
+    assert make_uploader(bucket, tmp_path).upload_file('price/a.csv', source) == 'skipped'
+
+
+def test_changed_file_restarts_multipart_upload(tmp_path):
+    source = tmp_path / 'price.csv'
+    source.write_bytes(b'a' * 80)
+    bucket = FlakyBucket(tmp_path / 'bucket', fail_at=3)
+    with pytest.raises(ConnectionError):
+        make_uploader(bucket, tmp_path).upload_file('price/a.csv', source)
+
+    # 内容变化后已上传的分片不能复用
+    source.write_bytes(b'b' * 80)
+    bucket = FlakyBucket(tmp_path / 'bucket')
+    make_uploader(bucket, tmp_path).upload_file('price/a.csv', source)
+    assert bucket.uploaded_parts == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert (tmp_path / 'bucket' / 'price' / 'a.csv').read_bytes() == b'b' * 80
+
+
+def test_collect_files_keeps_partition_prefix(tmp_path):
+    (tmp_path / 'price').mkdir()
+    (tmp_path / 'price' / '2025-01.csv').write_text('', encoding='utf-8')
+    (tmp_path / 'price' / 'notes.txt').write_text('', encoding='utf-8')
+    files = collect_files(tmp_path, ['products.csv'], ['price', 'missing'])
+    assert sorted(files) == ['price/2025-01.csv', 'products.csv']